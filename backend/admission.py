@@ -0,0 +1,387 @@
+import math
+import time
+import uuid
+import logging
+import sqlite3
+import itertools
+import threading
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+wait_time = telemetry.histogram("pokegpt_admission_wait_seconds", "Time queries waited for a run slot, by outcome")
+rejections = telemetry.counter("pokegpt_admission_rejected_total", "Queries turned away by admission control, by reason")
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a query is not admitted. retry_after is a suggested wait in
+    seconds and status the HTTP status to answer with.
+    """
+    status = 503
+    reason = "rejected"
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QueueFull(AdmissionRejected):
+    status = 429
+    reason = "queue_full"
+
+class QueueTimeout(AdmissionRejected):
+    status = 503
+    reason = "timeout"
+
+class SQLiteLeaseBackend:
+    """
+    Leases on running queries, shared by the worker processes using the same
+    file: one row per running chat, so a chat runs one query at a time across
+    workers, and their count caps the queries running on all workers. A lease
+    expires after its ttl unless renewed, so a worker that dies doesn't keep
+    its chats locked.
+    """
+
+    ACQUIRED = "acquired"
+    CHAT_BUSY = "chat_busy"
+    FULL = "full"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_leases (
+                    chat_id TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, chat_id: str, token: str, ttl: float, max_total: int = 0) -> str:
+        """
+        Takes the lease on chat_id for token, unless the chat is leased or max_total
+        (0 for no limit) leases are held.
+
+        Returns:
+            ACQUIRED, CHAT_BUSY or FULL.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # One transaction: the expired leases are cleared and the count checked under the write lock
+            conn.execute("DELETE FROM query_leases WHERE expires_at < ?", (now,))
+            inserted = conn.execute("""
+                INSERT INTO query_leases (chat_id, token, expires_at)
+                SELECT ?, ?, ? WHERE ? <= 0 OR (SELECT COUNT(*) FROM query_leases) < ?
+                ON CONFLICT (chat_id) DO NOTHING
+            """, (chat_id, token, now + ttl, max_total, max_total)).rowcount
+            if inserted:
+                return self.ACQUIRED
+            busy = conn.execute("SELECT 1 FROM query_leases WHERE chat_id = ?", (chat_id,)).fetchone()
+            return self.CHAT_BUSY if busy else self.FULL
+
+    def renew(self, chat_id: str, token: str, ttl: float) -> bool:
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE query_leases SET expires_at = ? WHERE chat_id = ? AND token = ?",
+                (time.time() + ttl, chat_id, token)
+            ).rowcount > 0
+
+    def release(self, chat_id: str, token: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM query_leases WHERE chat_id = ? AND token = ?", (chat_id, token))
+
+    def count(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM query_leases WHERE expires_at >= ?", (time.time(),)
+        ).fetchone()[0]
+
+class _Waiter:
+    __slots__ = ("seq", "chat_id", "user_id", "event", "granted")
+
+    def __init__(self, seq, chat_id, user_id):
+        self.seq = seq
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.event = threading.Event()
+        self.granted = False
+
+class Slot:
+    """
+    Permission for one run. Release it when the run is over; releasing twice is harmless.
+    """
+
+    def __init__(self, controller, chat_id: str, user_id: str):
+        self.controller = controller
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.started = time.monotonic()
+        self.token = uuid.uuid4().hex
+        self.leased = False
+        self.renewed = self.started
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(self)
+
+    def renew(self):
+        """
+        Extends the slot's lease if a third of its ttl has passed; a no-op without leases.
+        """
+        if self.leased and not self._released:
+            self.controller._renew(self)
+
+    def hold(self, events):
+        """
+        Returns an iterator over events that keeps the slot until the events are
+        exhausted, fail or the iterator is closed.
+        """
+        return HeldEvents(self, events)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class HeldEvents:
+    """
+    Iterator over a run's events holding its slot. close() also releases the
+    slot of a run that was never started, which closing a generator doesn't.
+    """
+
+    def __init__(self, slot: Slot, events):
+        self.slot = slot
+        self.events = events
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            event = next(self.events)
+        except BaseException:
+            self.slot.release()
+            raise
+        self.slot.renew()
+        return event
+
+    def close(self):
+        try:
+            close = getattr(self.events, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.slot.release()
+
+    def __del__(self):
+        # Last resort for an iterator dropped without being closed
+        self.slot.release()
+
+class AdmissionController:
+    """
+    Decides when queries may run.
+
+    A chat runs one query at a time, a user runs at most max_per_user
+    queries at once and the process at most max_concurrent. Queries that
+    can't start right away wait in a bounded queue: at most max_queue in
+    total and max_queued_per_user per user, so one busy user can't fill it.
+    When a slot frees up, the waiting query whose user has the fewest
+    running queries goes first (the oldest one among equals), so light
+    users aren't stuck behind heavy ones. A query that waits longer than
+    queue_timeout seconds gives up.
+
+    These limits are per process. With leases (a SQLiteLeaseBackend shared by
+    the worker processes), an admitted query also takes its chat's lease
+    before it runs, so a chat runs one query at a time across workers and
+    at most max_total queries (0 for no limit) run on all of them. A query
+    whose chat is running on another worker, or that finds max_total
+    reached, keeps its slot and checks again every lease_poll_interval
+    seconds until queue_timeout. Leases are renewed while a run produces
+    events and expire lease_ttl seconds after the last renewal.
+
+    Retry-After estimates come from an average of recent run durations.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_per_user: int = 2, max_queue: int = 16,
+                 max_queued_per_user: int = 4, queue_timeout: float = 30.0, leases: SQLiteLeaseBackend = None,
+                 max_total: int = 0, lease_ttl: float = 120.0, lease_poll_interval: float = 0.25):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+        self.leases = leases
+        self.max_total = max_total
+        self.lease_ttl = lease_ttl
+        self.lease_poll_interval = lease_poll_interval
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._running = 0
+        self._running_by_user = {}  # user_id -> number of running queries
+        self._running_chats = set()
+        self._waiting = []  # _Waiter, oldest first
+        self._average_run = 5.0  # Seconds, moving average of run durations
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.lease_waits = 0
+
+    def _can_run(self, chat_id, user_id) -> bool:
+        return (self._running < self.max_concurrent
+                and self._running_by_user.get(user_id, 0) < self.max_per_user
+                and chat_id not in self._running_chats)
+
+    def _start(self, chat_id, user_id):
+        self._running += 1
+        self._running_by_user[user_id] = self._running_by_user.get(user_id, 0) + 1
+        self._running_chats.add(chat_id)
+        self.admitted += 1
+
+    def _retry_after(self) -> int:
+        # Time for the queue ahead to drain through the available slots
+        return max(1, math.ceil(self._average_run * (len(self._waiting) + 1) / self.max_concurrent))
+
+    def acquire(self, chat_id: str, user_id: str, timeout: float = None) -> Slot:
+        """
+        Waits until the query may run, at most timeout seconds (queue_timeout by default).
+
+        Raises:
+            QueueFull: If the queue, or the user's share of it, is full.
+            QueueTimeout: If the query waited too long.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+        slot = self._admit(chat_id, user_id, timeout, started)
+        if self.leases is not None:
+            try:
+                self._lease(slot, started, started + timeout)
+            except BaseException:
+                slot.release()
+                raise
+        wait_time.observe(time.monotonic() - started, outcome="admitted")
+        return slot
+
+    def _admit(self, chat_id, user_id, timeout, started) -> Slot:
+        # Waits for a slot of this process
+        with self._lock:
+            if self._can_run(chat_id, user_id):
+                self._start(chat_id, user_id)
+                return Slot(self, chat_id, user_id)
+            queued_by_user = sum(1 for waiter in self._waiting if waiter.user_id == user_id)
+            if len(self._waiting) >= self.max_queue or queued_by_user >= self.max_queued_per_user:
+                self.rejected += 1
+                rejections.inc(reason=QueueFull.reason)
+                raise QueueFull("Too many queries are waiting, try again later", self._retry_after())
+            waiter = _Waiter(next(self._seq), chat_id, user_id)
+            self._waiting.append(waiter)
+            self.queued += 1
+
+        waiter.event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                self._waiting.remove(waiter)
+                self.timed_out += 1
+                rejections.inc(reason=QueueTimeout.reason)
+                wait_time.observe(time.monotonic() - started, outcome="timeout")
+                raise QueueTimeout(f"Waited {timeout:g}s for a free slot, try again later", self._retry_after())
+        return Slot(self, chat_id, user_id)
+
+    def _lease(self, slot: Slot, started: float, deadline: float):
+        # Waits for the chat's lease, which another worker may hold, and for room under max_total
+        waited = False
+        while True:
+            outcome = self.leases.acquire(slot.chat_id, slot.token, self.lease_ttl, self.max_total)
+            if outcome == SQLiteLeaseBackend.ACQUIRED:
+                slot.leased = True
+                # The run starts now: waiting for the lease doesn't count towards the average run
+                slot.started = slot.renewed = time.monotonic()
+                return
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.lease_waits += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.timed_out += 1
+                    retry_after = self._retry_after()
+                rejections.inc(reason=QueueTimeout.reason)
+                wait_time.observe(time.monotonic() - started, outcome="timeout")
+                if outcome == SQLiteLeaseBackend.CHAT_BUSY:
+                    raise QueueTimeout("This chat is still answering another query, try again later", retry_after)
+                raise QueueTimeout("Too many queries are running, try again later", retry_after)
+            time.sleep(min(self.lease_poll_interval, remaining))
+
+    def _renew(self, slot: Slot):
+        now = time.monotonic()
+        if now - slot.renewed < self.lease_ttl / 3:
+            return
+        slot.renewed = now
+        try:
+            if not self.leases.renew(slot.chat_id, slot.token, self.lease_ttl):
+                logger.warning("Lease on chat %s expired while its query was running", slot.chat_id)
+        except Exception as e:
+            logger.warning("Could not renew the lease on chat %s: %s", slot.chat_id, e)
+
+    def _release(self, slot: Slot):
+        if slot.leased:
+            try:
+                self.leases.release(slot.chat_id, slot.token)
+            except Exception as e:
+                # It expires after lease_ttl anyway
+                logger.warning("Could not release the lease on chat %s: %s", slot.chat_id, e)
+        with self._lock:
+            self._running -= 1
+            count = self._running_by_user.get(slot.user_id, 0) - 1
+            if count > 0:
+                self._running_by_user[slot.user_id] = count
+            else:
+                self._running_by_user.pop(slot.user_id, None)
+            self._running_chats.discard(slot.chat_id)
+            self._average_run += 0.1 * (time.monotonic() - slot.started - self._average_run)
+            self._dispatch()
+
+    def _dispatch(self):
+        # Called with the lock held: starts waiting queries until none can run
+        while self._waiting:
+            eligible = [waiter for waiter in self._waiting if self._can_run(waiter.chat_id, waiter.user_id)]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (self._running_by_user.get(w.user_id, 0), w.seq))
+            self._waiting.remove(waiter)
+            self._start(waiter.chat_id, waiter.user_id)
+            waiter.granted = True
+            waiter.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "users_running": len(self._running_by_user),
+                "users_waiting": len({waiter.user_id for waiter in self._waiting}),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "lease_waits": self.lease_waits,
+                "average_run_seconds": round(self._average_run, 3),
+            }
@@ -0,0 +1,58 @@
+import threading
+
+class AgentPool:
+    """
+    A bounded pool of reusable agents.
+
+    Agents are created on demand by factory() and returned to the pool after
+    each run, so chats don't own an agent and one is only built once there
+    is a query to answer. At most max_idle agents are kept between runs;
+    under higher concurrency extra agents are created and dropped on release.
+
+    The pooled agents must not carry state from one run to the next: the
+    caller sets the per-chat instructions on acquire, and every run starts
+    with a reset memory.
+    """
+
+    def __init__(self, factory, max_idle: int = 8):
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            self.in_use += 1
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+            raise
+
+    def release(self, agent):
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(agent)
+            else:
+                self.discarded += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "max_idle": self.max_idle,
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+            }
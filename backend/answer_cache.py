@@ -0,0 +1,221 @@
+import re
+import logging
+import math
+import time
+import zlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Tools whose result depends on the user: answers that used them are only reused for the same user
+PERSONAL_TOOLS = {"get_user_favorites"}
+
+# Tools that change state: answers that used them are never cached
+MUTATING_TOOLS = {"add_to_favorites", "remove_from_favorites", "update_favorites_bulk"}
+
+# Queries about the user themselves are kept per user even if no personal tool was called
+_PERSONAL_QUERY = re.compile(r"\b(my|mine|me|i|i'm|im|favou?rites?)\b")
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a question for exact matching: case, accents, punctuation and
+    whitespace are ignored, so "What are Pikachu's abilities?" and
+    "what are pikachus abilities" share a key.
+    """
+    query = unicodedata.normalize('NFKD', str(query).lower())
+    query = ''.join(ch for ch in query if not unicodedata.combining(ch))
+    query = re.sub(r"['’]s\b", '', query)
+    query = re.sub(r"['’]", '', query)
+    query = re.sub(r'[^\w♀♂]+', ' ', query)
+    return query.strip()
+
+class HashingVectorizer:
+    """
+    Dependency-free vectorizer: hashed word and character trigram counts,
+    L2-normalized. Good enough to match rephrasings that share most words;
+    pass a real embedding model to AnswerCache for paraphrases.
+    """
+
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> list:
+        vector = [0.0] * self.dimensions
+        text = normalize_query(text)
+        features = text.split()
+        padded = f" {text} "
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            vector[zlib.crc32(feature.encode('utf-8')) % self.dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+def load_vectorizer(name: str):
+    """
+    Returns a vectorizer for name: None or "off" disables semantic matching,
+    "hashing" is the built-in HashingVectorizer, anything else is loaded as a
+    sentence-transformers model if that package is installed.
+    """
+    if not name or name == "off":
+        return None
+    if name == "hashing":
+        return HashingVectorizer()
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning("sentence-transformers is not installed, semantic answer cache (%s) disabled", name)
+        return None
+    model = SentenceTransformer(name)
+    return lambda text: model.encode(normalize_query(text), normalize_embeddings=True).tolist()
+
+def _cosine(a: list, b: list) -> float:
+    # Vectors are L2-normalized, so the dot product is the cosine similarity
+    return sum(x * y for x, y in zip(a, b))
+
+class AnswerCache:
+    """
+    Cache of final agent answers for repeated questions.
+
+    Keys are the query alone, so only answers to queries the model saw without
+    any conversation around them (a chat's first question) may be stored or
+    looked up; the caller makes sure of that.
+
+    Answers are looked up by the normalized query text and, if a vectorizer is
+    given, by cosine similarity of the query vectors above threshold. A
+    similar query only matches if entities(query) (e.g. the Pokémon it
+    names) is the same, so "Pikachu's abilities" never answers
+    "Charizard's abilities" however close the vectors are. Each
+    entry has a scope: None for answers that can be shared with everyone, or a
+    user ID for answers that used personal tools or talk about the user.
+    Answers from runs that called a mutating tool are never stored.
+
+    At most max_entries answers are kept, least recently used first out, and
+    every answer expires after ttl seconds.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000, vectorizer=None, threshold: float = 0.92,
+                 entities=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.vectorizer = vectorizer
+        self.threshold = threshold
+        self.entities = entities or (lambda query: frozenset())
+        self._entries = OrderedDict()  # (scope, normalized query) -> (expires_at, vector, entities, answer)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.invalidations = 0
+
+    def get(self, query: str, user_id: str = None) -> dict:
+        """
+        Returns the cached answer ({"response", "tool_calls"}) for query, or None.
+        Answers scoped to user_id are preferred over shared ones.
+        """
+        key = normalize_query(query)
+        scopes = (user_id, None) if user_id is not None else (None,)
+        now = time.time()
+        with self._lock:
+            for scope in scopes:
+                answer = self._get_live((scope, key), now)
+                if answer is not None:
+                    self.hits += 1
+                    return answer
+
+        if self.vectorizer is not None and key:
+            vector = self.vectorizer(key)
+            entities = self.entities(key)
+            # Only the candidates are collected under the lock; scoring them doesn't hold up other lookups
+            with self._lock:
+                candidates = [(entry_key, entry_vector)
+                              for entry_key, (expires_at, entry_vector, entry_entities, _) in self._entries.items()
+                              if entry_key[0] in scopes and expires_at > now and entry_vector is not None
+                              and entry_entities == entities]
+            best_key, best_score = None, self.threshold
+            for entry_key, entry_vector in candidates:
+                score = _cosine(vector, entry_vector)
+                if score >= best_score:
+                    best_key, best_score = entry_key, score
+            if best_key is not None:
+                with self._lock:
+                    # None if the entry was dropped while scoring
+                    answer = self._get_live(best_key, now)
+                    if answer is not None:
+                        self.semantic_hits += 1
+                        return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[3]
+
+    def put(self, query: str, user_id: str, response: str, tool_calls: list) -> bool:
+        """
+        Stores an answer, scoped by the tools it used.
+
+        Returns:
+            True if the answer was stored, False if it must not be cached.
+        """
+        tool_names = {tool_call["tool_name"] for tool_call in tool_calls}
+        key = normalize_query(query)
+        if not key or not response or tool_names & MUTATING_TOOLS:
+            with self._lock:
+                self.skipped += 1
+            return False
+
+        personal = bool(tool_names & PERSONAL_TOOLS) or bool(_PERSONAL_QUERY.search(key))
+        scope = user_id if personal else None
+        vector = self.vectorizer(key) if self.vectorizer is not None else None
+        entities = self.entities(key) if self.vectorizer is not None else None
+        answer = {"response": response, "tool_calls": tool_calls}
+        with self._lock:
+            self._entries[(scope, key)] = (time.time() + self.ttl, vector, entities, answer)
+            self._entries.move_to_end((scope, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stores += 1
+        return True
+
+    def invalidate_user(self, user_id: str):
+        """
+        Drops every answer scoped to user_id, e.g. after their favorites changed.
+        """
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "semantic": self.vectorizer is not None,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "skipped": self.skipped,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
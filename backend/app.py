@@ -3,44 +3,121 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 import os
-import traceback
+import time
+import logging
 import json
+import threading
 from poke_agent import PokemonAgent
+from admission import AdmissionRejected
 import favorites_service
-from flask import Flask, request, jsonify, make_response, render_template, session
+import pokeapi_client
+import telemetry
+import warmup
+from flask import Flask, Response, g, request, jsonify, make_response, render_template, session, stream_with_context
 from flask_cors import CORS
 import secrets
 
+# Application logs go to stderr; LOG_LEVEL=DEBUG also logs queries, responses and tool calls
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_secret_key(path: str) -> str:
+    """
+    Returns the key stored in path, creating the file with a random key if it doesn't exist.
+    Workers starting at the same time may all generate a key, but the file is only ever
+    linked into place complete and once, so they all end up reading the same one.
+    """
+    if not os.path.exists(path):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+    with open(path) as f:
+        return f.read().strip()
+
+# Sessions are signed with the secret key, so every worker process has to use the same one, across
+# restarts too: SECRET_KEY if set, otherwise a key generated once and kept in SECRET_KEY_FILE
+SECRET_KEY_FILE = os.environ.get('SECRET_KEY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.secret_key'))
+
 app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
 CORS(app, supports_credentials=True)  # Enable CORS for all routes with credentials
-app.secret_key = secrets.token_hex(4)
+app.secret_key = os.environ.get('SECRET_KEY') or load_secret_key(SECRET_KEY_FILE)
 
 try:
     pokemon_agent = PokemonAgent()
-    print("Successfully created PokemonAgent instance")
+    logger.info("Successfully created PokemonAgent instance")
 except Exception as e:
-    print(f"Error creating PokemonAgent: {e}")
-    traceback.print_exc()
+    logger.exception("Error creating PokemonAgent: %s", e)
     sys.exit(1)
 
+# Preload PokeAPI data, indexes and connections in the background; /api/ready reports when it is done
+warmup.start(pokemon_agent)
+
+http_requests = telemetry.counter("pokegpt_http_requests_total", "HTTP requests by method, route and status")
+
+@app.before_request
+def start_request_span():
+    # The span is named after the route pattern so its duration histogram has one series per endpoint
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_span = telemetry.start_span(f"{request.method} {route}", method=request.method, route=route)
+    g.request_span_token = telemetry.activate(g.request_span)
+
+@app.after_request
+def finish_request_span(response):
+    span = g.pop('request_span', None)
+    if span is None:
+        return response
+    span.set(status_code=response.status_code)
+    http_requests.inc(method=request.method, route=span.attributes["route"], status=response.status_code)
+    response.headers['X-Trace-Id'] = span.trace_id
+    # Streamed responses are still being sent at this point, so the span ends when the response is closed
+    response.call_on_close(span.finish)
+    return response
+
+@app.after_request
+def drain_request_body(response):
+    # gunicorn's threaded workers drop a keep-alive connection whose request body was left
+    # unread (like the {} posted to create_chat) once it has been open for the keep-alive time
+    if request.content_length and request.content_length <= 65536:
+        request.get_data()
+    return response
+
+@app.teardown_request
+def deactivate_request_span(error=None):
+    token = g.pop('request_span_token', None)
+    if token is not None:
+        telemetry.deactivate(token)
+
 @app.route('/api/')
 def index():
     return "Backend is running..."
 
+@app.route('/api/ready')
+def ready():
+    """Readiness check: 200 once warm-up has finished, 503 before"""
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
 def get_or_create_user_id():
     """Get user ID from cookie or create a new one"""
     user_id = request.cookies.get('user_id')
     if not user_id:
         user_id = str(secrets.token_hex(16))
-        print(f"Generated new user ID: {user_id}")
+        logger.debug("Generated new user ID: %s", user_id)
         # Initialize empty favorites for new user
-        favorites_service.favorites_db[user_id] = []
+        favorites_service.ensure_user(user_id)
     elif user_id not in favorites_service.favorites_db:
         # Initialize favorites for existing user with no favorites
-        print(f"Initializing favorites for existing user: {user_id}")
-        favorites_service.favorites_db[user_id] = []
-    else:
-        print(f"Using existing user: {user_id} with {len(favorites_service.favorites_db[user_id])} favorites")
+        logger.debug("Initializing favorites for existing user: %s", user_id)
+        favorites_service.ensure_user(user_id)
     return user_id
 
 @app.route('/api/create_chat', methods=['POST'])
@@ -52,7 +129,6 @@ def create_chat():
         
         # Create chat session with associated user_id
         chat_id = pokemon_agent.create_chat(user_id=user_id)
-        print(f"Created chat session: {chat_id} for user: {user_id}")
         
         # Create response with chat ID
         response = jsonify({'chat_id': chat_id, 'user_id': user_id})
@@ -63,8 +139,7 @@ def create_chat():
         
         return response
     except Exception as e:
-        print(f"Error creating chat: {e}")
-        traceback.print_exc()
+        logger.exception("Error creating chat: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/query', methods=['POST'])
@@ -86,14 +161,71 @@ def query():
     user_context = {'current_user_id': user_id}
     
     # The run method now returns a dictionary
-    result = pokemon_agent.run(chat_id, user_query, user_context)
+    try:
+        result = pokemon_agent.run(chat_id, user_query, user_context)
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     
     # The response now includes the text and tool calls
     return jsonify({
         "response": result.get("response"),
-        "tool_calls": result.get("tool_calls", [])
+        "tool_calls": result.get("tool_calls", []),
+        "cached": result.get("cached", False),
+        "fast_path": result.get("fast_path", False),
+        "usage": result.get("usage")
     })
 
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """Send a query to a specific chat session and stream the agent's progress as Server-Sent Events"""
+    data = request.json
+    user_query = data.get('query', '')
+    chat_id = data.get('chat_id', '')
+    user_id = data.get('user_id') or request.cookies.get('user_id')
+    
+    if not user_query:
+        return jsonify({'error': 'No query provided'}), 400
+    
+    if not chat_id:
+        chat_id = pokemon_agent.create_chat(user_id=user_id)
+        session['chat_id'] = chat_id
+
+    user_context = {'current_user_id': user_id}
+    
+    try:
+        events = pokemon_agent.run_stream(chat_id, user_query, user_context)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+
+    def generate():
+        # Tell the client which chat this stream belongs to before the agent starts
+        yield format_sse('chat', {'chat_id': chat_id})
+        for event in events:
+            yield format_sse(event['event'], event['data'])
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Frees the query's run slot even if the client disconnects before the stream starts
+    response.call_on_close(events.close)
+    return response
+
+def admission_rejected_response(error: AdmissionRejected):
+    """429 (queue full) or 503 (waited too long) with a Retry-After header"""
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def format_sse(event: str, data, event_id: str = None) -> str:
+    """Format a Server-Sent Event with a JSON payload"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 @app.route('/api/chat_history/<chat_id>', methods=['GET'])
 def chat_history(chat_id):
     """Get the chat history for a specific chat session"""
@@ -117,8 +249,7 @@ def chat_history(chat_id):
             'is_owner': is_owner
         })
     except Exception as e:
-        print(f"Error getting chat history: {e}")
-        traceback.print_exc()
+        logger.exception("Error getting chat history: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/add_favorite', methods=['POST'])
@@ -133,22 +264,147 @@ def add_favorite():
 
     try:
         result = favorites_service.add_favorite(pokemon_name=pokemon_name, user_id=user_id)
-        # Save to file
-        save_favorites()
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@app.route('/api/favorites/bulk_add', methods=['POST'])
+def bulk_add_favorites():
+    """Add many Pokémon (names and/or IDs) to the user's favorites in one request"""
+    data = request.json or {}
+    pokemon = data.get('pokemon')
+
+    if not isinstance(pokemon, list) or not pokemon:
+        return jsonify({"error": "A non-empty 'pokemon' list is required"}), 400
+
+    # Get user ID from cookie; a user_id in the body is ignored so clients can only change their own favorites
+    user_id = get_or_create_user_id()
+
+    try:
+        result = favorites_service.add_favorites_bulk(pokemon=pokemon, user_id=user_id)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@app.route('/api/favorites/bulk_remove', methods=['POST'])
+def bulk_remove_favorites():
+    """Remove many Pokémon (names and/or IDs) from the user's favorites in one request"""
+    data = request.json or {}
+    pokemon = data.get('pokemon')
+
+    if not isinstance(pokemon, list) or not pokemon:
+        return jsonify({"error": "A non-empty 'pokemon' list is required"}), 400
+
+    # Get user ID from cookie
+    user_id = get_or_create_user_id()
+
+    try:
+        result = favorites_service.remove_favorites_bulk(pokemon=pokemon, user_id=user_id)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+def favorites_response(user_id: str, load):
+    """
+    Respond with the JSON returned by load(), tagged with the version of the user's favorites,
+    or with 304 Not Modified if the client sent that version in If-None-Match.
+    """
+    # The version is read first, so the data is never older than its ETag
+    etag = favorites_service.favorites_version(user_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(load())
+    response.set_etag(etag)
+    # Browsers may keep the response but have to revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
     """API endpoint to get the favorites for the current user."""
     user_id = request.cookies.get('user_id') 
-    print(f"Getting favorites for user {user_id}")
     if not user_id:
         return jsonify({"user_id": None, "favorites": []})  # Return empty list if no user session
         
-    favorites_data = favorites_service.get_favorites(user_id)
-    return jsonify(favorites_data)
+    return favorites_response(user_id, lambda: favorites_service.get_favorites(user_id))
+
+# Change feed settings: a comment is sent after FAVORITES_EVENTS_HEARTBEAT idle seconds to keep
+# proxies from closing the stream, and streams end after FAVORITES_EVENTS_MAX_AGE seconds (the
+# browser reconnects on its own) so a worker thread is never held forever.
+FAVORITES_EVENTS_HEARTBEAT = float(os.environ.get('FAVORITES_EVENTS_HEARTBEAT', '25'))
+FAVORITES_EVENTS_MAX_AGE = float(os.environ.get('FAVORITES_EVENTS_MAX_AGE', '300'))
+# Every open feed holds a server thread, so at most FAVORITES_EVENTS_MAX_STREAMS are open per
+# process; beyond that feeds are answered with 503 and retried FAVORITES_EVENTS_RETRY seconds later.
+FAVORITES_EVENTS_MAX_STREAMS = int(os.environ.get('FAVORITES_EVENTS_MAX_STREAMS', '8'))
+FAVORITES_EVENTS_RETRY = int(os.environ.get('FAVORITES_EVENTS_RETRY', '30'))
+
+favorites_event_streams = threading.BoundedSemaphore(FAVORITES_EVENTS_MAX_STREAMS)
+favorites_events_rejected = telemetry.counter(
+    "pokegpt_favorites_events_rejected_total", "Favorites change feeds turned away because too many were open"
+)
+
+@app.route('/api/favorites/events', methods=['GET'])
+def favorites_events():
+    """
+    Server-Sent Events stream of changes to the current user's favorites.
+    A "favorites" event with {"version", "favorites_count"} is sent when the stream opens (unless
+    Last-Event-ID already has the current version) and after every change.
+    Answers 503 with Retry-After when FAVORITES_EVENTS_MAX_STREAMS feeds are open already.
+    """
+    user_id = request.cookies.get('user_id')
+    if not user_id:
+        # 204 tells EventSource not to reconnect
+        return Response(status=204)
+
+    if not favorites_event_streams.acquire(blocking=False):
+        favorites_events_rejected.inc()
+        return Response(
+            f"retry: {FAVORITES_EVENTS_RETRY * 1000}\n\n",
+            status=503,
+            mimetype='text/event-stream',
+            headers={'Retry-After': str(FAVORITES_EVENTS_RETRY), 'Cache-Control': 'no-cache'}
+        )
+
+    def favorites_event(version):
+        return format_sse('favorites', {
+            'version': version,
+            'favorites_count': favorites_service.favorites_db.count(user_id)
+        }, event_id=version)
+
+    def generate():
+        deadline = time.monotonic() + FAVORITES_EVENTS_MAX_AGE
+        version = favorites_service.favorites_version(user_id)
+        yield "retry: 3000\n\n"
+        if request.headers.get('Last-Event-ID') != version:
+            yield favorites_event(version)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            current = favorites_service.wait_for_favorites_change(
+                user_id, version, min(FAVORITES_EVENTS_HEARTBEAT, remaining)
+            )
+            if current == version:
+                yield ": heartbeat\n\n"
+            else:
+                version = current
+                yield favorites_event(version)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Frees the feed's place when the stream ends, even if the client left before it started
+    response.call_on_close(favorites_event_streams.release)
+    return response
 
 @app.route('/api/remove_favorite', methods=['POST'])
 def remove_favorite():
@@ -162,38 +418,99 @@ def remove_favorite():
     # Get user ID from cookie
     user_id = get_or_create_user_id()
     
-    # Remove from favorites if exists
-    if user_id in favorites_service.favorites_db:
-        before_count = len(favorites_service.favorites_db[user_id])
-        favorites_service.favorites_db[user_id] = [p for p in favorites_service.favorites_db[user_id] if p.get('id') != pokemon_id]
-        after_count = len(favorites_service.favorites_db[user_id])
-        
-        if before_count > after_count:
-            print(f"Removed pokemon ID {pokemon_id} from user {user_id}'s favorites")
-        else:
-            print(f"Pokemon ID {pokemon_id} not found in user {user_id}'s favorites")
-        
-    # Save to file
-    favorites_service.save_favorites()
+    # Remove from favorites if exists; only this user's favorites are saved
+    result = favorites_service.remove_favorite_by_id(pokemon_id=pokemon_id, user_id=user_id)
     
     return jsonify({
         'success': True, 
         'message': 'Removed from favorites',
         'user_id': user_id,
-        'favorites_count': len(favorites_service.favorites_db.get(user_id, []))
+        'favorites_count': result['favorites_count']
     })
 
+# Page size limits for tool call listings
+DEFAULT_TOOL_CALLS_PAGE = 50
+MAX_TOOL_CALLS_PAGE = 200
+
 @app.route('/api/chats/<chat_id>/tool_calls', methods=['GET'])
 def get_chat_tool_calls(chat_id):
-    """API endpoint to get all tool calls for a specific chat session."""
+    """
+    API endpoint to get a page of the tool calls of a chat session.
+    Outputs are referenced by hash; fetch them from /api/chats/<chat_id>/tool_results/<hash>.
+    """
+    user_id = get_or_create_user_id()
+    try:
+        chat_owner = pokemon_agent.get_chat_owner(chat_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if user_id != chat_owner:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_TOOL_CALLS_PAGE, type=int), 1), MAX_TOOL_CALLS_PAGE)
+    return jsonify({
+        "tool_calls": pokemon_agent.get_tool_calls(chat_id, offset=offset, limit=limit),
+        "total": pokemon_agent.count_tool_calls(chat_id),
+        "offset": offset,
+        "limit": limit
+    })
+
+@app.route('/api/chats/<chat_id>/tool_results/<output_hash>', methods=['GET'])
+def get_chat_tool_result(chat_id, output_hash):
+    """API endpoint to get the full output of a tool call made in a chat session."""
     user_id = get_or_create_user_id()
-    chat_owner = pokemon_agent.get_chat_owner(chat_id)
+    try:
+        chat_owner = pokemon_agent.get_chat_owner(chat_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
 
     if user_id != chat_owner:
         return jsonify({"error": "Unauthorized"}), 403
 
-    tool_calls = pokemon_agent.get_tool_calls(chat_id)
-    return jsonify(tool_calls)
+    output = pokemon_agent.get_tool_result(chat_id, output_hash)
+    if output is None:
+        return jsonify({"error": "Tool result not found"}), 404
+    return jsonify({"output_hash": output_hash, "output": output})
+
+# Longest period /api/usage reports on
+MAX_USAGE_DAYS = 90
+
+@app.route('/api/chats/<chat_id>/usage', methods=['GET'])
+def get_chat_usage(chat_id):
+    """API endpoint to get the token usage and cost of a chat session and its remaining budget."""
+    user_id = get_or_create_user_id()
+    try:
+        chat_owner = pokemon_agent.get_chat_owner(chat_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if user_id != chat_owner:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    return jsonify(pokemon_agent.get_chat_usage(chat_id))
+
+@app.route('/api/usage', methods=['GET'])
+def get_user_usage():
+    """
+    API endpoint to get the current user's token usage and cost: today's, and over the
+    last ?days=N UTC days (at most MAX_USAGE_DAYS) with a breakdown per day.
+    """
+    user_id = request.cookies.get('user_id')
+    if not user_id:
+        return jsonify({"error": "No user"}), 401
+    days = min(max(request.args.get('days', 1, type=int), 1), MAX_USAGE_DAYS)
+    return jsonify({
+        "user_id": user_id,
+        "today": pokemon_agent.get_user_usage(user_id),
+        "period": dict(pokemon_agent.get_user_usage(user_id, days), days=days),
+        "daily_budget": pokemon_agent.usage.user_daily_budget or None
+    })
+
+@app.route('/api/tool_result_stats', methods=['GET'])
+def tool_result_stats():
+    """Get tool result store size and deduplication counters"""
+    return jsonify(pokemon_agent.tool_results.stats())
 
 @app.route('/api/remove_favorite_by_name', methods=['POST'])
 def remove_favorite_by_name():
@@ -223,10 +540,57 @@ def get_user_favorites(user_id):
         return jsonify({"error": "Unauthorized to view another user's favorites"}), 403
     
     # Get favorites for the user
-    result = favorites_service.get_user_favorites(user_id=user_id)
-    
-    return jsonify(result)
+    return favorites_response(user_id, lambda: favorites_service.get_user_favorites(user_id=user_id))
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    """Get hit/miss counters for the PokeAPI response cache"""
+    return jsonify(pokeapi_client.cache_stats())
+
+@app.route('/api/http_stats', methods=['GET'])
+def http_stats():
+    """Get connection pool and circuit breaker counters for PokeAPI calls"""
+    return jsonify(pokeapi_client.http_stats())
+
+@app.route('/api/session_stats', methods=['GET'])
+def session_stats():
+    """Get in-memory chat session counters"""
+    return jsonify(pokemon_agent.chats.stats())
+
+@app.route('/api/answer_cache_stats', methods=['GET'])
+def answer_cache_stats():
+    """Get answer cache hit rate and size"""
+    if pokemon_agent.answers is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(pokemon_agent.answers.stats(), enabled=True))
+
+@app.route('/api/admission_stats', methods=['GET'])
+def admission_stats():
+    """Get running and waiting query counts of the admission control"""
+    return jsonify(pokemon_agent.admission.stats())
+
+@app.route('/api/agent_pool_stats', methods=['GET'])
+def agent_pool_stats():
+    """Get agent pool counters"""
+    return jsonify(pokemon_agent.agents.stats())
+
+# The stats endpoints above, also exposed as gauges on /api/metrics
+telemetry.register_gauges("pokegpt_pokeapi_cache", pokeapi_client.cache_stats)
+telemetry.register_gauges("pokegpt_pokeapi_http", pokeapi_client.http_stats)
+telemetry.register_gauges("pokegpt_chat_sessions", pokemon_agent.chats.stats)
+telemetry.register_gauges("pokegpt_agent_pool", pokemon_agent.agents.stats)
+telemetry.register_gauges("pokegpt_admission", pokemon_agent.admission.stats)
+telemetry.register_gauges("pokegpt_usage", pokemon_agent.usage.stats)
+telemetry.register_gauges("pokegpt_tool_results", pokemon_agent.tool_results.stats)
+if pokemon_agent.answers is not None:
+    telemetry.register_gauges("pokegpt_answer_cache", pokemon_agent.answers.stats)
+telemetry.register_gauges("pokegpt_favorites", favorites_service.favorites_db.stats)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: request and span durations, token counts, tool output sizes and the stats counters"""
+    return Response(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    print("Starting Flask server")
+    logger.info("Starting Flask server")
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,106 @@
+"""
+ASGI entry point for serving the backend with an asyncio server:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Connections are handled on the event loop and each request's Flask view, and
+the body of its response, runs on a thread of a pool of ASGI_THREADS threads
+(default 64), so slow agent runs and streamed responses only hold up their
+own thread. A streamed response is closed when the client disconnects, which
+frees a query's admission slot and ends a favorites change feed. Requests
+beyond the pool size wait for a thread.
+
+asgiref's WsgiToAsgi is not used as is: it runs every request on one shared
+thread (sync_to_async's thread_sensitive mode) and never closes responses.
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.wsgi import WsgiToAsgiInstance
+from app import app
+
+# Threads running Flask views; every open SSE stream holds one
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', '64'))
+
+class ThreadPoolWsgiToAsgi:
+    """
+    Wraps a WSGI application as an ASGI one, running requests on a thread pool.
+    """
+
+    def __init__(self, wsgi_application, max_threads: int):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+class _ThreadPoolInstance(WsgiToAsgiInstance):
+    """
+    One request: the body is read and the environ built by WsgiToAsgiInstance,
+    then the application runs on the executor and sends through the event loop.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+        self.disconnected = threading.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.receive = receive
+        self.send = send
+        await super().__call__(scope, receive, send)
+
+    async def run_wsgi_app(self, body):
+        loop = asyncio.get_running_loop()
+        # Replaces the AsyncToSync sender, which expects to be called from asgiref's own threads
+        self.sync_send = lambda message: asyncio.run_coroutine_threadsafe(self.send(message), loop).result()
+        watcher = asyncio.ensure_future(self._watch_disconnect())
+        try:
+            await loop.run_in_executor(self.executor, self._run, body)
+        finally:
+            watcher.cancel()
+
+    async def _watch_disconnect(self):
+        # The body has been read, so the next message is the disconnect
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                self.disconnected.set()
+                return
+
+    def _run(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            self.sync_send({"type": "http.response.start", "status": 400, "headers": [(b"content-type", b"text/plain")]})
+            self.sync_send({"type": "http.response.body", "body": b"Bad Request: Too many duplicate headers"})
+            return
+
+        response = self.wsgi_application(environ, self.start_response)
+        try:
+            bytes_sent = 0
+            for output in response:
+                if self.disconnected.is_set():
+                    # Nobody is listening: stop iterating, close() below ends the response
+                    return
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({"type": "http.response.body"})
+        finally:
+            # WSGI servers must call close(): Flask runs its call_on_close callbacks there
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
+application = ThreadPoolWsgiToAsgi(app, ASGI_THREADS)
@@ -0,0 +1,63 @@
+"""
+Chat creation latency and per-chat memory.
+
+Creates chats through PokemonAgent.create_chat and reports the latency
+percentiles and the memory retained per chat (traced with tracemalloc).
+--eager also builds and keeps one ToolCallingAgent per chat, which is what
+create_chat used to do, so both numbers can be compared on one machine.
+
+No model calls are made; the chat sessions go to a temporary database.
+
+    python bench/chat_creation.py --chats 500
+    python bench/chat_creation.py --chats 500 --eager
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat creation latency and memory per chat.")
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--eager", action="store_true", help="Also build one agent per chat (the old behavior)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    os.environ["CHAT_SESSIONS_DB_PATH"] = os.path.join(data_dir, "chat_sessions.db")
+    os.environ["CHAT_SESSIONS_MAX_IN_MEMORY"] = str(args.chats)
+    os.environ.setdefault("FAVORITES_DB_PATH", os.path.join(data_dir, "favorites.db"))
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+    from poke_agent import PokemonAgent
+    pokemon_agent = PokemonAgent()
+    pokemon_agent.create_chat(user_id="warmup")
+
+    eager_agents = []
+    latencies = []
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for index in range(args.chats):
+        started = time.perf_counter()
+        pokemon_agent.create_chat(user_id=f"user-{index}")
+        if args.eager:
+            eager_agents.append(pokemon_agent._build_agent())
+        latencies.append(time.perf_counter() - started)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mode = "eager (agent per chat)" if args.eager else "lazy (pooled agents)"
+    print(f"{args.chats} chats, {mode}")
+    print(f"create_chat latency: p50={percentile(latencies, 0.5) * 1000:.2f}ms "
+          f"p95={percentile(latencies, 0.95) * 1000:.2f}ms p99={percentile(latencies, 0.99) * 1000:.2f}ms")
+    print(f"memory retained per chat: {(retained - baseline) / args.chats / 1024:.1f} KiB")
+
+if __name__ == "__main__":
+    main()
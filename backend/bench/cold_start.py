@@ -0,0 +1,87 @@
+"""
+Cold start benchmark.
+
+Starts fresh Python processes that import app.py and serve one request to
+/api/ through Flask's test client, like the first request after a
+container starts. Reports the median time to import the app and to answer
+that first request, plus the peak RSS of the process.
+--profile prints the slowest imports (python -X importtime) of one run.
+
+Warm-up is disabled and all databases go to a temporary directory.
+
+    python bench/cold_start.py --runs 5
+    python bench/cold_start.py --profile
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/api/')
+served = time.perf_counter()
+import json, resource
+print(json.dumps({
+    "import": imported - started,
+    "first_request": served - started,
+    "status": response.status_code,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+def child_env(data_dir):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "unused")
+    env["WARMUP_ENABLED"] = "false"
+    env["FAVORITES_DB_PATH"] = os.path.join(data_dir, "favorites.db")
+    env["CHAT_SESSIONS_DB_PATH"] = os.path.join(data_dir, "chat_sessions.db")
+    env["TOOL_RESULTS_DB_PATH"] = os.path.join(data_dir, "tool_results.db")
+    return env
+
+def profile(env, top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold start time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", action="store_true", help="Print the slowest imports instead")
+    parser.add_argument("--top", type=int, default=25, help="Number of imports to print with --profile")
+    args = parser.parse_args()
+
+    env = child_env(tempfile.mkdtemp())
+    if args.profile:
+        profile(env, args.top)
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.runs} cold starts")
+    print(f"import app:        median {statistics.median(r['import'] for r in runs) * 1000:.0f}ms")
+    print(f"first /api/ reply: median {statistics.median(r['first_request'] for r in runs) * 1000:.0f}ms")
+    print(f"peak RSS:          median {statistics.median(r['max_rss_kb'] for r in runs) / 1024:.0f} MiB")
+
+if __name__ == "__main__":
+    main()
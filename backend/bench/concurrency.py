@@ -0,0 +1,92 @@
+"""
+Concurrent chat capacity benchmark.
+
+Runs simulated users against a running backend: each user creates a chat and
+sends queries through /api/query, with increasing numbers of users running at
+the same time. Compare servers by running it against each of them, e.g.:
+
+    python app.py                                       # Flask development server
+    uvicorn asgi:application --port 5001                # ASGI server
+
+    python bench/concurrency.py --url http://localhost:5000/api
+    python bench/concurrency.py --url http://localhost:5001/api
+"""
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+DEFAULT_QUERIES = [
+    "What type is Pikachu?",
+    "Compare the stats of Charmander, Squirtle and Bulbasaur",
+    "What does the ability Static do?",
+]
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def simulate_user(base_url, queries, timeout):
+    """Creates a chat and sends every query once. Returns (latencies, errors)."""
+    session = requests.Session()
+    latencies = []
+    errors = 0
+
+    try:
+        response = session.post(f"{base_url}/create_chat", json={}, timeout=timeout)
+        response.raise_for_status()
+        chat = response.json()
+    except requests.RequestException:
+        return latencies, len(queries)
+
+    for query in queries:
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f"{base_url}/query",
+                json={"query": query, "chat_id": chat["chat_id"], "user_id": chat["user_id"]},
+                timeout=timeout
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        except requests.RequestException:
+            errors += 1
+    return latencies, errors
+
+def run_level(base_url, users, queries, timeout):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        results = list(executor.map(lambda _: simulate_user(base_url, queries, timeout), range(users)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for user_latencies, _ in results for latency in user_latencies]
+    errors = sum(user_errors for _, user_errors in results)
+    return {
+        "users": users,
+        "queries": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure concurrent chat capacity of a running backend.")
+    parser.add_argument("--url", default="http://localhost:5000/api", help="Base URL of the backend API")
+    parser.add_argument("--users", default="1,4,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'queries':>8} {'errors':>7} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'mean s':>8}")
+    for users in (int(level) for level in args.users.split(',')):
+        result = run_level(args.url, users, DEFAULT_QUERIES, args.timeout)
+        print(f"{result['users']:>6} {result['queries']:>8} {result['errors']:>7} {result['throughput']:>8.2f} "
+              f"{result['p50']:>8.2f} {result['p95']:>8.2f} {result['mean']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
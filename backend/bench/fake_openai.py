@@ -0,0 +1,225 @@
+"""
+Scripted stand-in for the OpenAI chat completions API, for offline benchmarks.
+
+Answers /v1/chat/completions (streamed or not) with deterministic tool calls,
+so the agent goes through the same steps as with the real model:
+
+1. If the query names a Pokémon and mentions favorites: add_to_favorites.
+2. If it names a Pokémon: get_pokemon_details for it.
+3. If it asks about abilities: get_ability_list.
+4. Once a tool has answered (or if none of the above applies): final_answer.
+
+--latency delays the first token of every response and --chunk-delay each
+further streamed chunk. Usage is reported at roughly four characters per token.
+
+Point the backend at it with OPENAI_BASE_URL:
+
+    python bench/fake_openai.py --port 8002 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8002/v1 OPENAI_API_KEY=fake python app.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_pokeapi import POKEMON_NAMES
+
+# Longest names first, so "nidoran-f" is not found as "nidoran"
+_POKEMON_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(name).replace(r"\-", r"[-. ]*") for name in sorted(POKEMON_NAMES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+_USER_ID_PATTERN = re.compile(r"user's ID is (\S+?)\.?\s*$", re.MULTILINE)
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+def plan(messages: list, tool_names: set) -> tuple:
+    """
+    Picks the next tool call for a conversation.
+
+    Returns:
+        (tool name, arguments dict)
+    """
+    texts = [(message.get("role"), _text(message.get("content"))) for message in messages]
+    if any(role == "assistant" for role, _ in texts):
+        observation = texts[-1][1].strip().replace("\n", " ")
+        return "final_answer", {"answer": f"Here is what I found: {observation[:300]}"}
+
+    task = next((text for role, text in texts if role == "user"), "")
+    query = task.rsplit("User Query:", 1)[-1]
+    system = "\n".join(text for role, text in texts if role == "system")
+    found = _POKEMON_PATTERN.search(query)
+    pokemon = None
+    if found:
+        letters = re.sub(r"[^a-z]", "", found.group(1).lower())
+        pokemon = next(name for name in POKEMON_NAMES if re.sub(r"[^a-z]", "", name) == letters)
+
+    if pokemon and re.search(r"favou?rite", query, re.IGNORECASE) and "add_to_favorites" in tool_names:
+        user_id = _USER_ID_PATTERN.search(system)
+        return "add_to_favorites", {"pokemon": pokemon, "user_id": user_id.group(1) if user_id else "unknown"}
+    if pokemon and "get_pokemon_details" in tool_names:
+        return "get_pokemon_details", {"id": POKEMON_NAMES.index(pokemon) + 1}
+    if re.search(r"abilit", query, re.IGNORECASE) and "get_ability_list" in tool_names:
+        return "get_ability_list", {}
+    return "final_answer", {"answer": "I can only help with questions about Pokémon."}
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    HTTP server for the scripted model. Counts requests and tokens.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, chunk_delay: float = 0.0, model_id: str = "fake-model"):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.model_id = model_id
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def complete(self, request: dict) -> dict:
+        tool_names = {tool["function"]["name"] for tool in request.get("tools") or [] if tool.get("function")}
+        name, arguments = plan(request.get("messages") or [], tool_names)
+        prompt_tokens = len(json.dumps(request.get("messages") or [])) // 4
+        completion_tokens = max(1, len(json.dumps(arguments)) // 4)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            number = next(self._ids)
+        return {
+            "id": f"chatcmpl-{number}",
+            "call_id": f"call_{number}",
+            "name": name,
+            "arguments": json.dumps(arguments),
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ("/v1/models", "/models"):
+            return self._send_json(200, {"object": "list", "data": [
+                {"id": self.server.model_id, "object": "model", "created": 0, "owned_by": "bench"}
+            ]})
+        self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ("/v1/chat/completions", "/chat/completions"):
+            return self._send_json(404, {"error": {"message": "Not found"}})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        completion = self.server.complete(request)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if request.get("stream"):
+            return self._stream(request, completion)
+
+        self._send_json(200, {
+            "id": completion["id"],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", self.server.model_id),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": completion["call_id"],
+                    "type": "function",
+                    "function": {"name": completion["name"], "arguments": completion["arguments"]},
+                }]},
+                "finish_reason": "tool_calls",
+            }],
+            "usage": completion["usage"],
+        })
+
+    def _stream(self, request: dict, completion: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(choices, usage=None):
+            payload = {"id": completion["id"], "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": request.get("model", self.server.model_id), "choices": choices}
+            if usage is not None:
+                payload["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+
+        chunk([{"index": 0, "finish_reason": None, "delta": {"role": "assistant", "content": None, "tool_calls": [{
+            "index": 0, "id": completion["call_id"], "type": "function",
+            "function": {"name": completion["name"], "arguments": ""},
+        }]}}])
+        # The arguments arrive in a few pieces, like real streamed tool calls
+        arguments = completion["arguments"]
+        size = max(1, len(arguments) // 4)
+        for start in range(0, len(arguments), size):
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            chunk([{"index": 0, "finish_reason": None, "delta": {"tool_calls": [{
+                "index": 0, "function": {"arguments": arguments[start:start + size]},
+            }]}}])
+        chunk([{"index": 0, "finish_reason": "tool_calls", "delta": {}}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk([], usage=completion["usage"])
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, chunk_delay: float = 0.0) -> FakeOpenAIServer:
+    """
+    Starts the server in a background thread. port 0 picks a free port; see server.base_url.
+    """
+    server = FakeOpenAIServer((host, port), latency, chunk_delay)
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a scripted OpenAI-compatible model locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token of a response")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, args.latency, args.chunk_delay)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Local stand-in for pokeapi.co, for offline benchmarks.
+
+Serves the endpoints the backend uses (the Pokémon and ability lists,
+pokemon/<id> and ability/<id>) with deterministic fixture records in the
+PokeAPI shape: the 151 original Pokémon names with generated types, stats,
+abilities and moves. --snapshot serves the records of an offline Pokédex
+snapshot (see pokedex_snapshot.py) instead, for payloads of the real size.
+--latency adds a fixed delay to every response.
+
+Point the backend at it with POKEAPI_BASE_URL:
+
+    python bench/fake_pokeapi.py --port 8001
+    POKEAPI_BASE_URL=http://127.0.0.1:8001/api/v2 python app.py
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import threading
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+POKEMON_NAMES = (
+    "bulbasaur ivysaur venusaur charmander charmeleon charizard squirtle wartortle blastoise caterpie "
+    "metapod butterfree weedle kakuna beedrill pidgey pidgeotto pidgeot rattata raticate spearow fearow "
+    "ekans arbok pikachu raichu sandshrew sandslash nidoran-f nidorina nidoqueen nidoran-m nidorino "
+    "nidoking clefairy clefable vulpix ninetales jigglypuff wigglytuff zubat golbat oddish gloom "
+    "vileplume paras parasect venonat venomoth diglett dugtrio meowth persian psyduck golduck mankey "
+    "primeape growlithe arcanine poliwag poliwhirl poliwrath abra kadabra alakazam machop machoke "
+    "machamp bellsprout weepinbell victreebel tentacool tentacruel geodude graveler golem ponyta "
+    "rapidash slowpoke slowbro magnemite magneton farfetchd doduo dodrio seel dewgong grimer muk "
+    "shellder cloyster gastly haunter gengar onix drowzee hypno krabby kingler voltorb electrode "
+    "exeggcute exeggutor cubone marowak hitmonlee hitmonchan lickitung koffing weezing rhyhorn rhydon "
+    "chansey tangela kangaskhan horsea seadra goldeen seaking staryu starmie mr-mime scyther jynx "
+    "electabuzz magmar pinsir tauros magikarp gyarados lapras ditto eevee vaporeon jolteon flareon "
+    "porygon omanyte omastar kabuto kabutops aerodactyl snorlax articuno zapdos moltres dratini "
+    "dragonair dragonite mewtwo mew"
+).split()
+
+TYPES = ("normal", "fire", "water", "grass", "electric", "ice", "fighting", "poison", "ground",
+         "flying", "psychic", "bug", "rock", "ghost", "dragon")
+STATS = ("hp", "attack", "defense", "special-attack", "special-defense", "speed")
+ABILITY_COUNT = 300
+MOVE_COUNT = 160
+
+def _ref(base_url: str, resource: str, name: str, resource_id: int) -> dict:
+    return {"name": name, "url": f"{base_url}/{resource}/{resource_id}/"}
+
+def _number(*parts) -> int:
+    # Deterministic pseudo-random number from the parts
+    return zlib.crc32(":".join(str(part) for part in parts).encode('utf-8'))
+
+class Fixtures:
+    """
+    Generates PokeAPI records. moves sets the number of moves per Pokémon;
+    each move carries a few version group entries like the real API, which
+    is what makes real records large.
+    """
+
+    def __init__(self, base_url: str, moves: int = 60):
+        self.base_url = base_url
+        self.moves = moves
+
+    def get(self, path: str):
+        resource, _, rest = path.strip('/').partition('/')
+        resource, _, query = resource.partition('?')
+        if not rest:
+            limit = 100000
+            for pair in query.split('&'):
+                key, _, value = pair.partition('=')
+                if key == 'limit' and value.isdigit():
+                    limit = int(value)
+            if resource == "pokemon":
+                return self.pokemon_list(limit)
+            if resource == "ability":
+                return self.ability_list(limit)
+            return None
+        if not rest.strip('/').isdigit():
+            return None
+        resource_id = int(rest.strip('/'))
+        if resource == "pokemon" and 1 <= resource_id <= len(POKEMON_NAMES):
+            return self.pokemon(resource_id)
+        if resource == "ability" and 1 <= resource_id <= ABILITY_COUNT:
+            return self.ability(resource_id)
+        return None
+
+    def pokemon_list(self, limit: int) -> dict:
+        names = POKEMON_NAMES[:limit]
+        return {
+            "count": len(POKEMON_NAMES),
+            "next": None,
+            "previous": None,
+            "results": [_ref(self.base_url, "pokemon", name, index + 1) for index, name in enumerate(names)],
+        }
+
+    def ability_list(self, limit: int) -> dict:
+        count = min(limit, ABILITY_COUNT)
+        return {
+            "count": ABILITY_COUNT,
+            "next": None,
+            "previous": None,
+            "results": [_ref(self.base_url, "ability", f"ability-{i}", i) for i in range(1, count + 1)],
+        }
+
+    def pokemon(self, pokemon_id: int) -> dict:
+        name = POKEMON_NAMES[pokemon_id - 1]
+        type_ids = sorted({_number(name, "type", slot) % len(TYPES) for slot in range(1 + pokemon_id % 2)})
+        ability_ids = [1 + _number(name, "ability", slot) % ABILITY_COUNT for slot in range(2)]
+        move_ids = sorted({1 + _number(name, "move", slot) % MOVE_COUNT for slot in range(self.moves)})
+        return {
+            "id": pokemon_id,
+            "name": name,
+            "order": pokemon_id,
+            "is_default": True,
+            "height": 3 + _number(name, "height") % 40,
+            "weight": 20 + _number(name, "weight") % 2000,
+            "base_experience": 50 + _number(name, "experience") % 250,
+            "species": _ref(self.base_url, "pokemon-species", name, pokemon_id),
+            "forms": [_ref(self.base_url, "pokemon-form", name, pokemon_id)],
+            "types": [
+                {"slot": slot + 1, "type": _ref(self.base_url, "type", TYPES[type_id], type_id + 1)}
+                for slot, type_id in enumerate(type_ids)
+            ],
+            "abilities": [
+                {"slot": slot + 1, "is_hidden": slot == 1,
+                 "ability": _ref(self.base_url, "ability", f"ability-{ability_id}", ability_id)}
+                for slot, ability_id in enumerate(ability_ids)
+            ],
+            "stats": [
+                {"base_stat": 20 + _number(name, stat) % 120, "effort": 0, "stat": _ref(self.base_url, "stat", stat, index + 1)}
+                for index, stat in enumerate(STATS)
+            ],
+            "moves": [
+                {
+                    "move": _ref(self.base_url, "move", f"move-{move_id}", move_id),
+                    "version_group_details": [
+                        {
+                            "level_learned_at": _number(name, move_id, group) % 60,
+                            "move_learn_method": _ref(self.base_url, "move-learn-method", "level-up", 1),
+                            "version_group": _ref(self.base_url, "version-group", f"version-group-{group}", group),
+                        }
+                        for group in range(1, 5)
+                    ],
+                }
+                for move_id in move_ids
+            ],
+            "held_items": [],
+            "sprites": {"front_default": f"{self.base_url}/sprites/pokemon/{pokemon_id}.png"},
+            "cries": {"latest": f"{self.base_url}/cries/pokemon/latest/{pokemon_id}.ogg"},
+        }
+
+    def ability(self, ability_id: int) -> dict:
+        name = f"ability-{ability_id}"
+        holders = [index + 1 for index, pokemon in enumerate(POKEMON_NAMES)
+                   if ability_id in (1 + _number(pokemon, "ability", slot) % ABILITY_COUNT for slot in range(2))]
+        return {
+            "id": ability_id,
+            "name": name,
+            "is_main_series": True,
+            "generation": _ref(self.base_url, "generation", "generation-i", 1),
+            "effect_entries": [{
+                "effect": f"Fixture effect of {name}. " * 4,
+                "short_effect": f"Fixture effect of {name}.",
+                "language": _ref(self.base_url, "language", "en", 9),
+            }],
+            "flavor_text_entries": [{
+                "flavor_text": f"Flavor text of {name} in version group {group}.",
+                "language": _ref(self.base_url, "language", "en", 9),
+                "version_group": _ref(self.base_url, "version-group", f"version-group-{group}", group),
+            } for group in range(1, 9)],
+            "names": [{"name": name.replace('-', ' ').title(), "language": _ref(self.base_url, "language", "en", 9)}],
+            "pokemon": [
+                {"is_hidden": False, "slot": 1, "pokemon": _ref(self.base_url, "pokemon", POKEMON_NAMES[i - 1], i)}
+                for i in holders
+            ],
+        }
+
+class SnapshotFixtures:
+    """
+    Serves the records of an offline Pokédex snapshot.
+    """
+
+    def __init__(self, path: str):
+        from pokedex_snapshot import PokedexSnapshot
+        self.snapshot = PokedexSnapshot(path)
+
+    def get(self, path: str):
+        try:
+            return self.snapshot.get(path.strip('/'))
+        except KeyError:
+            return None
+
+class FakePokeAPIServer(ThreadingHTTPServer):
+    """
+    HTTP server for fixtures under /api/v2. Counts the requests it served.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, fixtures, latency: float = 0.0):
+        super().__init__(address, _Handler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.requests = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v2"
+
+    def body(self, path: str):
+        with self._lock:
+            self.requests += 1
+            if path in self._cache:
+                return self._cache[path]
+        data = self.fixtures.get(path)
+        body = None if data is None else json.dumps(data).encode('utf-8')
+        with self._lock:
+            self._cache[path] = body
+        return body
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        if not path.startswith("/api/v2/"):
+            return self._send(404, b'{"detail": "Not found."}')
+        path = path[len("/api/v2/"):].strip('/')
+        if url.query:
+            path = f"{path}?{url.query}"
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = self.server.body(path)
+        if body is None:
+            return self._send(404, b'{"detail": "Not found."}')
+        self._send(200, body)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, moves: int = 60,
+          snapshot: str = None) -> FakePokeAPIServer:
+    """
+    Starts the server in a background thread. port 0 picks a free port; see server.base_url.
+    """
+    server = FakePokeAPIServer((host, port), None, latency)
+    server.fixtures = SnapshotFixtures(snapshot) if snapshot else Fixtures(server.base_url, moves)
+    threading.Thread(target=server.serve_forever, name="fake-pokeapi", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PokeAPI fixtures locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--moves", type=int, default=60, help="Moves per generated Pokémon record")
+    parser.add_argument("--snapshot", help="Serve the records of this Pokédex snapshot instead")
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, args.latency, args.moves, args.snapshot)
+    print(f"Fake PokeAPI listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
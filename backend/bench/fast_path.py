@@ -0,0 +1,101 @@
+"""
+Latency and token savings of the fast-path router.
+
+Runs a set of typical queries through fast_path.answer and reports which
+ones it answers and how long that takes. With --agent the same queries are
+also sent through the agent (with the router and the answer cache turned
+off), so the model round trips and tokens the router saves can be compared.
+--agent needs OPENAI_API_KEY and makes real model calls.
+
+PokeAPI data comes from the configured source (POKEAPI_DATA_MODE); favorites
+go to a temporary database.
+
+    python bench/fast_path.py
+    python bench/fast_path.py --agent
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = [
+    "Show my favorites",
+    "How many Pokémon are in my favorites?",
+    "Add Bulbasaur to my favorites",
+    "Please add Charmander, Squirtle and Pikachu to my favorites",
+    "Remove Squirtle from my favorites",
+    "What type is Gengar?",
+    "What are Pikachu's abilities?",
+    "Snorlax base stats",
+    "Mr. Mime type",
+    # These need the agent
+    "Compare Charmander and Squirtle",
+    "Which Pokémon is the best against Onix?",
+    "Add it to my favorites",
+]
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the fast-path router against the agent.")
+    parser.add_argument("--agent", action="store_true", help="Also run every query through the agent")
+    parser.add_argument("--repeat", type=int, default=20, help="Router runs per query")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    os.environ.setdefault("FAVORITES_DB_PATH", os.path.join(data_dir, "favorites.db"))
+    os.environ["CHAT_SESSIONS_DB_PATH"] = os.path.join(data_dir, "chat_sessions.db")
+    os.environ["FAST_PATH_ENABLED"] = "false"
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+    import fast_path
+    user_id = "bench-user"
+
+    # The first call builds the name index and warms the PokeAPI cache
+    for query in QUERIES:
+        fast_path.answer(query, user_id)
+
+    print(f"{'query':<62} {'router':>10}")
+    routed = []
+    for query in QUERIES:
+        durations = []
+        for _ in range(args.repeat):
+            result, duration = timed(fast_path.answer, query, user_id)
+            durations.append(duration)
+        durations.sort()
+        label = f"{durations[len(durations) // 2] * 1000:.2f}ms" if result else "agent"
+        print(f"{query:<62} {label:>10}")
+        if result:
+            routed.append(query)
+    print(f"\n{len(routed)} of {len(QUERIES)} queries answered without the model")
+
+    if not args.agent:
+        return
+
+    from poke_agent import PokemonAgent
+    pokemon_agent = PokemonAgent()
+    chat_id = pokemon_agent.create_chat(user_id=user_id)
+    total_time = total_tokens = 0
+    print(f"\n{'query':<62} {'agent':>10} {'tokens':>8}")
+    for query in routed:
+        _, duration = timed(pokemon_agent.run, chat_id, query, {"current_user_id": user_id})
+        # Runs are sequential, so the pool hands back the agent that just ran
+        agent = pokemon_agent.agents.acquire()
+        usage = agent.monitor.get_total_token_counts()
+        pokemon_agent.agents.release(agent)
+        tokens = usage.input_tokens + usage.output_tokens
+        total_time += duration
+        total_tokens += tokens
+        print(f"{query:<62} {duration * 1000:>8.0f}ms {tokens:>8}")
+    if routed:
+        print(f"\nThe agent needed {total_time / len(routed):.2f}s and {total_tokens / len(routed):.0f} tokens "
+              f"per query on average; the router needs no tokens.")
+
+if __name__ == "__main__":
+    main()
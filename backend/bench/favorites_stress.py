@@ -0,0 +1,102 @@
+"""
+Concurrency stress test for the favorites store.
+
+Parallel writers add and remove favorites for a shared set of users while a
+background thread keeps serializing the whole store. At the end, every user
+must hold exactly the favorites that were added and not removed, both in
+memory and in the database, and no writer may have failed.
+
+    python bench/favorites_stress.py --threads 32 --users 8 --ops 500
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from favorites_storage import SQLiteFavoritesStorage
+from favorites_store import FavoritesStore
+
+def add(store, user_id, pokemon_id):
+    store.add(user_id, [{"id": pokemon_id, "name": f"Pokemon-{pokemon_id}"}])
+
+def remove(store, user_id, pokemon_id):
+    store.remove(user_id, [pokemon_id])
+
+def writer(store, worker, users, ops):
+    """Each worker owns its own Pokémon IDs, so the expected end state is known exactly."""
+    rng = random.Random(worker)
+    kept = {}
+    for op in range(ops):
+        user_id = rng.choice(users)
+        pokemon_id = worker * 100000 + op
+        add(store, user_id, pokemon_id)
+        if rng.random() < 0.3:
+            remove(store, user_id, pokemon_id)
+        else:
+            kept.setdefault(user_id, set()).add(pokemon_id)
+    return kept
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the favorites store with parallel writers.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="Operations per thread")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "favorites.db")
+    store = FavoritesStore(SQLiteFavoritesStorage(db_path))
+    users = [f"user-{index}" for index in range(args.users)]
+
+    stop = threading.Event()
+    serializer_errors = []
+    snapshots = 0
+
+    def serialize_continuously():
+        nonlocal snapshots
+        while not stop.is_set():
+            try:
+                store.snapshot_all()
+                snapshots += 1
+            except Exception as e:
+                serializer_errors.append(e)
+
+    serializer = threading.Thread(target=serialize_continuously)
+    serializer.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        futures = [executor.submit(writer, store, worker, users, args.ops) for worker in range(args.threads)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    serializer.join()
+
+    expected = {user_id: set() for user_id in users}
+    for kept in results:
+        for user_id, pokemon_ids in kept.items():
+            expected[user_id] |= pokemon_ids
+
+    stored = SQLiteFavoritesStorage(db_path).load_all()
+    lost_in_memory = sum(len(expected[u] - {p["id"] for p in store.get(u)}) for u in users)
+    lost_on_disk = sum(len(expected[u] - {p["id"] for p in stored.get(u, [])}) for u in users)
+    extra = sum(len({p["id"] for p in store.get(u)} - expected[u]) for u in users)
+
+    total_ops = args.threads * args.ops
+    print(f"{total_ops} adds (+~30% removes) across {args.users} users in {elapsed:.2f}s "
+          f"({total_ops / elapsed:.0f} adds/s), {snapshots} concurrent snapshots")
+    print(f"lost updates: memory={lost_in_memory} disk={lost_on_disk}, unexpected entries: {extra}, "
+          f"serializer errors: {len(serializer_errors)}")
+
+    ok = lost_in_memory == lost_on_disk == extra == 0 and not serializer_errors
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
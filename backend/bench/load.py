@@ -0,0 +1,337 @@
+"""
+Offline load test of the backend.
+
+Starts the local PokeAPI (fake_pokeapi.py) and the scripted model
+(fake_openai.py), launches the backend in a subprocess that uses them and
+fresh databases, waits for /api/ready and then runs each scenario with
+--concurrency simulated users for --duration seconds. Every user has its own
+cookie and chat. For each scenario it reports throughput, latency
+percentiles and the backend's resident memory (RSS) before, at peak and after.
+
+Scenarios:
+    create_chat      POST /api/create_chat
+    query            POST /api/query through the agent (one tool call and the final answer per query)
+    query_fast       POST /api/query with lookups the fast path answers without the model
+    favorites        GET /api/favorites, revalidated with If-None-Match like a browser does
+    favorites_write  add_favorite, favorites/bulk_add, favorites/bulk_remove and remove_favorite in turn
+
+    python bench/load.py
+    python bench/load.py --scenarios query --concurrency 16 --duration 30 --model-latency 0.5
+    python bench/load.py --server uvicorn --json results.json
+    python bench/load.py --server gunicorn --env WEB_CONCURRENCY=4
+    python bench/load.py --url http://localhost:5000/api --scenarios favorites
+
+With --url the scenarios run against a backend that is already running
+(using whatever PokeAPI and model it is configured with) and RSS is only
+reported if --pid is given.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai
+import fake_pokeapi
+from fake_pokeapi import POKEMON_NAMES
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("create_chat", "query", "query_fast", "favorites", "favorites_write")
+SERVER_COMMANDS = {
+    "werkzeug": lambda port: [sys.executable, "-c",
+                              f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    "uvicorn": lambda port: [sys.executable, "-m", "uvicorn", "asgi:application",
+                             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+    "gunicorn": lambda port: [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                              "--bind", f"127.0.0.1:{port}", "app:app"],
+}
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def rss_bytes(pid: int):
+    """
+    Returns the resident memory of a process and its child processes, like
+    gunicorn's workers (Linux only), or None.
+    """
+    total = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total = int(line.split()[1]) * 1024
+        children = []
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(child) for child in f.read().split()]
+    except OSError:
+        return total
+    for child in children:
+        child_rss = rss_bytes(child)
+        if child_rss is not None and total is not None:
+            total += child_rss
+    return total
+
+class RSSSampler:
+    """Samples a process' RSS in the background to find its peak."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = rss_bytes(pid) if pid else None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+# --- Scenarios: each user runs setup once, then step repeatedly ---
+
+class User:
+    def __init__(self, base_url: str, number: int, timeout: float):
+        self.base_url = base_url
+        self.number = number
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.requests = itertools.count()
+        self.chat = None
+        self.etag = None
+
+    def post(self, path: str, payload: dict):
+        return self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+
+    def get(self, path: str, headers: dict = None):
+        return self.session.get(f"{self.base_url}{path}", headers=headers, timeout=self.timeout)
+
+    def create_chat(self):
+        response = self.post("/create_chat", {})
+        response.raise_for_status()
+        self.chat = response.json()
+        return response
+
+    def pokemon(self, index: int) -> str:
+        return POKEMON_NAMES[(self.number * 37 + index) % len(POKEMON_NAMES)]
+
+def step_create_chat(user: User, index: int):
+    return user.post("/create_chat", {})
+
+def step_query(user: User, index: int):
+    # The request number keeps every question unique, so none is served from the answer cache
+    query = f"Tell me about {user.pokemon(index)} (user {user.number}, question {index})"
+    return user.post("/query", {"query": query, "chat_id": user.chat["chat_id"]})
+
+def step_query_fast(user: User, index: int):
+    return user.post("/query", {"query": f"What type is {user.pokemon(index)}?", "chat_id": user.chat["chat_id"]})
+
+def step_favorites(user: User, index: int):
+    response = user.get("/favorites", headers={"If-None-Match": user.etag} if user.etag else None)
+    user.etag = response.headers.get("ETag", user.etag)
+    return response
+
+def step_favorites_write(user: User, index: int):
+    names = [user.pokemon(index * 3 + offset) for offset in range(3)]
+    action = index % 4
+    if action == 0:
+        return user.post("/add_favorite", {"pokemon_name": names[0]})
+    if action == 1:
+        return user.post("/favorites/bulk_add", {"pokemon": names})
+    if action == 2:
+        return user.post("/favorites/bulk_remove", {"pokemon": names})
+    return user.post("/remove_favorite", {"pokemon_id": POKEMON_NAMES.index(user.pokemon((index - 3) * 3)) + 1})
+
+STEPS = {
+    "create_chat": step_create_chat,
+    "query": step_query,
+    "query_fast": step_query_fast,
+    "favorites": step_favorites,
+    "favorites_write": step_favorites_write,
+}
+
+def run_user(user: User, step, deadline: float) -> tuple:
+    """Runs step until deadline. Returns (latencies, errors, status counts)."""
+    latencies, errors, statuses = [], 0, {}
+    # One unmeasured request first, so connection setup and first-use costs are not counted
+    try:
+        step(user, next(user.requests))
+    except requests.RequestException:
+        pass
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = step(user, next(user.requests))
+            status = response.status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - started
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == "error" or status >= 400:
+            errors += 1
+        else:
+            latencies.append(elapsed)
+    return latencies, errors, statuses
+
+def run_scenario(base_url: str, name: str, concurrency: int, duration: float, timeout: float, pid: int) -> dict:
+    users = [User(base_url, number, timeout) for number in range(concurrency)]
+    for user in users:
+        user.create_chat()
+
+    rss_before = rss_bytes(pid) if pid else None
+    with RSSSampler(pid) as sampler, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        deadline = started + duration
+        results = list(executor.map(lambda user: run_user(user, STEPS[name], deadline), users))
+        elapsed = time.perf_counter() - started
+    rss_after = rss_bytes(pid) if pid else None
+
+    latencies = [latency for user_latencies, _, _ in results for latency in user_latencies]
+    statuses = {}
+    for _, _, user_statuses in results:
+        for status, count in user_statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors, _ in results),
+        "statuses": statuses,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies, default=0.0),
+        "rss_before": rss_before,
+        "rss_peak": sampler.peak,
+        "rss_after": rss_after,
+    }
+
+def start_backend(server: str, pokeapi_url: str, model_url: str, data_dir: str, extra_env: dict):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "POKEAPI_DATA_MODE": "live",
+        "POKEAPI_BASE_URL": pokeapi_url,
+        "OPENAI_BASE_URL": model_url,
+        "OPENAI_API_KEY": "fake",
+        "AGENT_MODEL_ID": "fake-model",
+        "FAVORITES_DB_PATH": os.path.join(data_dir, "favorites.db"),
+        "CHAT_SESSIONS_DB_PATH": os.path.join(data_dir, "chat_sessions.db"),
+        "TOOL_RESULTS_DB_PATH": os.path.join(data_dir, "tool_results.db"),
+        "USAGE_DB_PATH": os.path.join(data_dir, "usage.db"),
+        "LOG_LEVEL": "WARNING",
+    })
+    env.pop("POKEAPI_CACHE_DIR", None)
+    env.update(extra_env)
+    log = open(os.path.join(data_dir, "backend.log"), "w")
+    process = subprocess.Popen(SERVER_COMMANDS[server](port), cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}/api", log.name
+
+def wait_ready(base_url: str, process, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The backend exited with status {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The backend was not ready after {timeout:.0f}s")
+
+def mib(value) -> str:
+    return f"{value / 1024 / 1024:.1f}" if value is not None else "-"
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend offline with a local PokeAPI and model.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simulated users per scenario")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--server", choices=sorted(SERVER_COMMANDS), default="werkzeug", help="How to serve the backend")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Seconds before the model's first token")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed model chunks")
+    parser.add_argument("--pokeapi-latency", type=float, default=0.05, help="Seconds per PokeAPI response")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend environment")
+    parser.add_argument("--url", help="Run against this already running backend instead of starting one")
+    parser.add_argument("--pid", type=int, help="With --url: the backend's process ID, for RSS")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    pokeapi = model = process = None
+    if args.url:
+        base_url, pid = args.url.rstrip('/'), args.pid
+        wait_ready(base_url, None)
+    else:
+        pokeapi = fake_pokeapi.start(latency=args.pokeapi_latency)
+        model = fake_openai.start(latency=args.model_latency, chunk_delay=args.chunk_delay)
+        data_dir = tempfile.mkdtemp(prefix="pokegpt-load-")
+        extra_env = dict(pair.split("=", 1) for pair in args.env)
+        process, base_url, log_path = start_backend(args.server, pokeapi.base_url, model.base_url, data_dir, extra_env)
+        pid = process.pid
+        print(f"Backend ({args.server}) at {base_url}, log in {log_path}")
+        try:
+            wait_ready(base_url, process)
+        except RuntimeError:
+            process.kill()
+            raise
+
+    results = []
+    try:
+        print(f"{'scenario':<16} {'users':>5} {'requests':>8} {'errors':>6} {'req/s':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MiB':>8} {'peak':>7} {'after':>7}")
+        for name in scenarios:
+            result = run_scenario(base_url, name, args.concurrency, args.duration, args.timeout, pid)
+            results.append(result)
+            print(f"{name:<16} {result['concurrency']:>5} {result['requests']:>8} {result['errors']:>6} "
+                  f"{result['throughput']:>8.1f} {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} "
+                  f"{result['p99'] * 1000:>8.1f} {mib(result['rss_before']):>8} {mib(result['rss_peak']):>7} "
+                  f"{mib(result['rss_after']):>7}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    if model is not None:
+        print(f"\nModel: {model.requests} requests, {model.prompt_tokens} prompt and "
+              f"{model.completion_tokens} completion tokens; PokeAPI: {pokeapi.requests} requests")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+# Token budget for the conversation context sent with each query (excluding the system prompt)
+HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+# Maximum number of recent turns (user + assistant pairs) sent verbatim
+HISTORY_WINDOW_TURNS = int(os.environ.get('CHAT_HISTORY_WINDOW_TURNS', '6'))
+# Token budget for the rolling summary of older turns
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_SUMMARY_BUDGET', '300'))
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens in text. Uses tiktoken when it is installed and a
+    4-characters-per-token estimate otherwise.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+def _truncate(text: str, max_tokens: int) -> str:
+    # Keeps the first max_tokens tokens of text, line breaks included
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]) + "..."
+    return text[:max_tokens * 4] + "..."
+
+_SUMMARY_PREFIX = "- User asked: "
+_SUMMARY_SEPARATOR = " Assistant answered: "
+
+class ChatHistory:
+    """
+    Conversation history for a chat session with a bounded prompt footprint.
+
+    The system prompt is kept separately so it is sent once, as the agent's
+    instructions, rather than with every query. Recent turns are sent verbatim
+    within a token budget; the latest turn always is, clipped to the budget if
+    it is longer on its own. Turns that fall out of the window become a line
+    of the summary with the clipped question and answer. When those lines
+    exceed the summary budget, the oldest ones are condensed to their
+    questions on a single "earlier questions" line, from which the oldest
+    questions drop off in turn, so the earliest context is eventually lost.
+    """
+
+    def __init__(self, system_prompt: str, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 window_turns: int = HISTORY_WINDOW_TURNS, summary_budget: int = SUMMARY_TOKEN_BUDGET):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.window_turns = window_turns
+        self.summary_budget = summary_budget
+        self.turns = []  # Full transcript: [{"role", "content", "tokens"}, ...]
+        self.summary_lines = []  # One line per summarized turn
+        self.earlier_questions = []  # Clipped questions of the turns condensed out of summary_lines
+        self.window_start = 0  # Index in self.turns of the first message sent verbatim
+
+    def messages(self) -> list:
+        """
+        Returns the full transcript, starting with the system prompt.
+        """
+        return [{"role": "system", "content": self.system_prompt}] + [
+            {"role": message["role"], "content": message["content"]} for message in self.turns
+        ]
+
+    def add_turn(self, query: str, response: str):
+        """
+        Records a user query and the assistant's response, then trims the window.
+        """
+        self.turns.append({"role": "user", "content": query, "tokens": count_tokens(query)})
+        self.turns.append({"role": "assistant", "content": response, "tokens": count_tokens(response)})
+        self._trim_window()
+
+    def window_tokens(self) -> int:
+        return sum(message["tokens"] for message in self.turns[self.window_start:])
+
+    def build_context(self, query: str) -> str:
+        """
+        Builds the task text for the agent: rolling summary, recent turns and the new query.
+        """
+        parts = []
+        summary = self._summary()
+        if summary:
+            parts.append("Summary of earlier conversation:\n" + "\n".join(summary))
+
+        recent = self.turns[self.window_start:]
+        if recent:
+            contents = [message["content"] for message in recent]
+            if self.window_tokens() > self.token_budget:
+                # Only the latest turn is left and it is over the budget on its own: clip it rather than lose it
+                query_tokens = min(recent[0]["tokens"], self.token_budget // 2)
+                contents = [_truncate(contents[0], query_tokens), _truncate(contents[1], self.token_budget - query_tokens)]
+            lines = [f"{message['role'].capitalize()}: {content}" for message, content in zip(recent, contents)]
+            parts.append("Recent conversation:\n" + "\n".join(lines))
+
+        parts.append("User Query: " + query)
+        return "\n\n".join(parts)
+
+    def _summary(self) -> list:
+        lines = list(self.summary_lines)
+        if self.earlier_questions:
+            lines.insert(0, "- Earlier the user asked: " + "; ".join(self.earlier_questions))
+        return lines
+
+    def _trim_window(self):
+        # Drop whole turns (user + assistant) from the front of the window, always keeping the latest one
+        while self.window_start < len(self.turns) - 2 and (
+            (len(self.turns) - self.window_start) // 2 > self.window_turns
+            or self.window_tokens() > self.token_budget
+        ):
+            user_message = self.turns[self.window_start]
+            assistant_message = self.turns[self.window_start + 1]
+            self.summary_lines.append(
+                f"{_SUMMARY_PREFIX}{_clip(user_message['content'], 120)}"
+                f"{_SUMMARY_SEPARATOR}{_clip(assistant_message['content'], 200)}"
+            )
+            self.window_start += 2
+
+        # Condense the oldest summary lines to their questions, then drop the oldest questions
+        while count_tokens("\n".join(self._summary())) > self.summary_budget:
+            if len(self.summary_lines) > 1:
+                line = self.summary_lines.pop(0)
+                question = line[len(_SUMMARY_PREFIX):].split(_SUMMARY_SEPARATOR, 1)[0]
+                self.earlier_questions.append(_clip(question, 60))
+            elif self.earlier_questions:
+                self.earlier_questions.pop(0)
+            else:
+                break
+
+    def to_dict(self) -> dict:
+        return {
+            "system_prompt": self.system_prompt,
+            "turns": self.turns,
+            "summary_lines": self.summary_lines,
+            "earlier_questions": self.earlier_questions,
+            "window_start": self.window_start
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatHistory":
+        history = cls(data["system_prompt"])
+        history.turns = data.get("turns", [])
+        history.summary_lines = data.get("summary_lines", [])
+        history.earlier_questions = data.get("earlier_questions", [])
+        history.window_start = data.get("window_start", 0)
+        return history
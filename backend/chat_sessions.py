@@ -0,0 +1,182 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class SQLiteSessionBackend:
+    """
+    Stores serialized chat sessions in SQLite, so they survive restarts and
+    can be shared by several worker processes using the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    chat_id TEXT PRIMARY KEY,
+                    owner_id TEXT,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, chat_id: str):
+        """
+        Returns (state, updated_at) for a session, or None if it is not stored.
+        """
+        row = self._connect().execute(
+            "SELECT state, updated_at FROM chat_sessions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def updated_at(self, chat_id: str):
+        row = self._connect().execute(
+            "SELECT updated_at FROM chat_sessions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, chat_id: str, owner_id: str, state: dict, updated_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (chat_id, owner_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, owner_id, json.dumps(state, default=str), updated_at)
+            )
+
+    def delete_older_than(self, cutoff: float) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+
+class ChatSessionStore:
+    """
+    Chat sessions with a bounded in-memory working set.
+
+    At most max_sessions chats are kept in memory; the least recently used
+    one is evicted first, and chats idle for longer than idle_ttl seconds are
+    evicted as well. Every change is written through to the backend, so an
+    evicted chat is rehydrated on its next access, and another worker that
+    updated a chat is noticed through the backend's updated_at timestamp.
+
+    Chats are dicts; serialize(chat) and deserialize(state) convert them to
+    and from JSON-serializable state for the backend.
+    """
+
+    def __init__(self, serialize, deserialize, backend=None, max_sessions: int = 256, idle_ttl: float = 1800):
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # chat_id -> (chat, last_access, version)
+        self._lock = threading.Lock()
+        self.rehydrations = 0
+        self.evictions = 0
+
+    def __contains__(self, chat_id):
+        with self._lock:
+            if chat_id in self._sessions:
+                return True
+        return self.backend is not None and self.backend.updated_at(chat_id) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __getitem__(self, chat_id):
+        chat = self.get(chat_id)
+        if chat is None:
+            raise KeyError(chat_id)
+        return chat
+
+    def __setitem__(self, chat_id, chat):
+        version = time.time()
+        if self.backend is not None:
+            self.backend.save(chat_id, chat.get("owner_id"), self.serialize(chat), version)
+        self._remember(chat_id, chat, version)
+
+    def get(self, chat_id: str):
+        """
+        Returns a chat session, rehydrating it from the backend if it is not in
+        memory or if another worker has updated it since it was loaded.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(chat_id)
+            if entry is not None:
+                self._sessions[chat_id] = (entry[0], now, entry[2])
+                self._sessions.move_to_end(chat_id)
+
+        if entry is not None:
+            if self.backend is None:
+                return entry[0]
+            stored_version = self.backend.updated_at(chat_id)
+            if stored_version is None or stored_version <= entry[2]:
+                return entry[0]
+
+        if self.backend is None:
+            return None
+        loaded = self.backend.load(chat_id)
+        if loaded is None:
+            return None
+
+        state, version = loaded
+        chat = self.deserialize(state)
+        self.rehydrations += 1
+        self._remember(chat_id, chat, version)
+        return chat
+
+    def save(self, chat_id: str, chat: dict):
+        """
+        Writes a chat through to the backend and makes it the in-memory copy.
+
+        The chat passed in is saved even if it was evicted while it was being
+        changed or get() has loaded another copy since.
+        """
+        self[chat_id] = chat
+
+    def _remember(self, chat_id, chat, version):
+        now = time.time()
+        with self._lock:
+            self._sessions[chat_id] = (chat, now, version)
+            self._sessions.move_to_end(chat_id)
+            self._evict(now)
+
+    def _evict(self, now):
+        # Least recently used entries are at the front
+        while self._sessions:
+            chat_id, (_, last_access, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - last_access > self.idle_ttl:
+                del self._sessions[chat_id]
+                self.evictions += 1
+            else:
+                break
+
+    def purge(self, max_age: float) -> int:
+        """
+        Deletes stored sessions not updated for max_age seconds.
+        """
+        if self.backend is None:
+            return 0
+        return self.backend.delete_older_than(time.time() - max_age)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_memory": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+            }
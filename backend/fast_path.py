@@ -0,0 +1,199 @@
+"""
+Deterministic router for simple queries that map onto a single tool call.
+
+An intent matches only if one of its patterns matches the whole query and
+every Pokémon it names resolves exactly in the name index. Anything else,
+including context-dependent follow-ups ("add it to my favorites"), falls
+back to the agent.
+"""
+import re
+import logging
+import unicodedata
+import favorites_service
+import pokeapi_client
+import pokemon_index
+import pokemon_projection
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+_POLITE = r"(?:please |can you |could you |pls )*"
+_FAVORITES = r"(?:my )?favou?rites?(?: list)?"
+_POKEMON = r"(?P<pokemon>[\w♀♂.'’ ,&-]+?)"
+
+_INTENTS = [
+    ("list_favorites", [
+        rf"{_POLITE}(?:show|list|view|display|get|see)(?: me)?(?: all)? my (?:favou?rites?|favou?rite pokemon|saved pokemon)(?: list)?",
+        r"what(?: pokemon)? (?:are|is) (?:in )?my (?:favou?rites?|favou?rite pokemon)(?: list)?",
+        r"what pokemon do i have saved",
+        r"my favou?rites",
+    ]),
+    ("count_favorites", [
+        rf"how many(?: pokemon)? (?:are|do i have) (?:saved )?in {_FAVORITES}",
+        r"how many favou?rites do i have",
+    ]),
+    ("add_favorites", [
+        rf"{_POLITE}(?:add|save) {_POKEMON} (?:to|in|into) {_FAVORITES}",
+    ]),
+    ("remove_favorites", [
+        rf"{_POLITE}(?:remove|delete|take|drop) {_POKEMON} (?:from|off|out of) {_FAVORITES}",
+    ]),
+    ("types", [
+        rf"(?:what|which) (?:type|types) (?:is|are) {_POKEMON}",
+        rf"(?:what|which) types? does {_POKEMON} have",
+        rf"what is {_POKEMON} (?:type|types)",
+        rf"{_POKEMON} (?:type|types)",
+    ]),
+    ("abilities", [
+        rf"what (?:are|is) (?:the )?abilities of {_POKEMON}",
+        rf"what (?:are|is) {_POKEMON} (?:abilities|ability)",
+        rf"(?:what|which) abilities does {_POKEMON} have",
+        rf"{_POKEMON} abilities",
+    ]),
+    ("stats", [
+        rf"what (?:are|is) (?:the )?(?:base )?stats of {_POKEMON}",
+        rf"what (?:are|is) {_POKEMON}(?: base)? stats",
+        rf"{_POKEMON}(?: base)? stats",
+    ]),
+]
+_INTENTS = [(intent, [re.compile(pattern) for pattern in patterns]) for intent, patterns in _INTENTS]
+
+def _normalize(query: str) -> str:
+    # Drop accents ("Pokémon" -> "pokemon")
+    query = unicodedata.normalize('NFKD', str(query).strip().lower())
+    query = ''.join(ch for ch in query if not unicodedata.combining(ch))
+    query = re.sub(r"['’]s\b", '', query)
+    query = re.sub(r"[?!]+$", '', query).strip()
+    return re.sub(r'\s+', ' ', query)
+
+def _resolve_all(text: str) -> list:
+    """
+    Resolves "bulbasaur, charmander and squirtle" to index matches; None if any part is unknown.
+    """
+    index = pokemon_index.get_index()
+    matches = []
+    for part in re.split(r'\s*,\s*|\s+and\s+|\s*&\s*', text):
+        part = part.strip()
+        if not part:
+            continue
+        found = index.find(part)
+        if not found:
+            return None
+        matches.append((part, found))
+    return matches or None
+
+def match(query: str):
+    """
+    Returns (intent, pokemon) for a query the router can answer on its own, or None.
+    pokemon is a list of (text, (id, name)) tuples for intents that name Pokémon.
+    """
+    text = _normalize(query)
+    for intent, patterns in _INTENTS:
+        for pattern in patterns:
+            found = pattern.fullmatch(text)
+            if not found:
+                continue
+            if "pokemon" not in pattern.groupindex:
+                return intent, []
+            matches = _resolve_all(found.group("pokemon"))
+            # Lookups are answered for one Pokémon at a time
+            if matches is None or (intent in ("types", "abilities", "stats") and len(matches) != 1):
+                continue
+            return intent, matches
+    return None
+
+def _tool_call(tool_name: str, parameters: dict, output) -> dict:
+    return {"tool_name": tool_name, "parameters": parameters, "output": str(output)}
+
+def _details(pokemon_id: int, fields: str):
+    details = pokemon_projection.project_pokemon(pokeapi_client.get_json(f"pokemon/{pokemon_id}", "pokemon"), fields)
+    return details, _tool_call("get_pokemon_details", {"id": pokemon_id, "fields": fields}, details)
+
+_STAT_LABELS = {"hp": "HP", "special-attack": "Sp. Atk", "special-defense": "Sp. Def"}
+
+def _render_favorites(favorites: list) -> str:
+    if not favorites:
+        return "You don't have any favorite Pokémon yet. Ask me to add one, e.g. *\"Add Pikachu to my favorites\"*."
+    lines = [f"## Your Favorite Pokémon ({len(favorites)})", ""]
+    lines += [f"- **{pokemon['name']}** (#{pokemon['id']})" for pokemon in favorites]
+    return "\n".join(lines)
+
+@telemetry.traced("fast_path.answer")
+def answer(query: str, user_id: str):
+    """
+    Answers query without the LLM if it is a simple lookup.
+
+    Returns:
+        {"response", "tool_calls"} with a Markdown response, or None if the
+        query should go to the agent.
+    """
+    try:
+        matched = match(query)
+        if matched is None:
+            return None
+        intent, pokemon = matched
+        logger.debug("Fast path %s %s", intent, [found[1] for _, found in pokemon])
+        return _answer(intent, pokemon, user_id)
+    except Exception as e:
+        logger.warning("Fast path failed, falling back to the agent: %s", e)
+        return None
+
+def _answer(intent: str, pokemon: list, user_id: str) -> dict:
+    if intent in ("list_favorites", "count_favorites"):
+        result = favorites_service.get_user_favorites(user_id=user_id)
+        tool_calls = [_tool_call("get_user_favorites", {"user_id": user_id}, result)]
+        if intent == "count_favorites":
+            count = result["favorites_count"]
+            response = f"You have **{count}** Pokémon in your favorites."
+        else:
+            response = _render_favorites(result["favorites"])
+        return {"response": response, "tool_calls": tool_calls}
+
+    if intent in ("add_favorites", "remove_favorites"):
+        names = [text for text, _ in pokemon]
+        canonical = {text: pokemon_index.display_name(found[1]) for text, found in pokemon}
+        if intent == "add_favorites":
+            result = favorites_service.add_favorites_bulk(pokemon=names, user_id=user_id)
+            tool_calls = [_tool_call("update_favorites_bulk", {"user_id": user_id, "add": names}, result)]
+            done = [r for r in result["results"] if r.get("message") == "Added to favorites"]
+            verb, already = "Added", "already in your favorites"
+        else:
+            result = favorites_service.remove_favorites_bulk(pokemon=names, user_id=user_id)
+            tool_calls = [_tool_call("update_favorites_bulk", {"user_id": user_id, "remove": names}, result)]
+            done = [r for r in result["results"] if r["success"]]
+            verb, already = "Removed", "not in your favorites"
+
+        done_inputs = {r["input"] for r in done}
+        lines = []
+        if done:
+            lines.append(f"{verb} " + ", ".join(f"**{canonical[r['input']]}**" for r in done) +
+                         (" to" if verb == "Added" else " from") + " your favorites!")
+        skipped = [name for name in names if name not in done_inputs]
+        if skipped:
+            lines.append(", ".join(f"**{canonical[name]}**" for name in skipped) + f" {'was' if len(skipped) == 1 else 'were'} {already}.")
+        lines.append(f"You now have {result['favorites_count']} Pokémon in your favorites.")
+        return {"response": "\n\n".join(lines), "tool_calls": tool_calls}
+
+    _, (pokemon_id, name) = pokemon[0]
+    title = pokemon_index.display_name(name)
+
+    if intent == "types":
+        details, call = _details(pokemon_id, "name,types")
+        types = " / ".join(f"**{t.title()}**" for t in details["types"])
+        label = "type" if len(details["types"]) == 1 else "types"
+        response = f"**{title}** is {types} {label}." if details["types"] else f"No type data found for **{title}**."
+        return {"response": response, "tool_calls": [call]}
+
+    if intent == "abilities":
+        details, call = _details(pokemon_id, "name,abilities")
+        lines = [f"## {title}'s Abilities", ""]
+        for ability in details["abilities"]:
+            hidden = " *(hidden ability)*" if ability.get("is_hidden") else ""
+            lines.append(f"- `{ability['name']}`{hidden}")
+        return {"response": "\n".join(lines), "tool_calls": [call]}
+
+    details, call = _details(pokemon_id, "name,stats")
+    lines = [f"## {title}'s Base Stats", "", "| Stat | Value |", "| --- | --- |"]
+    lines += [f"| {_STAT_LABELS.get(stat, pokemon_index.display_name(stat))} | {value} |" for stat, value in details["stats"].items()]
+    lines.append(f"| **Total** | **{sum(details['stats'].values())}** |")
+    return {"response": "\n".join(lines), "tool_calls": [call]}
@@ -2,88 +2,129 @@ import uuid
 import re
 import os
 import json
+import logging
+import pokemon_index
 
-# In-memory storage for favorites (replace with a real database in production)
-favorites_db = {}
+from favorites_storage import SQLiteFavoritesStorage
+from favorites_store import FavoritesStore
 
-# File to store user favorites
+logger = logging.getLogger(__name__)
+
+# Database file for user favorites
+FAVORITES_DB_FILE = os.environ.get('FAVORITES_DB_PATH', os.path.join(os.path.dirname(__file__), 'user_favorites.db'))
+
+# Legacy JSON file, imported into the database on first start
 FAVORITES_FILE = os.path.join(os.path.dirname(__file__), 'user_favorites.json')
 
-# Load favorites from file if it exists
+storage = SQLiteFavoritesStorage(FAVORITES_DB_FILE, legacy_json_path=FAVORITES_FILE)
+
+# Seconds between checks for changes made by other worker processes while a change feed waits
+FAVORITES_POLL_INTERVAL = float(os.environ.get('FAVORITES_POLL_INTERVAL', '1'))
+
+# Thread-safe in-memory favorites with per-user locks, backed by SQLite and
+# kept in sync with other processes using the same database
+favorites_db = FavoritesStore(storage, poll_interval=FAVORITES_POLL_INTERVAL)
+
+# Load favorites from the database
 def load_favorites():
     try:
-        if os.path.exists(FAVORITES_FILE):
-            with open(FAVORITES_FILE, 'r') as f:
-                loaded_favorites = json.load(f)
-                # Update favorites_service's database with loaded data
-                favorites_db.update(loaded_favorites)
-            print(f"Loaded {len(favorites_db)} user favorites from file")
-        else:
-            print("No favorites file found, starting with empty favorites")
+        favorites_db.load()
+        logger.info("Loaded %d user favorites from %s", len(favorites_db), FAVORITES_DB_FILE)
     except Exception as e:
-        print(f"Error loading favorites: {e}")
+        logger.exception("Error loading favorites: %s", e)
 
-# Save favorites to file
-def save_favorites():
+# Save favorites to the database. Only the given user's rows are rewritten;
+# without a user_id every user is saved.
+def save_favorites(user_id: str = None):
     try:
-        with open(FAVORITES_FILE, 'w') as f:
-            json.dump(favorites_db, f)
-        print(f"Saved {len(favorites_db)} user favorites to file")
+        if user_id is not None:
+            favorites_db.save(user_id)
+        else:
+            favorites_db.save_all()
+            logger.info("Saved %d user favorites to %s", len(favorites_db), FAVORITES_DB_FILE)
     except Exception as e:
-        print(f"Error saving favorites: {e}")
+        logger.exception("Error saving favorites: %s", e)
+
+# Favorites are not loaded at startup: each user's favorites are read from the
+# database the first time they are accessed (see FavoritesStore._user).
+
+def on_favorites_changed(callback):
+    """
+    Registers callback(user_id), called whenever a user's favorites change.
+    """
+    favorites_db.add_listener(callback)
+
+def refresh_favorites(user_id: str):
+    """
+    Picks up changes another worker process made to a user's favorites,
+    notifying the on_favorites_changed callbacks if there were any.
+    """
+    favorites_db.refresh(user_id)
+
+def favorites_version(user_id: str) -> str:
+    """
+    Returns an opaque version of a user's favorites that changes whenever they
+    change; the favorites endpoints send it as their ETag. Every worker
+    process using the same database returns the same version.
+    """
+    return f"{favorites_db.store_id}-{favorites_db.version(user_id)}"
+
+def wait_for_favorites_change(user_id: str, version: str, timeout: float) -> str:
+    """
+    Blocks until a user's favorites are no longer at version (as returned by
+    favorites_version), or until timeout seconds have passed.
+
+    Returns:
+        The current version, equal to version if nothing changed.
+    """
+    store_id, _, number = str(version).partition('-')
+    if store_id != favorites_db.store_id or not number.isdigit():
+        # A version from another database is always out of date
+        return favorites_version(user_id)
+    current = favorites_db.wait_for_change(user_id, int(number), timeout)
+    return f"{favorites_db.store_id}-{current}"
 
-# Load favorites on startup
-load_favorites()
+def ensure_user(user_id: str):
+    """
+    Registers a user with an empty favorites list if they have none yet.
+    """
+    favorites_db.ensure_user(user_id)
 
 def add_favorite(pokemon_name: str, pokemon_id: int = None, user_id: str = None) -> dict:
     """
     Adds a pokemon to the favorites list for a given user.
     If user_id is not provided, a new one is generated.
-    If pokemon_id is not provided, attempts to extract it from the name or generates one.
+    The Pokémon is looked up in the name index by pokemon_id if provided, otherwise
+    by name, and stored under its name from the index.
+
+    Raises:
+        ValueError: If the Pokémon is not in the index.
     """
     if not user_id:
         user_id = str(uuid.uuid4())
-        
-    if user_id not in favorites_db:
-        favorites_db[user_id] = []
-    
-    # Clean the pokemon name (capitalize first letter)
-    clean_name = pokemon_name.strip().capitalize()
-    
-    # If pokemon_id is not provided, try to extract from name or generate one
-    if pokemon_id is None:
-        # Extract pokemon ID from name if it has a format like "bulbasaur-1"
-        if "-" in pokemon_name:
-            match = re.search(r'-(\d+)$', pokemon_name)
-            if match:
-                pokemon_id = int(match.group(1))
-                # Clean the name by removing the ID part
-                clean_name = pokemon_name.split('-')[0].capitalize()
-        
-        # If still no ID found, use a simple hash of the name as the ID
-        if pokemon_id is None:
-            # Using a simple hash to generate a stable ID from the name
-            # This is a simplified approach - in a real app, you'd query the PokeAPI
-            pokemon_id = abs(hash(clean_name.lower())) % 1000
-    
-    # Create pokemon object with id and name
-    pokemon_obj = {
-        "id": pokemon_id,
-        "name": clean_name
-    }
     
-    # Check if this pokemon is already in favorites
-    already_exists = any(p.get('id') == pokemon_id for p in favorites_db[user_id])
+    # The Pokémon is looked up in the name index by ID if given, otherwise by name
+    found = pokemon_index.find_pokemon(pokemon_id if pokemon_id is not None else pokemon_name)
+    if not found and pokemon_id is None:
+        # Names with an ID suffix like "bulbasaur-1" resolve by the ID
+        match = re.search(r'-(\d+)$', pokemon_name.strip())
+        if match:
+            found = pokemon_index.find_pokemon(match.group(1))
+    if not found:
+        raise ValueError(f"Could not find {pokemon_name.strip()} in the Pokémon database")
     
-    if not already_exists:
-        favorites_db[user_id].append(pokemon_obj)
-        
-    print(f"\n[SERVICE] Favorites for user {user_id}: {favorites_db[user_id]}")
-    save_favorites()
+    # Stored under the index's name formatted for display; removing by name matches it after normalization
+    pokemon_id, canonical_name = found
+    clean_name = pokemon_index.display_name(canonical_name)
+    
+    # Adding a Pokémon that is already in favorites is a no-op
+    favorites_db.add(user_id, [{"id": pokemon_id, "name": clean_name}])
+    favorites = favorites_db.get(user_id)
+    logger.debug("Favorites for user %s: %s", user_id, favorites)
 
     return {
         "user_id": user_id,
-        "favorites": favorites_db[user_id],
+        "favorites": favorites,
         "message": f"Added {clean_name} to favorites."
     }
 
@@ -107,33 +148,159 @@ def remove_favorite_by_name(pokemon_name: str, user_id: str) -> dict:
             "favorites": []
         }
     
-    # Normalize the pokemon name for comparison
-    normalized_name = pokemon_name.strip().lower()
+    # Names are matched after normalization, so "Mr Mime" also removes "Mr. Mime"
+    removed = favorites_db.remove_by_name(user_id, [pokemon_name])
+    favorites = favorites_db.get(user_id)
     
-    before_count = len(favorites_db[user_id])
-    favorites_db[user_id] = [p for p in favorites_db[user_id] if p.get('name', '').lower() != normalized_name]
-    after_count = len(favorites_db[user_id])
-    
-    if before_count > after_count:
-        print(f"Removed pokemon '{pokemon_name}' from user {user_id}'s favorites")
-        save_favorites()
+    if removed:
+        logger.debug("Removed pokemon '%s' from user %s's favorites", pokemon_name, user_id)
         return {
             "success": True,
             "message": f"Removed {pokemon_name} from favorites",
             "user_id": user_id,
-            "favorites_count": after_count,
-            "favorites": favorites_db[user_id]
+            "favorites_count": len(favorites),
+            "favorites": favorites
         }
     else:
-        print(f"Pokemon '{pokemon_name}' not found in user {user_id}'s favorites")
+        logger.debug("Pokemon '%s' not found in user %s's favorites", pokemon_name, user_id)
         return {
             "success": False,
             "message": f"Could not find {pokemon_name} in your favorites",
             "user_id": user_id,
-            "favorites_count": after_count,
-            "favorites": favorites_db[user_id]
+            "favorites_count": len(favorites),
+            "favorites": favorites
         }
 
+def remove_favorite_by_id(pokemon_id: int, user_id: str) -> dict:
+    """
+    Removes a pokemon from the favorites list by ID for a given user.
+    
+    Args:
+        pokemon_id: The ID of the Pokemon to remove
+        user_id: The user ID to remove the favorite from
+        
+    Returns:
+        A dictionary with the result of the operation
+    """
+    removed = bool(favorites_db.remove(user_id, [pokemon_id]))
+    favorites = favorites_db.get(user_id)
+    
+    if removed:
+        logger.debug("Removed pokemon ID %s from user %s's favorites", pokemon_id, user_id)
+    else:
+        logger.debug("Pokemon ID %s not found in user %s's favorites", pokemon_id, user_id)
+    
+    return {
+        "success": removed,
+        "user_id": user_id,
+        "favorites_count": len(favorites),
+        "favorites": favorites
+    }
+
+# Maximum number of Pokémon in a single bulk request
+MAX_BULK_ITEMS = 500
+
+def _as_pokemon_id(item):
+    """Returns item as an int if it is a Pokémon ID (e.g. 25 or "25"), otherwise None."""
+    if isinstance(item, bool):
+        return None
+    if isinstance(item, int):
+        return item
+    if isinstance(item, str) and item.strip().isdigit():
+        return int(item.strip())
+    return None
+
+def add_favorites_bulk(pokemon: list, user_id: str) -> dict:
+    """
+    Adds many Pokémon, given by name or ID, to a user's favorites.
+    Names are resolved against the name index in one pass and all additions
+    are persisted in a single write.
+    
+    Args:
+        pokemon: Pokémon names and/or IDs
+        user_id: The user ID to add the favorites for
+        
+    Returns:
+        A dictionary with a per-item result and the updated favorites
+    """
+    if len(pokemon) > MAX_BULK_ITEMS:
+        raise ValueError(f"At most {MAX_BULK_ITEMS} Pokémon can be added at once")
+    
+    index = pokemon_index.get_index()
+    results = []
+    to_add = []
+    for item in pokemon:
+        found = index.find(item) if isinstance(item, (str, int)) and not isinstance(item, bool) else None
+        if not found:
+            results.append({"input": item, "success": False, "message": f"Could not find {item} in the Pokémon database"})
+            continue
+        
+        pokemon_id, canonical_name = found
+        name = pokemon_index.display_name(canonical_name)
+        results.append({"input": item, "success": True, "id": pokemon_id, "name": name})
+        to_add.append({"id": pokemon_id, "name": name})
+    
+    added_ids = {p["id"] for p in favorites_db.add(user_id, to_add)}
+    for result in results:
+        if result["success"]:
+            result["message"] = "Added to favorites" if result["id"] in added_ids else "Already in favorites"
+            # Items listed twice in one request are only added once
+            added_ids.discard(result["id"])
+    
+    favorites = favorites_db.get(user_id)
+    logger.debug("Bulk added %d of %d Pokémon for user %s", len(to_add), len(pokemon), user_id)
+    return {
+        "user_id": user_id,
+        "results": results,
+        "favorites_count": len(favorites),
+        "favorites": favorites
+    }
+
+def remove_favorites_bulk(pokemon: list, user_id: str) -> dict:
+    """
+    Removes many Pokémon, given by name or ID, from a user's favorites in a single write.
+    
+    Args:
+        pokemon: Pokémon names and/or IDs
+        user_id: The user ID to remove the favorites from
+        
+    Returns:
+        A dictionary with a per-item result and the updated favorites
+    """
+    if len(pokemon) > MAX_BULK_ITEMS:
+        raise ValueError(f"At most {MAX_BULK_ITEMS} Pokémon can be removed at once")
+    
+    names = [item for item in pokemon if isinstance(item, str) and _as_pokemon_id(item) is None]
+    ids_by_name = favorites_db.ids_for_names(user_id, names)
+    
+    ids_by_item = []
+    for item in pokemon:
+        pokemon_id = _as_pokemon_id(item)
+        if pokemon_id is not None:
+            ids = [pokemon_id] if favorites_db.contains(user_id, pokemon_id) else []
+        else:
+            ids = ids_by_name.get(item, []) if isinstance(item, str) else []
+        ids_by_item.append((item, ids))
+    
+    removed_ids = {p["id"] for p in favorites_db.remove(user_id, [i for _, ids in ids_by_item for i in ids])}
+    results = []
+    for item, ids in ids_by_item:
+        removed = [i for i in ids if i in removed_ids]
+        removed_ids.difference_update(removed)
+        if removed:
+            results.append({"input": item, "success": True, "ids": removed, "message": "Removed from favorites"})
+        else:
+            results.append({"input": item, "success": False, "message": f"Could not find {item} in your favorites"})
+    
+    favorites = favorites_db.get(user_id)
+    logger.debug("Bulk removed %d of %d Pokémon for user %s", sum(r['success'] for r in results), len(pokemon), user_id)
+    return {
+        "user_id": user_id,
+        "results": results,
+        "favorites_count": len(favorites),
+        "favorites": favorites
+    }
+
 def get_user_favorites(user_id: str) -> dict:
     """
     Retrieves the favorites list for a specific user.
@@ -151,7 +318,7 @@ def get_user_favorites(user_id: str) -> dict:
             "favorites": []
         }
     
-    favorites = favorites_db.get(user_id, [])
+    favorites = favorites_db.get(user_id)
     return {
         "user_id": user_id,
         "favorites_count": len(favorites),
@@ -162,7 +329,7 @@ def get_favorites(user_id: str) -> dict:
     """
     Retrieves the favorites list for a given user.
     """
-    favorites = favorites_db.get(user_id, [])
+    favorites = favorites_db.get(user_id)
     return {
         "user_id": user_id,
         "favorites": favorites
@@ -0,0 +1,198 @@
+import os
+import json
+import logging
+import sqlite3
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+class SQLiteFavoritesStorage:
+    """
+    SQLite persistence for user favorites.
+
+    Adds and removes touch only the affected rows and full saves replace the
+    rows of a single user, each inside one transaction. A write never costs
+    more than the changed user's favorites, and a crash can never leave a
+    half-written file.
+
+    Every write also increments the version of the changed user's favorites
+    in the same transaction. Several processes can share the database file:
+    comparing a version read earlier with version() tells whether another
+    process changed the user's favorites since. store_id is random per
+    database, so versions from different databases never match.
+    """
+
+    def __init__(self, path: str, legacy_json_path: str = None):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS favorites (
+                    user_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    pokemon_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    PRIMARY KEY (user_id, pokemon_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS favorites_by_position ON favorites (user_id, position)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS favorites_versions (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS favorites_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            # The first process to open the database picks its ID
+            conn.execute("INSERT OR IGNORE INTO favorites_meta (key, value) VALUES ('store_id', ?)", (secrets.token_hex(4),))
+        (self.store_id,) = self._connect().execute("SELECT value FROM favorites_meta WHERE key = 'store_id'").fetchone()
+        if legacy_json_path:
+            self._migrate_json(legacy_json_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_all(self) -> dict:
+        """
+        Returns every user's favorites as {user_id: [{"id", "name"}, ...]}.
+        """
+        favorites = {}
+        rows = self._connect().execute(
+            "SELECT user_id, pokemon_id, name FROM favorites ORDER BY user_id, position"
+        )
+        for user_id, pokemon_id, name in rows:
+            favorites.setdefault(user_id, []).append({"id": pokemon_id, "name": name})
+        return favorites
+
+    def load_user(self, user_id: str) -> list:
+        """
+        Returns a single user's favorites in insertion order.
+        """
+        rows = self._connect().execute(
+            "SELECT pokemon_id, name FROM favorites WHERE user_id = ? ORDER BY position", (user_id,)
+        )
+        return [{"id": pokemon_id, "name": name} for pokemon_id, name in rows]
+
+    def version(self, user_id: str) -> int:
+        """
+        Returns the version of a user's stored favorites, 0 if they were never written.
+        Read it before the favorites themselves, so they are never older than their version.
+        """
+        row = self._connect().execute("SELECT version FROM favorites_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def versions(self) -> dict:
+        """
+        Returns the version of every user's stored favorites as {user_id: version}.
+        """
+        return dict(self._connect().execute("SELECT user_id, version FROM favorites_versions"))
+
+    def has_user(self, user_id: str) -> bool:
+        """
+        Returns True if the user has any stored favorites.
+        """
+        row = self._connect().execute("SELECT 1 FROM favorites WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+        return row is not None
+
+    def most_favorited(self, limit: int) -> list:
+        """
+        Returns the IDs of the Pokémon favorited by the most users, most popular first.
+        """
+        rows = self._connect().execute(
+            "SELECT pokemon_id FROM favorites GROUP BY pokemon_id ORDER BY COUNT(*) DESC, pokemon_id LIMIT ?", (limit,)
+        )
+        return [pokemon_id for (pokemon_id,) in rows]
+
+    def save_user(self, user_id: str, favorites: list) -> int:
+        """
+        Atomically replaces the stored favorites of one user.
+
+        Returns:
+            The new version of the user's favorites.
+        """
+        with self._connect() as conn:
+            version = self._bump_version(conn, user_id)
+            self._replace_user(conn, user_id, favorites)
+        return version
+
+    def insert_favorites(self, user_id: str, favorites: list) -> int:
+        """
+        Appends favorites ({"id", "name"} dicts) to the end of a user's list in one transaction.
+
+        Returns:
+            The new version of the user's favorites.
+        """
+        with self._connect() as conn:
+            version = self._bump_version(conn, user_id)
+            (next_position,) = conn.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM favorites WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            conn.executemany(
+                "INSERT OR IGNORE INTO favorites (user_id, position, pokemon_id, name) VALUES (?, ?, ?, ?)",
+                [(user_id, next_position + offset, pokemon["id"], pokemon["name"])
+                 for offset, pokemon in enumerate(favorites)]
+            )
+        return version
+
+    def delete_favorites(self, user_id: str, pokemon_ids: list) -> int:
+        """
+        Deletes favorites of a user by Pokémon ID in one transaction.
+
+        Returns:
+            The new version of the user's favorites.
+        """
+        with self._connect() as conn:
+            version = self._bump_version(conn, user_id)
+            conn.executemany(
+                "DELETE FROM favorites WHERE user_id = ? AND pokemon_id = ?",
+                [(user_id, pokemon_id) for pokemon_id in pokemon_ids]
+            )
+        return version
+
+    def save_all(self, favorites_by_user: dict):
+        """
+        Atomically replaces the stored favorites of every user in favorites_by_user.
+        """
+        with self._connect() as conn:
+            for user_id, favorites in favorites_by_user.items():
+                self._bump_version(conn, user_id)
+                self._replace_user(conn, user_id, favorites)
+
+    def _bump_version(self, conn, user_id) -> int:
+        # Written first, so the transaction holds the write lock before anything else is read
+        conn.execute(
+            "INSERT INTO favorites_versions (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1", (user_id,)
+        )
+        (version,) = conn.execute("SELECT version FROM favorites_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return version
+
+    def _replace_user(self, conn, user_id, favorites):
+        conn.execute("DELETE FROM favorites WHERE user_id = ?", (user_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO favorites (user_id, position, pokemon_id, name) VALUES (?, ?, ?, ?)",
+            [(user_id, position, pokemon["id"], pokemon["name"]) for position, pokemon in enumerate(favorites)]
+        )
+
+    def _migrate_json(self, json_path):
+        """
+        Imports the legacy user_favorites.json once, then renames it out of the way.
+        """
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, 'r') as f:
+                legacy_favorites = json.load(f)
+            self.save_all(legacy_favorites)
+            os.replace(json_path, json_path + ".migrated")
+            logger.info("Migrated favorites of %d users from %s", len(legacy_favorites), json_path)
+        except Exception as e:
+            logger.exception("Error migrating favorites from %s: %s", json_path, e)
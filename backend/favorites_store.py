@@ -0,0 +1,387 @@
+import time
+import logging
+import threading
+import telemetry
+from collections import OrderedDict
+from pokemon_index import normalize_name
+
+logger = logging.getLogger(__name__)
+
+class UserFavorites:
+    """
+    One user's favorites: an insertion-ordered map keyed by Pokémon ID with a
+    secondary index on the normalized name, so add, remove and membership
+    checks are O(1) by ID and by name.
+    """
+
+    def __init__(self, favorites=(), version: int = 0):
+        self._by_id = OrderedDict()
+        self._ids_by_name = {}  # normalized name -> {pokemon_id, ...}
+        self.reset(favorites, version)
+
+    def reset(self, favorites, version: int):
+        """
+        Replaces the contents with favorites ({"id", "name"} dicts) at version.
+        """
+        self._by_id.clear()
+        self._ids_by_name.clear()
+        for pokemon in favorites:
+            self.add(pokemon["id"], pokemon["name"])
+        self.version = version
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, pokemon_id):
+        return pokemon_id in self._by_id
+
+    def contains_name(self, name: str) -> bool:
+        return bool(self._ids_by_name.get(normalize_name(name)))
+
+    def add(self, pokemon_id: int, name: str) -> dict:
+        """
+        Adds a Pokémon at the end of the list.
+
+        Returns:
+            The added entry, or None if the ID was already present.
+        """
+        if pokemon_id in self._by_id:
+            return None
+        pokemon = {"id": pokemon_id, "name": name}
+        self._by_id[pokemon_id] = pokemon
+        self._ids_by_name.setdefault(normalize_name(name), set()).add(pokemon_id)
+        return pokemon
+
+    def remove(self, pokemon_id: int) -> dict:
+        """
+        Removes a Pokémon by ID.
+
+        Returns:
+            The removed entry, or None if the ID was not present.
+        """
+        pokemon = self._by_id.pop(pokemon_id, None)
+        if pokemon is not None:
+            key = normalize_name(pokemon["name"])
+            ids = self._ids_by_name.get(key)
+            if ids is not None:
+                ids.discard(pokemon_id)
+                if not ids:
+                    del self._ids_by_name[key]
+        return pokemon
+
+    def ids_for_name(self, name: str) -> list:
+        """
+        Returns the IDs of all entries whose name matches name after normalization.
+        """
+        return list(self._ids_by_name.get(normalize_name(name), ()))
+
+    def to_list(self) -> list:
+        """
+        Returns the favorites as a list of {"id", "name"} dicts in insertion order.
+        """
+        return [dict(pokemon) for pokemon in self._by_id.values()]
+
+class FavoritesStore:
+    """
+    Thread-safe in-memory favorites keyed by user ID, persisted through a storage backend.
+
+    Operations for the same user are serialized by a per-user lock (one of
+    shard_count lock shards), while different users proceed in parallel.
+    Every change is written to storage before it is applied in memory, and
+    readers only ever receive copies taken under the user's lock.
+
+    A user's favorites are loaded from storage the first time they are
+    accessed, so startup doesn't depend on the number of stored users.
+
+    Listeners registered with add_listener are called with the user ID after
+    every change to that user's favorites.
+
+    Every change also gives the user's favorites a new version number, kept
+    by the storage next to the favorites. Together with the storage's
+    store_id, a version identifies one state of one user's favorites, so it
+    can be used as an HTTP ETag; wait_for_change blocks until it moves.
+
+    Several processes can share one storage. Before a user's favorites are
+    read or changed, their version is compared with the stored one, and
+    they are reloaded (and listeners notified) if another process changed
+    them. wait_for_change can't be woken by other processes, so it checks
+    the stored version every poll_interval seconds.
+    """
+
+    def __init__(self, storage, shard_count: int = 64, poll_interval: float = 1.0):
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self._favorites = {}  # user_id -> UserFavorites, for users accessed so far
+        self._dict_lock = threading.Lock()  # Guards adding/removing users and whole-store iteration
+        self._shards = [threading.Lock() for _ in range(shard_count)]
+        self._listeners = []
+        self._waiters = {}  # user_id -> {threading.Event, ...} of wait_for_change calls
+        self._waiters_lock = threading.Lock()
+        self.reloads = 0
+
+    @property
+    def store_id(self) -> str:
+        return self.storage.store_id
+
+    def _lock_for(self, user_id: str) -> threading.Lock:
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    def _user(self, user_id: str, keep_empty: bool = True) -> UserFavorites:
+        """
+        Returns a user's in-memory favorites, loading them on first access. Without
+        keep_empty, a user with no favorites is loaded but not kept in memory, so
+        reads for arbitrary user IDs don't accumulate.
+        """
+        user_favorites = self._favorites.get(user_id)
+        if user_favorites is not None:
+            return user_favorites
+        # Read outside the store-wide lock, so cold loads of different users don't wait for each other
+        version = self.storage.version(user_id)
+        loaded = UserFavorites(self.storage.load_user(user_id), version)
+        if not keep_empty and not len(loaded):
+            return loaded
+        with self._dict_lock:
+            # Another thread may have loaded the user meanwhile; the first copy wins
+            return self._favorites.setdefault(user_id, loaded)
+
+    def _refreshed(self, user_id: str) -> tuple:
+        # Called with the user's lock held. Returns the user's favorites, reloaded if another
+        # process changed them, and whether listeners have to be notified.
+        user_favorites = self._favorites.get(user_id)
+        if user_favorites is None:
+            user_favorites = self._user(user_id, keep_empty=False)
+            # Listeners may hold results from while this process had no favorites of the
+            # user in memory (e.g. cached answers), so a first load with favorites is a change
+            return user_favorites, len(user_favorites) > 0
+        version = self.storage.version(user_id)
+        if version == user_favorites.version:
+            return user_favorites, False
+        user_favorites.reset(self.storage.load_user(user_id), version)
+        self.reloads += 1
+        return user_favorites, True
+
+    def refresh(self, user_id: str) -> bool:
+        """
+        Reloads a user's favorites if another process changed them in storage,
+        and notifies the listeners if so.
+
+        Returns:
+            True if the favorites were reloaded.
+        """
+        with self._lock_for(user_id):
+            _, reloaded = self._refreshed(user_id)
+        if reloaded:
+            self._notify(user_id)
+        return reloaded
+
+    def add_listener(self, callback):
+        """
+        Registers callback(user_id), called after a user's favorites changed.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, user_id: str):
+        with self._waiters_lock:
+            waiters = list(self._waiters.get(user_id, ()))
+        for event in waiters:
+            event.set()
+        for callback in self._listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.exception("Error in favorites change listener: %s", e)
+
+    def load(self):
+        """
+        Replaces the in-memory contents with everything in storage.
+        Not needed for correctness, since users are loaded on first access.
+        """
+        versions = self.storage.versions()
+        loaded = {user_id: UserFavorites(favorites, versions.get(user_id, 0))
+                  for user_id, favorites in self.storage.load_all().items()}
+        with self._dict_lock:
+            self._favorites = loaded
+
+    def __contains__(self, user_id):
+        return user_id in self._favorites or self.storage.has_user(user_id)
+
+    def __len__(self):
+        # Only counts the users loaded so far
+        return len(self._favorites)
+
+    def ensure_user(self, user_id: str):
+        """
+        Kept for callers registering new users: a user without favorites reads as an
+        empty list and is only kept in memory and storage once they add one.
+        """
+
+    def _read(self, user_id: str, read):
+        # Returns read(user's favorites), reloading them first if another process changed them
+        with self._lock_for(user_id):
+            user_favorites, changed = self._refreshed(user_id)
+            result = read(user_favorites)
+        if changed:
+            self._notify(user_id)
+        return result
+
+    def get(self, user_id: str) -> list:
+        """
+        Returns a snapshot (copy) of a user's favorites.
+        """
+        return self._read(user_id, UserFavorites.to_list)
+
+    def count(self, user_id: str) -> int:
+        return self._read(user_id, len)
+
+    def version(self, user_id: str) -> int:
+        """
+        Returns the version of a user's favorites. Read it before the favorites
+        themselves, so the data is never older than the version it is sent with.
+        """
+        return self._read(user_id, lambda user_favorites: user_favorites.version)
+
+    def wait_for_change(self, user_id: str, version: int, timeout: float) -> int:
+        """
+        Blocks until the user's favorites are no longer at version, or until
+        timeout seconds have passed.
+
+        Returns:
+            The current version, equal to version if nothing changed.
+        """
+        event = threading.Event()
+        with self._waiters_lock:
+            self._waiters.setdefault(user_id, set()).add(event)
+        try:
+            deadline = time.monotonic() + timeout
+            # Checked after registering, so a change made in between still wakes us
+            current = self.version(user_id)
+            while current == version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Changes made by other processes don't set the event, so storage is checked as well
+                event.wait(min(remaining, self.poll_interval))
+                event.clear()
+                current = self.version(user_id)
+            return current
+        finally:
+            with self._waiters_lock:
+                waiters = self._waiters.get(user_id)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[user_id]
+
+    def waiting(self) -> int:
+        """
+        Returns the number of wait_for_change calls currently blocked.
+        """
+        with self._waiters_lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def contains(self, user_id: str, pokemon_id: int) -> bool:
+        return self._read(user_id, lambda user_favorites: pokemon_id in user_favorites)
+
+    def stats(self) -> dict:
+        return {"users_in_memory": len(self._favorites), "reloads": self.reloads, "change_feed_waiting": self.waiting()}
+
+    def snapshot_all(self) -> dict:
+        """
+        Returns a copy of every user's favorites, safe to serialize while writers run.
+        """
+        with self._dict_lock:
+            user_ids = list(self._favorites)
+        return {user_id: self.get(user_id) for user_id in user_ids}
+
+    def add(self, user_id: str, pokemons: list) -> list:
+        """
+        Adds Pokémon ({"id", "name"} dicts) to a user's favorites, skipping ones already present.
+
+        Returns:
+            The entries that were actually added.
+        """
+        with self._lock_for(user_id):
+            user_favorites, reloaded = self._refreshed(user_id)
+            new_pokemons = []
+            seen_ids = set()
+            for pokemon in pokemons:
+                if pokemon["id"] not in user_favorites and pokemon["id"] not in seen_ids:
+                    seen_ids.add(pokemon["id"])
+                    new_pokemons.append({"id": pokemon["id"], "name": pokemon["name"]})
+
+            if new_pokemons:
+                with telemetry.span("favorites.persist", operation="insert", count=len(new_pokemons)):
+                    version = self.storage.insert_favorites(user_id, new_pokemons)
+                with self._dict_lock:
+                    # A user read while they had no favorites wasn't kept in memory
+                    user_favorites = self._favorites.setdefault(user_id, user_favorites)
+                for pokemon in new_pokemons:
+                    user_favorites.add(pokemon["id"], pokemon["name"])
+                self._applied(user_id, user_favorites, version)
+        if new_pokemons or reloaded:
+            self._notify(user_id)
+        return new_pokemons
+
+    def _applied(self, user_id: str, user_favorites: UserFavorites, version: int):
+        # Called with the user's lock held, after a write that produced version. If another
+        # process wrote in between, the in-memory favorites miss its change and are reloaded.
+        if version == user_favorites.version + 1:
+            user_favorites.version = version
+        else:
+            user_favorites.reset(self.storage.load_user(user_id), version)
+            self.reloads += 1
+
+    def remove(self, user_id: str, pokemon_ids: list) -> list:
+        """
+        Removes Pokémon from a user's favorites by ID.
+
+        Returns:
+            The entries that were actually removed.
+        """
+        with self._lock_for(user_id):
+            user_favorites, reloaded = self._refreshed(user_id)
+            present_ids = [pokemon_id for pokemon_id in dict.fromkeys(pokemon_ids) if pokemon_id in user_favorites]
+            removed = []
+            if present_ids:
+                with telemetry.span("favorites.persist", operation="delete", count=len(present_ids)):
+                    version = self.storage.delete_favorites(user_id, present_ids)
+                removed = [user_favorites.remove(pokemon_id) for pokemon_id in present_ids]
+                self._applied(user_id, user_favorites, version)
+        if removed or reloaded:
+            self._notify(user_id)
+        return removed
+
+    def ids_for_names(self, user_id: str, names: list) -> dict:
+        """
+        Looks up a user's favorites by (normalized) name.
+
+        Returns:
+            A dict mapping each name to the list of matching Pokémon IDs (empty if none).
+        """
+        return self._read(user_id, lambda user_favorites: {name: user_favorites.ids_for_name(name) for name in names})
+
+    def remove_by_name(self, user_id: str, names: list) -> list:
+        """
+        Removes Pokémon from a user's favorites by (normalized) name.
+
+        Returns:
+            The entries that were actually removed.
+        """
+        matches = self.ids_for_names(user_id, names)
+        return self.remove(user_id, [pokemon_id for ids in matches.values() for pokemon_id in ids])
+
+    def save(self, user_id: str):
+        """
+        Persists the current favorites of one user.
+        """
+        with self._lock_for(user_id), telemetry.span("favorites.persist", operation="save_user"):
+            user_favorites = self._user(user_id)
+            user_favorites.version = self.storage.save_user(user_id, user_favorites.to_list())
+
+    def save_all(self):
+        """
+        Persists a consistent snapshot of every user's favorites.
+        """
+        snapshot = self.snapshot_all()
+        with telemetry.span("favorites.persist", operation="save_all", users=len(snapshot)):
+            self.storage.save_all(snapshot)
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for serving the backend with several worker processes:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Any worker can serve any request: chat sessions, tool results and favorites
+are kept in SQLite databases that all workers open, each worker checks the
+stored versions before using what it has in memory, and sessions are signed
+with the key from SECRET_KEY or SECRET_KEY_FILE. The databases need a local
+disk shared by the workers (SQLite's WAL mode doesn't work over network file
+systems), so this scales a single host or container.
+
+Settings are read from the environment:
+
+    WEB_CONCURRENCY    worker processes (default: 2 per CPU, at most 8)
+    GUNICORN_THREADS   threads per worker (default 48)
+    GUNICORN_BIND      address to listen on (default 0.0.0.0:5000)
+    GUNICORN_TIMEOUT   seconds before a silent worker is restarted (default 120)
+"""
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(min(2 * multiprocessing.cpu_count(), 8))))
+
+# Agent runs mostly wait on the model and PokeAPI, and every streamed answer and favorites
+# change feed holds a thread while it is open, so each worker serves requests from a thread pool.
+# Queries waiting for admission hold a thread too, and a favorites feed holds one for up to
+# FAVORITES_EVENTS_MAX_AGE seconds (300 by default). Keep threads above QUERY_MAX_CONCURRENT plus
+# QUERY_QUEUE_SIZE plus FAVORITES_EVENTS_MAX_STREAMS (8 + 16 + 8 by default), or open feeds and
+# queued queries take every thread and other requests wait unseen in the backlog.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '48'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# The app is imported in each worker, not in the master before forking: importing it starts
+# the warm-up thread and opens SQLite connections, neither of which survives a fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
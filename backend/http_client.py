@@ -0,0 +1,171 @@
+import time
+import threading
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while the upstream is considered down."""
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected for reset_timeout seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call should not be attempted.
+        """
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError("PokeAPI is unavailable, not retrying for now")
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._trial_in_flight or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+class PooledHttpClient:
+    """
+    Thread-safe HTTP client with keep-alive connection pooling, timeouts,
+    bounded retries with exponential backoff and a circuit breaker.
+
+    Each thread gets its own requests.Session, but all sessions share one
+    HTTPAdapter and therefore one connection pool per host. requests is only
+    imported when the first request is made, to keep startup fast.
+    """
+
+    def __init__(self, pool_size: int = 20, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 retries: int = 3, backoff_factor: float = 0.3, breaker: CircuitBreaker = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._adapter = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    def _get_adapter(self):
+        if self._adapter is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.pool_size,
+                        max_retries=Retry(
+                            total=self.retries,
+                            backoff_factor=self.backoff_factor,
+                            status_forcelist=(429, 500, 502, 503, 504),
+                            allowed_methods=frozenset(["GET", "HEAD"]),
+                            raise_on_status=False
+                        )
+                    )
+        return self._adapter
+
+    def _session(self) -> "requests.Session":
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            adapter = self._get_adapter()
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url: str, timeout=None) -> "requests.Response":
+        """
+        Sends a GET request through the pool.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            requests.RequestException: If the request failed after all retries.
+        """
+        self.breaker.before_call()
+        with self._lock:
+            self.requests += 1
+
+        # Any error counts as a failure, not only requests' own: a half-open
+        # breaker's trial must always be settled or the circuit never closes
+        try:
+            response = self._session().get(url, timeout=timeout or self.timeout)
+        except Exception:
+            self._record_failure()
+            raise
+
+        # Server errors count against the breaker; client errors (e.g. 404) don't
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+
+    def stats(self) -> dict:
+        """
+        Returns request, failure and connection reuse counters.
+        """
+        connections_opened = 0
+        pool_requests = 0
+        if self._adapter is not None:
+            poolmanager = self._adapter.poolmanager
+            for key in list(poolmanager.pools.keys()):
+                pool = poolmanager.pools.get(key)
+                if pool is not None:
+                    connections_opened += pool.num_connections
+                    pool_requests += pool.num_requests
+
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "connections_opened": connections_opened,
+                "connection_reuse_rate": 1 - connections_opened / pool_requests if pool_requests else 0.0,
+                "circuit_state": self.breaker.state,
+                "circuit_rejected": self.breaker.rejected,
+            }
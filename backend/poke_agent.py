@@ -1,18 +1,111 @@
-from locale import currency
 import dotenv
 dotenv.load_dotenv()
 
-from smolagents import ToolCallingAgent, OpenAIServerModel, tool
-import requests
+# smolagents (and the OpenAI client it pulls in) is imported on first use, not at import
+# time, so the app can start serving before the agent machinery is loaded.
 import uuid
+import json
 import os
+import time
+import logging
+import threading
+import functools
 import re
 import socket
+from typing import Optional
+import telemetry
 import favorites_service
+import pokeapi_client
+import pokemon_index
+import pokemon_projection
+import fast_path
+from chat_history import ChatHistory
+from chat_sessions import ChatSessionStore, SQLiteSessionBackend
+from agent_pool import AgentPool
+from admission import AdmissionController, SQLiteLeaseBackend
+from usage import UsageTracker, SQLiteUsageBackend, ECONOMY, BLOCKED
+from answer_cache import AnswerCache, load_vectorizer
+from tool_results import ToolResultStore
+
+logger = logging.getLogger(__name__)
 
 # Get Flask API URL from environment or use default
 FLASK_API_URL = os.environ.get('FLASK_API_URL', 'http://localhost:5000/api')
 
+# Stream model output token by token so partial answers can be forwarded to clients
+STREAM_MODEL_OUTPUT = os.environ.get('AGENT_STREAM_OUTPUTS', 'true').lower() in ('1', 'true', 'yes')
+
+# Maximum number of tool calls from a single model step that run in parallel
+MAX_TOOL_THREADS = int(os.environ.get('AGENT_MAX_TOOL_THREADS', '8'))
+
+# The model and the OpenAI-compatible API serving it (OPENAI_BASE_URL, e.g. bench/fake_openai.py;
+# unset uses the OpenAI API)
+AGENT_MODEL_ID = os.environ.get('AGENT_MODEL_ID', 'gpt-4o-mini')
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+
+# smolagents' console output: -1 off, 0 errors, 1 steps, 2 debug. It renders the
+# task and every step to stdout, so it is off unless needed for debugging.
+AGENT_VERBOSITY = int(os.environ.get('AGENT_VERBOSITY', '-1'))
+
+# Chat sessions are kept in SQLite so they survive restarts and can be shared
+# between worker processes; only the most recently used ones stay in memory.
+CHAT_SESSIONS_DB_PATH = os.environ.get('CHAT_SESSIONS_DB_PATH', os.path.join(os.path.dirname(__file__), 'chat_sessions.db'))
+CHAT_SESSIONS_MAX_IN_MEMORY = int(os.environ.get('CHAT_SESSIONS_MAX_IN_MEMORY', '256'))
+CHAT_SESSIONS_IDLE_TTL = float(os.environ.get('CHAT_SESSIONS_IDLE_TTL', '1800'))
+CHAT_SESSIONS_RETENTION_DAYS = float(os.environ.get('CHAT_SESSIONS_RETENTION_DAYS', '30'))
+
+# Tool outputs are stored once per distinct content; chats only reference them by hash
+TOOL_RESULTS_DB_PATH = os.environ.get('TOOL_RESULTS_DB_PATH', os.path.join(os.path.dirname(__file__), 'tool_results.db'))
+
+# Agents are shared between chats; this many are kept between runs
+AGENT_POOL_SIZE = int(os.environ.get('AGENT_POOL_SIZE', '8'))
+
+# Simple lookups ("show my favorites", "what type is Gengar") are answered without the LLM
+FAST_PATH_ENABLED = os.environ.get('FAST_PATH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Answers to repeated questions are served from a cache instead of running the agent.
+# ANSWER_CACHE_VECTORIZER enables similarity matching: "hashing" or a sentence-transformers model name.
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '1000'))
+ANSWER_CACHE_VECTORIZER = os.environ.get('ANSWER_CACHE_VECTORIZER', 'off')
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.92'))
+
+# Admission control for queries (per process): a chat runs one query at a time, a user at most
+# QUERY_MAX_PER_USER and the process at most QUERY_MAX_CONCURRENT. Others wait in a queue of
+# QUERY_QUEUE_SIZE (QUERY_MAX_QUEUED_PER_USER per user) for up to QUERY_QUEUE_TIMEOUT seconds.
+QUERY_MAX_CONCURRENT = int(os.environ.get('QUERY_MAX_CONCURRENT', '8'))
+QUERY_MAX_PER_USER = int(os.environ.get('QUERY_MAX_PER_USER', '2'))
+QUERY_QUEUE_SIZE = int(os.environ.get('QUERY_QUEUE_SIZE', '16'))
+QUERY_MAX_QUEUED_PER_USER = int(os.environ.get('QUERY_MAX_QUEUED_PER_USER', '4'))
+QUERY_QUEUE_TIMEOUT = float(os.environ.get('QUERY_QUEUE_TIMEOUT', '30'))
+# Across worker processes, a running query holds a lease row in the chat sessions database: a chat
+# runs one query at a time on all workers, and at most QUERY_MAX_CONCURRENT_TOTAL queries run on all
+# of them (0 for no limit beyond each worker's). Leases are renewed while a run makes progress and
+# expire QUERY_LEASE_TTL seconds after that, e.g. when a worker dies mid-run.
+QUERY_MAX_CONCURRENT_TOTAL = int(os.environ.get('QUERY_MAX_CONCURRENT_TOTAL', '0'))
+QUERY_LEASE_TTL = float(os.environ.get('QUERY_LEASE_TTL', '120'))
+
+# Model tokens are counted per chat and per user and day, and flushed to SQLite every
+# USAGE_FLUSH_INTERVAL seconds. MODEL_PRICES maps model IDs to [input, output] USD per million tokens.
+USAGE_DB_PATH = os.environ.get('USAGE_DB_PATH', os.path.join(os.path.dirname(__file__), 'usage.db'))
+USAGE_FLUSH_INTERVAL = float(os.environ.get('USAGE_FLUSH_INTERVAL', '10'))
+MODEL_PRICES = json.loads(os.environ.get('MODEL_PRICES') or '{"gpt-4o-mini": [0.15, 0.6]}')
+
+# Token budgets for agent runs (0 for none): per chat, and per user and UTC day. Past
+# BUDGET_SOFT_LIMIT of a budget, runs are cut to BUDGET_ECONOMY_MAX_STEPS steps and use
+# BUDGET_ECONOMY_MODEL_ID if set; once a budget is used up, queries get no agent run.
+CHAT_TOKEN_BUDGET = int(os.environ.get('CHAT_TOKEN_BUDGET', '0'))
+USER_DAILY_TOKEN_BUDGET = int(os.environ.get('USER_DAILY_TOKEN_BUDGET', '0'))
+BUDGET_SOFT_LIMIT = float(os.environ.get('BUDGET_SOFT_LIMIT', '0.8'))
+BUDGET_ECONOMY_MAX_STEPS = int(os.environ.get('BUDGET_ECONOMY_MAX_STEPS', '3'))
+BUDGET_ECONOMY_MODEL_ID = os.environ.get('BUDGET_ECONOMY_MODEL_ID') or None
+
+BUDGET_EXHAUSTED_MESSAGES = {
+    "chat": "This chat has used up its token budget. Please start a new chat to keep asking questions.",
+    "user": "You have used up today's token budget. Please come back tomorrow.",
+}
+
 SYSTEM_PROMPT = """
 You are a helpful Pokémon assistant named PokéGPT. 
 Format all your responses using Markdown for better readability.
@@ -48,6 +141,14 @@ Example requests:
 - "I don't like Charizard anymore, can you delete it?"
 - "Take Bulbasaur off my list"
 
+### Adding or Removing Several Favorites
+Use the update_favorites_bulk tool when a user asks to add or remove more than one Pokémon at once.
+Pass all of them in a single call instead of calling add_to_favorites or remove_from_favorites repeatedly.
+
+Example requests:
+- "Add Bulbasaur, Charmander and Squirtle to my favorites"
+- "Remove Pidgey and Rattata from my list"
+
 ### Viewing Favorites
 Use the get_user_favorites tool when a user asks to see their favorites list.
 
@@ -63,12 +164,12 @@ You have access to the following tools that you should use to help users:
 - get_ability_details: Get detailed information about a specific ability
 - add_to_favorites: Add a Pokémon to the user's favorites list
 - remove_from_favorites: Remove a Pokémon from the user's favorites list
+- update_favorites_bulk: Add and/or remove several Pokémon in one call
 - get_user_favorites: Get all favorites for a specific user
 
-The currency user's ID is {user_id}.
+The current user's ID is {user_id}.
 """
 
-@tool
 def get_pokemon_list() -> list:
     """
     This tool returns the list of all pokemons in this format:
@@ -87,44 +188,36 @@ def get_pokemon_list() -> list:
     Returns:
         A list of pokemons as list of dicts.
     """
-    response = requests.get("https://pokeapi.co/api/v2/pokemon?limit=151")
-    return response.json()["results"]
+    return pokeapi_client.get_json(pokeapi_client.POKEMON_LIST_PATH, "pokemon_list")["results"]
 
-@tool 
-def get_pokemon_details(id: int) -> dict:
+def get_pokemon_details(id: int, fields: Optional[str] = None) -> dict:
     """
-    This tool returns the details of a pokemon in this format:
+    This tool returns a compact summary of a pokemon in this format:
     {
-        "abilities": [...],
-        "base_experience": ...,
-        "cries": {...},
-        "forms": [...],
-        "height": ...,
-        "held_items": [...],
-        "id": ...,
-        "is_default": ...,
-        "location_area_encounters": ...,
-        "moves": [...],
-        "types": [...],
-        "weight": ...,
+        "id": 25,
+        "name": "pikachu",
+        "height": 4,
+        "weight": 60,
+        "base_experience": 112,
+        "types": ["electric"],
+        "abilities": [{"name": "static", "is_hidden": false}, ...],
+        "stats": {"hp": 35, "attack": 55, "defense": 40, ...},
+        "moves": ["mega-punch", "pay-day", ...],
+        "moves_total": 105
     }
 
+    Only the first 20 moves are listed; "moves_total" holds the full count.
+    Other available fields are: species, forms, held_items, sprites, cries, is_default, order.
+
     Args:
         id: The id of the pokemon.
+        fields: Optional comma-separated list of fields to return (e.g. "stats,types"). Leave empty for the default summary.
 
     Returns:
         The details of the pokemon in json format.
     """
-    response = requests.get(f"https://pokeapi.co/api/v2/pokemon/{id}")
-    # remove game indices
-    response_json = response.json()
-    response_json.pop("game_indices", None)
-    # remove version groups from moves
-    for move in response_json["moves"]:
-        move.pop("version_group_details", None)
-    return response_json
-
-@tool
+    return pokemon_projection.project_pokemon(pokeapi_client.get_json(f"pokemon/{id}", "pokemon"), fields)
+
 def get_ability_list() -> list:
     """
     This tool returns the list of all abilities in this format:
@@ -142,10 +235,8 @@ def get_ability_list() -> list:
     Returns:
         A list of abilities as list of dicts.
     """
-    response = requests.get("https://pokeapi.co/api/v2/ability?limit=400")
-    return response.json()["results"]
+    return pokeapi_client.get_json(pokeapi_client.ABILITY_LIST_PATH, "ability_list")["results"]
 
-@tool
 def get_ability_details(id: int) -> dict:
     """
     This tool returns the details of an ability in this format:
@@ -170,10 +261,8 @@ def get_ability_details(id: int) -> dict:
     Returns:
         The details of the ability in json format.
     """
-    response = requests.get(f"https://pokeapi.co/api/v2/ability/{id}")
-    return response.json()
+    return pokeapi_client.get_json(f"ability/{id}", "ability")
 
-@tool
 def add_to_favorites(pokemon: str, user_id: str) -> str:
     """
     Add a Pokémon to the user's favorites list.
@@ -201,33 +290,15 @@ def add_to_favorites(pokemon: str, user_id: str) -> str:
     Returns:
         A confirmation message with the result of the operation, including the user ID.
     """
-    print(f"\n=== TOOL CALLED: add_to_favorites ===")
-    print(f"Pokemon: {pokemon}")
-    print(f"User ID: {user_id}")
-    print(f"======================================\n")
-    
     try:
-        # Normalize the pokemon name (lowercase and remove spaces)
-        normalized_name = pokemon.lower().strip()
-        
-        # Fetch the pokemon list to get the correct ID
-        pokemon_list = get_pokemon_list()
-        
-        # Find the pokemon in the list
-        pokemon_data = None
-        pokemon_id = None
-        
-        for entry in pokemon_list:
-            if entry["name"].lower() == normalized_name:
-                pokemon_data = entry
-                # Extract ID from the URL (format: https://pokeapi.co/api/v2/pokemon/{id}/)
-                url_parts = entry["url"].rstrip('/').split('/')
-                pokemon_id = int(url_parts[-1])
-                break
+        # Look up the official ID in the name index (handles "Mr. Mime", "farfetch'd", ...)
+        match = pokemon_index.find_pokemon(pokemon)
         
-        if not pokemon_id:
+        if not match:
             return f"I couldn't find **{pokemon}** in the Pokémon database. Please check the spelling and try again."
         
+        pokemon_id, _ = match
+        
         # Now add to favorites with the correct ID
         result = favorites_service.add_favorite(pokemon_name=pokemon, pokemon_id=pokemon_id, user_id=user_id)
         
@@ -235,10 +306,9 @@ def add_to_favorites(pokemon: str, user_id: str) -> str:
         return f"Successfully added **{pokemon}** to your favorites! {user_id_str}"
         
     except Exception as e:
-        print(f"Error adding to favorites: {e}")
+        logger.exception("Error adding %s to favorites of user %s", pokemon, user_id)
         return f"I encountered an error while adding **{pokemon}** to your favorites. Please try again. Error: {str(e)}"
 
-@tool
 def remove_from_favorites(pokemon: str, user_id: str) -> str:
     """
     Remove a Pokémon from the user's favorites list by name.
@@ -262,11 +332,6 @@ def remove_from_favorites(pokemon: str, user_id: str) -> str:
     Returns:
         A confirmation message with the result of the operation.
     """
-    print(f"\n=== TOOL CALLED: remove_from_favorites ===")
-    print(f"Pokemon: {pokemon}")
-    print(f"User ID: {user_id}")
-    print(f"======================================\n")
-    
     try:
         result = favorites_service.remove_favorite_by_name(pokemon_name=pokemon, user_id=user_id)
         
@@ -276,10 +341,47 @@ def remove_from_favorites(pokemon: str, user_id: str) -> str:
             return f"{result['message']}. Please check the spelling and try again."
             
     except Exception as e:
-        print(f"Error removing from favorites: {e}")
+        logger.exception("Error removing %s from favorites of user %s", pokemon, user_id)
         return f"I encountered an error while removing **{pokemon}** from your favorites. Please try again. Error: {str(e)}"
 
-@tool
+def update_favorites_bulk(user_id: str, add: Optional[list] = None, remove: Optional[list] = None) -> str:
+    """
+    Add and/or remove many Pokémon in the user's favorites list in a single call.
+    
+    Use this tool instead of calling add_to_favorites or remove_from_favorites
+    repeatedly whenever a user asks to add or remove more than one Pokémon, e.g.:
+    - "Add Bulbasaur, Charmander and Squirtle to my favorites"
+    - "Remove all the fire types I saved"
+    - "Replace Pikachu with Raichu in my favorites"
+    
+    Pokémon can be given by name or by Pokédex number. All changes are saved at once.
+    
+    Args:
+        user_id: The user ID whose favorites to update. IMPORTANT: Always pass the user_id
+                 from the context to ensure favorites are saved to the correct account.
+        add: Optional list of Pokémon names or IDs to add to the favorites.
+        remove: Optional list of Pokémon names or IDs to remove from the favorites.
+        
+    Returns:
+        A summary listing which Pokémon were added or removed and which could not be.
+    """
+    lines = []
+    try:
+        if remove:
+            result = favorites_service.remove_favorites_bulk(pokemon=remove, user_id=user_id)
+            lines += [f"- {'Removed' if r['success'] else 'Not removed'} **{r['input']}**: {r['message']}" for r in result["results"]]
+        if add:
+            result = favorites_service.add_favorites_bulk(pokemon=add, user_id=user_id)
+            lines += [f"- {'Added' if r['success'] else 'Not added'} **{r['input']}**: {r['message']}" for r in result["results"]]
+        
+        count = favorites_service.get_user_favorites(user_id=user_id)["favorites_count"]
+        lines.append(f"You now have {count} Pokémon in your favorites. (User ID: {user_id})")
+        return "\n".join(lines)
+        
+    except Exception as e:
+        logger.exception("Error updating favorites of user %s in bulk", user_id)
+        return f"I encountered an error while updating your favorites. Please try again. Error: {str(e)}"
+
 def get_user_favorites(user_id: str) -> dict:
     """
     Get all favorites for a specific user.
@@ -298,15 +400,11 @@ def get_user_favorites(user_id: str) -> dict:
     Returns:
         A dictionary containing the user's favorites information.
     """
-    print(f"\n=== TOOL CALLED: get_user_favorites ===")
-    print(f"User ID: {user_id}")
-    print(f"======================================\n")
-    
     try:
         result = favorites_service.get_user_favorites(user_id=user_id)
         return result
     except Exception as e:
-        print(f"Error getting user favorites: {e}")
+        logger.exception("Error getting favorites of user %s", user_id)
         return {
             "error": f"Failed to retrieve favorites: {str(e)}",
             "user_id": user_id,
@@ -314,54 +412,290 @@ def get_user_favorites(user_id: str) -> dict:
             "favorites": []
         }
 
+# The functions exposed to the agent as tools; they are wrapped with smolagents' @tool when the first agent is built
+TOOL_FUNCTIONS = [
+    get_pokemon_list, 
+    get_pokemon_details, 
+    get_ability_list, 
+    get_ability_details,
+    add_to_favorites,
+    remove_from_favorites,
+    update_favorites_bulk,
+    get_user_favorites
+]
+
+tool_output_chars = telemetry.histogram(
+    "pokegpt_tool_output_chars", "Size of tool outputs returned to the model", telemetry.SIZE_BUCKETS
+)
+model_tokens = telemetry.counter("pokegpt_model_tokens_total", "Model tokens used by agent runs, by direction")
+
+def _run_usage(budget_mode: str = "full") -> dict:
+    """The usage reported with an answer; answers that didn't run the agent used no tokens"""
+    return {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "budget_mode": budget_mode, "stopped": False}
+
+_ANSWER_ARGUMENT = re.compile(r'"answer"\s*:\s*"')
+
+class _FinalAnswerStream:
+    """
+    Follows the tool calls streamed by the model during one step and decodes
+    the "answer" argument of a final_answer call as it arrives, so the answer
+    text can be forwarded before the call is complete. ToolCallingAgent models
+    answer through that call rather than with plain text.
+    """
+
+    def __init__(self):
+        self._names = {}  # tool call index -> tool name
+        self._arguments = {}  # tool call index -> arguments received so far
+        self._sent = {}  # tool call index -> answer characters already returned
+
+    def feed(self, tool_call_deltas) -> str:
+        """
+        Adds tool call deltas and returns the answer text they completed, or "".
+        """
+        text = ""
+        for delta in tool_call_deltas or []:
+            index = delta.index or 0
+            if delta.function is None:
+                continue
+            if delta.function.name:
+                self._names[index] = delta.function.name
+            self._arguments[index] = self._arguments.get(index, "") + (delta.function.arguments or "")
+            if self._names.get(index) != "final_answer":
+                continue
+            answer = self._decoded_answer(self._arguments[index])
+            text += answer[self._sent.get(index, 0):]
+            self._sent[index] = len(answer)
+        return text
+
+    @staticmethod
+    def _decoded_answer(arguments: str) -> str:
+        found = _ANSWER_ARGUMENT.search(arguments)
+        if found is None:
+            return ""
+        body = arguments[found.end():]
+        # The JSON string up to its closing quote, or up to the last complete escape sequence
+        end = i = 0
+        while i < len(body) and body[i] != '"':
+            length = (6 if body[i + 1:i + 2] == 'u' else 2) if body[i] == '\\' else 1
+            if i + length > len(body):
+                break
+            i += length
+            end = i
+        try:
+            answer = json.loads('"' + body[:end] + '"')
+        except ValueError:
+            return ""
+        # Half of a surrogate pair waits for the other half
+        return answer[:-1] if answer and '\ud800' <= answer[-1] <= '\udbff' else answer
+
+def _traced_tool(function):
+    """Wraps a tool function so each call is traced with the size of its output"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with telemetry.span("tool.call", tool=function.__name__) as call:
+            output = function(*args, **kwargs)
+            size = len(str(output))
+            call.set(output_chars=size)
+            tool_output_chars.observe(size, tool=function.__name__)
+            return output
+    return wrapper
+
+def _create_model(model_id: str, api_base: str = None):
+    """Builds the OpenAI model client; every model call is traced as a model.generate span"""
+    from smolagents import OpenAIServerModel
+
+    class TracedOpenAIServerModel(OpenAIServerModel):
+        def generate(self, *args, **kwargs):
+            with telemetry.span("model.generate", model=self.model_id) as call:
+                message = super().generate(*args, **kwargs)
+                if message.token_usage is not None:
+                    call.set(input_tokens=message.token_usage.input_tokens,
+                             output_tokens=message.token_usage.output_tokens)
+                return message
+
+        def generate_stream(self, *args, **kwargs):
+            # Not made current: the agent's own code runs between the chunks
+            call = telemetry.start_span("model.generate", model=self.model_id, stream=True)
+            input_tokens = output_tokens = 0
+            error = None
+            try:
+                for event in super().generate_stream(*args, **kwargs):
+                    if "first_chunk_seconds" not in call.attributes:
+                        call.set(first_chunk_seconds=round(call.duration, 4))
+                    if event.token_usage is not None:
+                        input_tokens += event.token_usage.input_tokens
+                        output_tokens += event.token_usage.output_tokens
+                    yield event
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                call.set(input_tokens=input_tokens, output_tokens=output_tokens)
+                call.finish(error=error)
+
+    return TracedOpenAIServerModel(model_id=model_id, api_base=api_base)
+
 class PokemonAgent:
     def __init__(self):
-        # Initialize the model with default settings
-        self.model = OpenAIServerModel(model_id='gpt-4o-mini')
-        self.tools = [
-            get_pokemon_list, 
-            get_pokemon_details, 
-            get_ability_list, 
-            get_ability_details,
-            add_to_favorites,
-            remove_from_favorites,
-            get_user_favorites
-        ]
-        self.chats = {}  # Dictionary to store chat sessions
-        self.tool_calls = []  # Add storage for tool calls
+        # The model client and the tools are created on first use (see the model and tools properties)
+        self._model = None
+        self._tools = None
+        self._init_lock = threading.Lock()
+        # Chat sessions: a bounded in-memory LRU backed by SQLite
+        self.chats = ChatSessionStore(
+            serialize=self._serialize_chat,
+            deserialize=self._deserialize_chat,
+            backend=SQLiteSessionBackend(CHAT_SESSIONS_DB_PATH),
+            max_sessions=CHAT_SESSIONS_MAX_IN_MEMORY,
+            idle_ttl=CHAT_SESSIONS_IDLE_TTL
+        )
+        self.tool_results = ToolResultStore(TOOL_RESULTS_DB_PATH)
+        retention = CHAT_SESSIONS_RETENTION_DAYS * 24 * 60 * 60
+        purged = self.chats.purge(retention)
+        if purged:
+            logger.info("Purged %d chat sessions older than %s days", purged, CHAT_SESSIONS_RETENTION_DAYS)
+        self.tool_results.delete_older_than(time.time() - retention)
+        # Token usage of agent runs, per chat and per user, checked against the budgets
+        self.usage = UsageTracker(
+            SQLiteUsageBackend(USAGE_DB_PATH),
+            prices=MODEL_PRICES,
+            chat_budget=CHAT_TOKEN_BUDGET,
+            user_daily_budget=USER_DAILY_TOKEN_BUDGET,
+            soft_limit=BUDGET_SOFT_LIMIT,
+            flush_interval=USAGE_FLUSH_INTERVAL
+        )
+        self.usage.purge(retention)
+        self._economy_model = None
+        # Agents are built on the first query and reused across chats
+        self.agents = AgentPool(self._build_agent, max_idle=AGENT_POOL_SIZE)
+        # Queries wait here for a run slot, so concurrent queries never share a chat's history
+        self.admission = AdmissionController(
+            max_concurrent=QUERY_MAX_CONCURRENT,
+            max_per_user=QUERY_MAX_PER_USER,
+            max_queue=QUERY_QUEUE_SIZE,
+            max_queued_per_user=QUERY_MAX_QUEUED_PER_USER,
+            queue_timeout=QUERY_QUEUE_TIMEOUT,
+            leases=SQLiteLeaseBackend(CHAT_SESSIONS_DB_PATH),
+            max_total=QUERY_MAX_CONCURRENT_TOTAL,
+            lease_ttl=QUERY_LEASE_TTL
+        )
+
+        # Cached answers; personal ones are dropped when the user's favorites change
+        self.answers = None
+        if ANSWER_CACHE_ENABLED:
+            self.answers = AnswerCache(
+                ttl=ANSWER_CACHE_TTL,
+                max_entries=ANSWER_CACHE_SIZE,
+                vectorizer=load_vectorizer(ANSWER_CACHE_VECTORIZER),
+                threshold=ANSWER_CACHE_SIMILARITY,
+                entities=self._mentioned_pokemon
+            )
+            favorites_service.on_favorites_changed(self.answers.invalidate_user)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._init_lock:
+                if self._model is None:
+                    self._model = _create_model(AGENT_MODEL_ID, OPENAI_BASE_URL)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    @property
+    def economy_model(self):
+        """The model for runs past a budget's soft limit: BUDGET_ECONOMY_MODEL_ID, or the usual one"""
+        if BUDGET_ECONOMY_MODEL_ID is None:
+            return self.model
+        if self._economy_model is None:
+            with self._init_lock:
+                if self._economy_model is None:
+                    self._economy_model = _create_model(BUDGET_ECONOMY_MODEL_ID, OPENAI_BASE_URL)
+        return self._economy_model
+
+    @property
+    def tools(self) -> list:
+        if self._tools is None:
+            with self._init_lock:
+                if self._tools is None:
+                    from smolagents import tool
+                    self._tools = [tool(_traced_tool(function)) for function in TOOL_FUNCTIONS]
+        return self._tools
+
+    def _build_agent(self):
+        from smolagents import ToolCallingAgent
+        from smolagents.monitoring import AgentLogger, LogLevel
+        from rich.console import Console
+        # Streamed model output is rendered live to the console whatever the log level,
+        # so with the output off the console itself is silenced
+        logger = AgentLogger(level=LogLevel(AGENT_VERBOSITY), console=Console(quiet=AGENT_VERBOSITY < 0, highlight=False))
+        return ToolCallingAgent(
+            tools=self.tools, 
+            model=self.model,
+            stream_outputs=STREAM_MODEL_OUTPUT,
+            max_tool_threads=MAX_TOOL_THREADS,
+            logger=logger
+        )
+
+    def _mentioned_pokemon(self, query: str) -> frozenset:
+        try:
+            return frozenset(pokemon_id for pokemon_id, _ in pokemon_index.find_mentions(query))
+        except Exception:
+            # Without the index, a query only ever matches itself
+            return frozenset([query])
+
+    def _serialize_chat(self, chat: dict) -> dict:
+        """Convert a chat session to JSON-serializable state"""
+        return {
+            "history": chat["history"].to_dict(),
+            "owner_id": chat["owner_id"],
+            "tool_calls": chat["tool_calls"]
+        }
+
+    def _deserialize_chat(self, state: dict) -> dict:
+        """Rebuild a chat session from its serialized state"""
+        return {
+            "history": ChatHistory.from_dict(state["history"]),
+            "owner_id": state["owner_id"],
+            "tool_calls": [self._as_reference(tool_call) for tool_call in state.get("tool_calls", [])]
+        }
+
+    def _as_reference(self, tool_call: dict) -> dict:
+        # Sessions saved before the result store kept the full output inline
+        if "output" in tool_call:
+            return self.tool_results.reference(tool_call["tool_name"], tool_call["parameters"], tool_call["output"])
+        return tool_call
 
     def create_chat(self, user_id=None):
         """Create a new chat session with a unique ID"""
-        print(f"Creating chat session for user {user_id}")
         chat_id = str(uuid.uuid4())
         
         # Create a custom system message that emphasizes using tools
         system_message = SYSTEM_PROMPT.format(user_id=user_id)
         
+        # No agent is built here; one is taken from the pool when the chat gets its first query
         self.chats[chat_id] = {
-            "agent": ToolCallingAgent(
-                tools=self.tools, 
-                model=self.model
-            ),
-            "history": [{
-                "role": "system",
-                "content": system_message
-            }],  # Initialize with enhanced system prompt
+            "history": ChatHistory(system_message),  # Windowed history with a rolling summary
             "owner_id": user_id,  # Associate this chat with a specific user
             "tool_calls": [] # Add a list to store tool calls for the session
         }
-        
-        if user_id:
-            print(f"Chat {chat_id} created and associated with user {user_id}")
-        
+        logger.debug("Created chat %s for user %s", chat_id, user_id)
         return chat_id
     
-    def run(self, chat_id: str, query: str, user_context: dict = None) -> str:
-        """Run a query in a specific chat session and store the interaction"""
-        if chat_id not in self.chats:
+    def _get_chat(self, chat_id: str) -> dict:
+        """Get a chat session, loading it from storage if needed"""
+        chat = self.chats.get(chat_id)
+        if chat is None:
             raise ValueError(f"Chat session {chat_id} does not exist")
-        
-        chat = self.chats[chat_id]
+        return chat
+
+    def _get_owned_chat(self, chat_id: str, user_context: dict = None) -> dict:
+        """Get a chat session, checking that the query comes from its owner"""
+        chat = self._get_chat(chat_id)
             
         # Check if this query is from the chat owner
         current_user_id = user_context.get('current_user_id') if user_context else None
@@ -369,64 +703,275 @@ class PokemonAgent:
         if current_user_id != chat.get('owner_id'):
             raise ValueError(f"User {current_user_id} is not the owner of chat {chat_id}")
         
-        print(f"System message: {chat['history'][0]['content']}")
+        return chat
 
-        print(f"\n[QUERY] {query}")
-        
-        # Call the agent's run method - this handles the entire conversation including tool calls
-        print(f"[AGENT] Sending query to model")
-        
+    def run(self, chat_id: str, query: str, user_context: dict = None) -> dict:
+        """Run a query in a specific chat session and store the interaction"""
+        result = None
+        events = self.run_stream(chat_id, query, user_context)
+        try:
+            for event in events:
+                if event["event"] == "final_answer":
+                    result = event["data"]
+        finally:
+            events.close()
+        return result
+
+    def run_stream(self, chat_id: str, query: str, user_context: dict = None):
+        """
+        Run a query in a specific chat session, yielding events as the agent works.
+
+        The chat and its owner are checked and the query is admitted before the
+        iterator is returned, so a ValueError (unknown chat or wrong owner) or an
+        AdmissionRejected (too many queries waiting) is raised right away rather
+        than on first iteration. The query holds its run slot until the events
+        are exhausted or the iterator is closed, so close it if you stop early.
+
+        Each event is a dict with an "event" name and a "data" payload:
+        - tool_call_started: {"id", "tool_name", "parameters"}
+        - tool_call_finished: {"id", "tool_name", "parameters", "output"}
+        - partial_answer: {"text"}, a chunk of the answer as the model produces it, from plain text
+          output or from the answer argument of a final_answer tool call
+        - final_answer: {"response", "tool_calls", "cached", "fast_path", "usage"}, always the last event;
+          usage has the run's "input_tokens", "output_tokens" and "cost_usd", the "budget_mode" it ran
+          in ("full", "economy" or "blocked") and whether a budget "stopped" it
+        """
+        chat = self._get_owned_chat(chat_id, user_context)
+        with telemetry.span("admission.wait", chat_id=chat_id):
+            slot = self.admission.acquire(chat_id, chat.get("owner_id"))
+        try:
+            # Fetched again: a query that ran in this chat while we waited may have changed it
+            chat = self._get_chat(chat_id)
+        except Exception:
+            slot.release()
+            raise
+        # The generator may run after the caller's span has ended (e.g. a streamed response), so pass it on explicitly
+        return slot.hold(self._stream_run(chat_id, chat, query, telemetry.current_span()))
+
+    def _stream_run(self, chat_id: str, chat: dict, query: str, parent=None):
+        with telemetry.span("chat.query", parent=parent, chat_id=chat_id) as query_span:
+            for event in self._answer_query(chat_id, chat, query):
+                if event["event"] == "final_answer":
+                    query_span.set(cached=event["data"]["cached"], fast_path=event["data"]["fast_path"],
+                                   tool_calls=len(event["data"]["tool_calls"]))
+                yield event
+
+    def _answer_query(self, chat_id: str, chat: dict, query: str):
+        logger.debug("Query in chat %s: %s", chat_id, query)
         response = ""
         tool_calls_this_turn = []
+        failed = False
+
+        routed = fast_path.answer(query, chat["owner_id"]) if FAST_PATH_ENABLED else None
+        if routed is not None:
+            for index, result in enumerate(routed["tool_calls"]):
+                call_id = f"fast-path-{index}"
+                yield {"event": "tool_call_started", "data": {"id": call_id, "tool_name": result["tool_name"], "parameters": result["parameters"]}}
+                tool_call = self._as_reference(result)
+                tool_calls_this_turn.append(tool_call)
+                chat["tool_calls"].append(tool_call)
+                yield {"event": "tool_call_finished", "data": dict(tool_call, id=call_id)}
+            chat["history"].add_turn(query, routed["response"])
+            self.chats.save(chat_id, chat)
+            yield {
+                "event": "final_answer",
+                "data": {"response": routed["response"], "tool_calls": tool_calls_this_turn, "cached": False, "fast_path": True,
+                         "usage": _run_usage()}
+            }
+            return
 
+        # Cached answers are keyed on the query alone, so only a chat's first question, which the
+        # model sees without any earlier turns, may be answered from or stored in the cache
+        use_cache = self.answers is not None and not chat["history"].turns
+        if use_cache and chat["owner_id"]:
+            # Drops the user's cached answers if another worker process changed their favorites
+            favorites_service.refresh_favorites(chat["owner_id"])
+        cached = self.answers.get(query, chat["owner_id"]) if use_cache else None
+        if cached is not None:
+            logger.debug("Answer for chat %s served from cache", chat_id)
+            # The cached tool calls become this chat's too, so their full outputs can be fetched from it
+            tool_calls_this_turn = [dict(self._as_reference(tool_call)) for tool_call in cached["tool_calls"]]
+            chat["tool_calls"].extend(tool_calls_this_turn)
+            self.tool_results.touch(tool_call["output_hash"] for tool_call in tool_calls_this_turn)
+            chat["history"].add_turn(query, cached["response"])
+            self.chats.save(chat_id, chat)
+            yield {
+                "event": "final_answer",
+                "data": {"response": cached["response"], "tool_calls": tool_calls_this_turn, "cached": True, "fast_path": False,
+                         "usage": _run_usage()}
+            }
+            return
 
-        merged_query = str("Chat Context: " + str(chat["history"]) + "\n" + "User Query: " + query)
+        # Only agent runs use tokens, so the budgets are checked once the cheaper answers are ruled out
+        budget = self.usage.budget(chat_id, chat["owner_id"])
+        run_usage = _run_usage(budget["mode"])
+        if budget["mode"] == BLOCKED:
+            logger.info("Query in chat %s blocked: %s token budget used up", chat_id, budget["limit"])
+            response = BUDGET_EXHAUSTED_MESSAGES[budget["limit"]]
+            chat["history"].add_turn(query, response)
+            self.chats.save(chat_id, chat)
+            yield {
+                "event": "final_answer",
+                "data": {"response": response, "tool_calls": [], "cached": False, "fast_path": False, "usage": run_usage}
+            }
+            return
+
+        # Only the rolling summary and the recent turns are sent along with the query
+        task = chat["history"].build_context(query)
+        agent = None
+        run = None
+        counted_steps = set()
+        answer_stream = _FinalAnswerStream()
+        from smolagents import ToolOutput, FinalAnswerStep, ChatMessageStreamDelta, ActionStep
+        from smolagents.memory import ToolCall
+        # Each agent step gets a span that is current while the step runs, so the model
+        # and tool spans of the step (including tools run in the executor threads) nest under it
+        run_span = telemetry.start_span("agent.run")
+        step_span = telemetry.start_span("agent.step", parent=run_span)
+        span_token = telemetry.activate(step_span)
         try:
-            # Use stream=True to get intermediate steps
-            for step in chat["agent"].run(merged_query, stream=True):
-                # The 'step' is an ActionStep object. We need to inspect its attributes.
-                # Based on smolagents, the tool call info is in the 'action' attribute of the step's model_output_message.
-                if hasattr(step, 'model_output_message') and step.model_output_message and hasattr(step.model_output_message, 'tool_calls') and step.model_output_message.tool_calls:
-                    for tool_call_data in step.model_output_message.tool_calls:
-                        tool_call = {
-                            "tool_name": tool_call_data.function.name,
-                            "parameters": tool_call_data.function.arguments,
-                            "output": step.observations or "No output captured."
-                        }
-                        tool_calls_this_turn.append(tool_call)
-                        chat["tool_calls"].append(tool_call)  # Persist to chat session
-
-                if hasattr(step, 'action_output') and step.action_output:
-                    response = str(step.action_output)
-
-            # If the final step didn't have action_output, the result might be the step itself
+            # The system prompt is passed as the agent's instructions, so it is sent once per query.
+            # run() resets the agent's memory, so a pooled agent carries nothing over from other chats.
+            agent = self.agents.acquire()
+            agent.instructions = chat["history"].system_prompt
+            # Close to a budget, the run is shorter and may use a cheaper model. Set on every run,
+            # so a pooled agent doesn't keep the economy model.
+            economy = budget["mode"] == ECONOMY
+            agent.model = self.economy_model if economy else self.model
+            max_steps = BUDGET_ECONOMY_MAX_STEPS if economy else None
+
+            # Use stream=True to get the tool calls, outputs and text chunks as they happen
+            run = agent.run(task, stream=True, reset=True, max_steps=max_steps)
+            for step in run:
+                if isinstance(step, ToolCall):
+                    yield {
+                        "event": "tool_call_started",
+                        "data": {"id": step.id, "tool_name": step.name, "parameters": step.arguments}
+                    }
+                elif isinstance(step, ToolOutput):
+                    # Only a reference to the output is kept in the session and sent to clients
+                    tool_call = self.tool_results.reference(
+                        step.tool_call.name, step.tool_call.arguments, step.observation or "No output captured."
+                    )
+                    tool_calls_this_turn.append(tool_call)
+                    chat["tool_calls"].append(tool_call)  # Persist to chat session
+                    yield {"event": "tool_call_finished", "data": dict(tool_call, id=step.id)}
+
+                    if step.is_final_answer and step.output is not None:
+                        response = str(step.output)
+                elif isinstance(step, ChatMessageStreamDelta):
+                    text = (step.content or "") + answer_stream.feed(step.tool_calls)
+                    if text:
+                        yield {"event": "partial_answer", "data": {"text": text}}
+                elif isinstance(step, FinalAnswerStep):
+                    if step.output is not None:
+                        response = str(step.output)
+                elif isinstance(step, ActionStep):
+                    self._finish_step_span(step, step_span)
+                    self._record_step_usage(step, chat_id, chat["owner_id"], agent.model.model_id, run_usage, counted_steps)
+                    step_span = telemetry.start_span("agent.step", parent=run_span)
+                    telemetry.activate(step_span)
+                    # Tool call indexes start over with every model call
+                    answer_stream = _FinalAnswerStream()
+                    # A run that uses up the rest of a budget stops after the step
+                    used = run_usage["input_tokens"] + run_usage["output_tokens"]
+                    if budget["remaining_tokens"] is not None and used >= budget["remaining_tokens"] and not response:
+                        logger.info("Agent run in chat %s stopped: %s token budget used up", chat_id, budget["limit"])
+                        run_usage["stopped"] = True
+                        response = BUDGET_EXHAUSTED_MESSAGES[budget["limit"]]
+                        break
+
+            # If the run ended without a final answer, summarize what was done
             if not response and tool_calls_this_turn:
                 response = f"I've used the following tools: {', '.join([tc['tool_name'] for tc in tool_calls_this_turn])}."
 
         except Exception as e:
-            print(f"[ERROR] Error during model call: {e}")
+            logger.exception("Error during agent run in chat %s", chat_id)
             response = f"I apologize, but I encountered an error processing your request. Error details: {str(e)}"
-        
-        # Store the query and response in history
-        chat["history"].append({"role": "user", "content": query})
-        chat["history"].append({"role": "assistant", "content": response})
-        
-        print(f"\n[RESPONSE] {response}")
-        
-        # Return the response and the tool calls for this turn
-        return {
-            "response": response,
-            "tool_calls": tool_calls_this_turn
+            failed = True
+            run_span.error = f"{type(e).__name__}: {e}"
+        finally:
+            # The span opened for a step that never came is dropped
+            telemetry.deactivate(span_token)
+            if run is not None:
+                try:
+                    run.close()
+                except RuntimeError as e:
+                    # smolagents' run yields once more when closed mid-step (e.g. the client disconnected);
+                    # the agent is reset by its next run, so it still goes back to the pool
+                    logger.debug("Agent run in chat %s did not close cleanly: %s", chat_id, e)
+            if agent is not None:
+                # Steps the run didn't yield, such as the final answer forced at max_steps, used tokens too
+                for step in agent.memory.steps:
+                    if isinstance(step, ActionStep):
+                        self._record_step_usage(step, chat_id, chat["owner_id"], agent.model.model_id, run_usage, counted_steps)
+                self.agents.release(agent)
+            run_span.set(input_tokens=run_usage["input_tokens"], output_tokens=run_usage["output_tokens"],
+                         budget_mode=run_usage["budget_mode"])
+            run_span.finish()
+
+        # Store the query and response in history and write the session through to storage
+        chat["history"].add_turn(query, response)
+        self.chats.save(chat_id, chat)
+
+        # A run stopped by a budget didn't answer the query, so there is nothing to cache
+        if use_cache and not failed and not run_usage["stopped"]:
+            self.answers.put(query, chat["owner_id"], response, tool_calls_this_turn)
+
+        logger.debug("Response in chat %s: %s", chat_id, response)
+
+        # The last event carries the response and the tool calls for this turn
+        yield {
+            "event": "final_answer",
+            "data": {
+                "response": response,
+                "tool_calls": tool_calls_this_turn,
+                "cached": False,
+                "fast_path": False,
+                "usage": run_usage
+            }
         }
     
+    def _finish_step_span(self, step, step_span):
+        """Completes the span of an agent step with the step's own timing and token usage"""
+        step_span.set(step=step.step_number, tool_calls=len(step.tool_calls or []))
+        if step.token_usage is not None:
+            step_span.set(input_tokens=step.token_usage.input_tokens, output_tokens=step.token_usage.output_tokens)
+        end = None
+        if step.timing is not None:
+            step_span.start = step.timing.start_time
+            end = step.timing.end_time
+        step_span.finish(end=end, error=step.error)
+
+    def _record_step_usage(self, step, chat_id: str, owner_id: str, model_id: str, run_usage: dict, counted: set):
+        """Records the tokens of an agent step once (smolagents may yield a step twice) and adds them to the run's usage"""
+        if step.token_usage is None or id(step) in counted:
+            return
+        counted.add(id(step))
+        input_tokens, output_tokens = step.token_usage.input_tokens, step.token_usage.output_tokens
+        model_tokens.inc(input_tokens, direction="input")
+        model_tokens.inc(output_tokens, direction="output")
+        cost = self.usage.record(chat_id, owner_id, model_id, input_tokens, output_tokens)
+        run_usage["input_tokens"] += input_tokens
+        run_usage["output_tokens"] += output_tokens
+        run_usage["cost_usd"] = round(run_usage["cost_usd"] + cost, 6)
+
+    def get_chat_usage(self, chat_id: str) -> dict:
+        """Get the token usage and cost of a chat session, and the budget left for its next query"""
+        chat = self._get_chat(chat_id)
+        return dict(self.usage.chat_usage(chat_id), budget=self.usage.budget(chat_id, chat.get("owner_id")))
+
+    def get_user_usage(self, user_id: str, days: int = 1) -> dict:
+        """Get a user's token usage and cost over the last days UTC days"""
+        return self.usage.user_usage(user_id, days)
+
     def get_chat_history(self, chat_id: str) -> list:
         """Get the chat history for a specific chat session"""
-        if chat_id not in self.chats:
-            raise ValueError(f"Chat session {chat_id} does not exist")
+        chat = self._get_chat(chat_id)
         
         # Return a simplified version of the history
         simplified_history = []
-        for message in self.chats[chat_id]["history"]:
+        for message in chat["history"].messages():
             # Skip temporary system messages about user context
             if message["role"] == "system" and "current user's ID is" in message.get("content", ""):
                 continue
@@ -445,34 +990,46 @@ class PokemonAgent:
         
         return simplified_history
     
-    def get_tool_calls(self, chat_id: str) -> list:
-        """Get all tool calls for a specific chat session"""
-        if chat_id not in self.chats:
-            raise ValueError(f"Chat session {chat_id} does not exist")
-        
-        return self.chats[chat_id].get("tool_calls", [])
+    def get_tool_calls(self, chat_id: str, offset: int = 0, limit: int = None) -> list:
+        """Get the tool calls of a chat session (references to their outputs), optionally a page of them"""
+        tool_calls = self._get_chat(chat_id).get("tool_calls", [])
+        end = None if limit is None else offset + limit
+        return tool_calls[offset:end]
+
+    def count_tool_calls(self, chat_id: str) -> int:
+        return len(self._get_chat(chat_id).get("tool_calls", []))
+
+    def get_tool_result(self, chat_id: str, output_hash: str) -> str:
+        """
+        Get the full output of a tool call made in a chat session.
+
+        Returns:
+            The output, or None if no tool call of the chat produced it.
+        """
+        if not any(call.get("output_hash") == output_hash for call in self._get_chat(chat_id).get("tool_calls", [])):
+            return None
+        return self.tool_results.get(output_hash)
         
     def get_chat_owner(self, chat_id: str) -> str:
         """Get the owner ID of a chat session"""
-        if chat_id not in self.chats:
-            raise ValueError(f"Chat session {chat_id} does not exist")
-            
-        return self.chats[chat_id].get("owner_id")
+        return self._get_chat(chat_id).get("owner_id")
 
 if __name__ == "__main__":
     agent = PokemonAgent()
     chat_id = agent.create_chat(user_id="123")
-    
-    # Example 1: Get Pikachu's abilities
-    print("\n===== EXAMPLE 1: GET POKEMON ABILITIES =====")
-    print(agent.run(chat_id, "What are the abilities of Pikachu?", user_context={'current_user_id': '123'}))
-    
-    # Example 2: Add to favorites
-    print("\n===== EXAMPLE 2: ADD POKEMON TO FAVORITES =====")
-    print(agent.run(chat_id, "Add Pikachu to my favorites", user_context={'current_user_id': '123'}))
-    
-    # Print all tool calls made during this session
-    print("\n===== ALL TOOL CALLS MADE =====")
-    for idx, call in enumerate(agent.tool_calls):
-        print(f"  {idx+1}. {call['tool']} - Args: {call['args']}")
 
+    examples = [
+        ("GET POKEMON ABILITIES", "What are the abilities of Pikachu?"),
+        ("ADD POKEMON TO FAVORITES", "Add Pikachu to my favorites"),
+    ]
+    for index, (title, query) in enumerate(examples, 1):
+        print(f"\n===== EXAMPLE {index}: {title} =====")
+        events = agent.run_stream(chat_id, query, user_context={'current_user_id': '123'})
+        try:
+            for event in events:
+                if event["event"] == "tool_call_finished":
+                    print(f"  Tool call: {event['data']['tool_name']} - Args: {event['data']['parameters']}")
+                elif event["event"] == "final_answer":
+                    print(event["data"]["response"])
+        finally:
+            events.close()
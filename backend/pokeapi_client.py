@@ -0,0 +1,185 @@
+import os
+import logging
+import threading
+import telemetry
+from pokeapi_cache import ResponseCache
+from http_client import PooledHttpClient, CircuitBreaker
+from pokedex_snapshot import PokedexSnapshot, DEFAULT_SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Root of the PokeAPI; point it at bench/fake_pokeapi.py for offline benchmarks
+POKEAPI_BASE_URL = os.environ.get('POKEAPI_BASE_URL', "https://pokeapi.co/api/v2").rstrip('/')
+
+# Resource paths for the list endpoints the tools expose
+POKEMON_LIST_PATH = "pokemon?limit=151"
+ABILITY_LIST_PATH = "ability?limit=400"
+
+# Where PokeAPI data comes from: "live" calls the API, "snapshot" serves the
+# bundled offline Pokédex (see pokedex_snapshot.py) without any network access.
+DATA_MODE = os.environ.get('POKEAPI_DATA_MODE', 'live').lower()
+SNAPSHOT_PATH = os.environ.get('POKEDEX_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH)
+
+if DATA_MODE not in ('live', 'snapshot'):
+    logger.warning("Unknown POKEAPI_DATA_MODE '%s', falling back to 'live'", DATA_MODE)
+    DATA_MODE = 'live'
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+# Time-to-live (seconds) for each kind of PokeAPI response. The data is
+# effectively static, so these are long; lists get a shorter TTL so new
+# entries eventually show up.
+ENDPOINT_TTLS = {
+    "pokemon_list": 24 * 60 * 60,
+    "pokemon": 7 * 24 * 60 * 60,
+    "ability_list": 24 * 60 * 60,
+    "ability": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+# Shared response cache for all PokeAPI tools. Set POKEAPI_CACHE_DIR to also
+# keep responses on disk across restarts.
+cache = ResponseCache(
+    max_entries=int(os.environ.get('POKEAPI_CACHE_SIZE', '512')),
+    disk_dir=os.environ.get('POKEAPI_CACHE_DIR') or None
+)
+
+# Shared connection-pooled HTTP client for all live PokeAPI requests
+http = PooledHttpClient(
+    pool_size=int(os.environ.get('POKEAPI_POOL_SIZE', '20')),
+    connect_timeout=float(os.environ.get('POKEAPI_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.environ.get('POKEAPI_TIMEOUT', '10')),
+    retries=int(os.environ.get('POKEAPI_RETRIES', '3')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('POKEAPI_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('POKEAPI_BREAKER_RESET', '30'))
+    )
+)
+
+response_bytes = telemetry.histogram(
+    "pokegpt_pokeapi_response_bytes", "Size of live PokeAPI responses by endpoint", telemetry.SIZE_BUCKETS
+)
+
+def get_json(path: str, endpoint: str):
+    """
+    Fetches a PokeAPI resource, serving it from the shared cache when possible.
+
+    Args:
+        path: The resource path relative to the API root (e.g. "pokemon/25").
+        endpoint: The endpoint name used to pick a TTL (see ENDPOINT_TTLS).
+
+    Returns:
+        The decoded JSON response. Treat it as read-only, it is shared with other callers.
+    """
+    data = cache.get(path)
+    if data is not None:
+        return data
+
+    # Only cache misses are traced; hits are counted by cache_stats()
+    with telemetry.span("pokeapi.fetch", path=path, endpoint=endpoint, source=DATA_MODE) as fetch:
+        if DATA_MODE == 'snapshot':
+            data = _get_snapshot_record(path)
+        else:
+            response = http.get(f"{POKEAPI_BASE_URL}/{path}")
+            fetch.set(status_code=response.status_code, response_bytes=len(response.content))
+            response_bytes.observe(len(response.content), endpoint=endpoint)
+            response.raise_for_status()
+            data = response.json()
+
+    cache.set(path, data, ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL))
+    return data
+
+# httpx and asyncio are only needed by get_many, so they are imported there rather than at startup
+async def get_json_async(path: str, endpoint: str, client: "httpx.AsyncClient"):
+    """
+    Async variant of get_json, sharing the same cache and data mode.
+
+    Args:
+        path: The resource path relative to the API root (e.g. "pokemon/25").
+        endpoint: The endpoint name used to pick a TTL (see ENDPOINT_TTLS).
+        client: The httpx.AsyncClient used for live requests.
+    """
+    data = cache.get(path)
+    if data is not None:
+        return data
+
+    if DATA_MODE == 'snapshot':
+        data = _get_snapshot_record(path)
+    else:
+        http.breaker.before_call()
+        try:
+            response = await client.get(f"{POKEAPI_BASE_URL}/{path}")
+        except BaseException:
+            # Also on cancellation, so a half-open breaker's trial is always settled
+            http.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            http.breaker.record_failure()
+        else:
+            http.breaker.record_success()
+        response.raise_for_status()
+        data = response.json()
+
+    cache.set(path, data, ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL))
+    return data
+
+async def _get_many_async(resources):
+    import asyncio
+    import httpx
+    connect_timeout, read_timeout = http.timeout
+    async with httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        transport=httpx.AsyncHTTPTransport(retries=2)
+    ) as client:
+        return await asyncio.gather(
+            *(get_json_async(path, endpoint, client) for path, endpoint in resources),
+            return_exceptions=True
+        )
+
+def get_many(resources: list) -> list:
+    """
+    Fetches several PokeAPI resources concurrently.
+
+    Args:
+        resources: A list of (path, endpoint) tuples, as passed to get_json.
+
+    Returns:
+        A list with the decoded JSON for each resource, in the same order. A
+        resource that could not be fetched is returned as the exception instead.
+    """
+    if not resources:
+        return []
+    import asyncio
+    return asyncio.run(_get_many_async(resources))
+
+def get_snapshot() -> PokedexSnapshot:
+    """
+    Returns the offline Pokédex snapshot, opening it on first use.
+    Opening only reads the record index; records are decompressed when requested.
+    """
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = PokedexSnapshot(SNAPSHOT_PATH)
+                logger.info("Opened Pokédex snapshot %s with %d records", SNAPSHOT_PATH, len(_snapshot))
+    return _snapshot
+
+def _get_snapshot_record(path):
+    try:
+        return get_snapshot().get(path)
+    except KeyError:
+        raise LookupError(f"{path} is not in the offline Pokédex snapshot") from None
+
+def cache_stats() -> dict:
+    """
+    Returns hit/miss counters for the shared PokeAPI response cache.
+    """
+    return cache.stats()
+
+def http_stats() -> dict:
+    """
+    Returns request, failure, connection reuse and circuit breaker counters for live PokeAPI calls.
+    """
+    return http.stats()
@@ -0,0 +1,180 @@
+"""
+Offline Pokédex snapshot: a compact, lazily loaded copy of the PokeAPI
+resources used by the agent tools.
+
+File layout:
+    MAGIC (5 bytes) | header length (4 bytes, big-endian) | zlib(JSON header) | records
+
+The header maps each resource path (e.g. "pokemon/25") to the (offset, length)
+of its zlib-compressed JSON record. Readers memory-map the file and only
+decompress a record when a tool asks for it.
+
+Build or refresh the snapshot with:
+    python pokedex_snapshot.py refresh
+"""
+import os
+import sys
+import mmap
+import json
+import zlib
+import time
+import struct
+import argparse
+import threading
+
+MAGIC = b"PKDX\x01"
+_HEADER_LENGTH = struct.Struct(">I")
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'data', 'pokedex.snapshot')
+
+class PokedexSnapshot:
+    """
+    Read-only view over a snapshot file. Records are decompressed on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a Pokédex snapshot")
+
+        header_start = len(MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack(self._mmap[len(MAGIC):header_start])
+        header = json.loads(zlib.decompress(self._mmap[header_start:header_start + header_length]))
+
+        self.created_at = header.get("created_at")
+        self.source = header.get("source")
+        self._records = header["records"]
+        self._data_start = header_start + header_length
+
+    def __contains__(self, path):
+        return path in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def keys(self):
+        return self._records.keys()
+
+    def get(self, path: str):
+        """
+        Returns the decoded record for a resource path.
+
+        Raises:
+            KeyError: If the path is not in the snapshot.
+        """
+        offset, length = self._records[path]
+        start = self._data_start + offset
+        with self._lock:
+            compressed = self._mmap[start:start + length]
+        return json.loads(zlib.decompress(compressed))
+
+    def close(self):
+        self._mmap.close()
+
+def write_snapshot(path: str, records: dict, source: str = None):
+    """
+    Writes records (resource path -> JSON-serializable data) to a snapshot file.
+
+    The file is written to a temporary path first and then renamed, so readers
+    never see a partially written snapshot.
+    """
+    index = {}
+    chunks = []
+    offset = 0
+    for key, value in records.items():
+        chunk = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9)
+        index[key] = [offset, len(chunk)]
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    header = zlib.compress(json.dumps({
+        "created_at": time.time(),
+        "source": source,
+        "records": index
+    }).encode('utf-8'), 9)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+def compact_record(path: str, data):
+    """
+    Drops the fields the tools never return, to keep the snapshot small.
+    """
+    if path.startswith("pokemon/"):
+        data = dict(data)
+        data.pop("game_indices", None)
+        data["moves"] = [
+            {key: value for key, value in move.items() if key != "version_group_details"}
+            for move in data.get("moves", [])
+        ]
+    return data
+
+def crawl(base_url: str, list_paths: list) -> dict:
+    """
+    Fetches every list endpoint and every resource it references.
+
+    Returns:
+        A dict mapping resource paths to their (compacted) JSON data.
+    """
+    # Only the refresh command crawls, so requests is not imported when the app reads a snapshot
+    import requests
+    session = requests.Session()
+    records = {}
+
+    def fetch(path):
+        response = session.get(f"{base_url}/{path}", timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    for list_path in list_paths:
+        listing = fetch(list_path)
+        records[list_path] = listing
+        resource = list_path.split('?')[0]
+        entries = listing["results"]
+        print(f"Fetching {len(entries)} {resource} records...")
+        for entry in entries:
+            resource_id = int(entry["url"].rstrip('/').split('/')[-1])
+            path = f"{resource}/{resource_id}"
+            records[path] = compact_record(path, fetch(path))
+
+    return records
+
+def main(argv=None):
+    import pokeapi_client
+
+    parser = argparse.ArgumentParser(description="Build or inspect the offline Pokédex snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = subparsers.add_parser("refresh", help="Crawl PokeAPI once and write a new snapshot")
+    refresh_parser.add_argument("--output", default=pokeapi_client.SNAPSHOT_PATH)
+    refresh_parser.add_argument("--base-url", default=pokeapi_client.POKEAPI_BASE_URL)
+
+    info_parser = subparsers.add_parser("info", help="Print a summary of an existing snapshot")
+    info_parser.add_argument("--path", default=pokeapi_client.SNAPSHOT_PATH)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "refresh":
+        started = time.time()
+        records = crawl(args.base_url, [pokeapi_client.POKEMON_LIST_PATH, pokeapi_client.ABILITY_LIST_PATH])
+        write_snapshot(args.output, records, source=args.base_url)
+        size_kb = os.path.getsize(args.output) / 1024
+        print(f"Wrote {len(records)} records ({size_kb:.0f} KB) to {args.output} in {time.time() - started:.1f}s")
+    else:
+        snapshot = PokedexSnapshot(args.path)
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created_at or 0))
+        print(f"{args.path}: {len(snapshot)} records from {snapshot.source}, created {created}")
+
+if __name__ == "__main__":
+    sys.exit(main())
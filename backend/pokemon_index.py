@@ -0,0 +1,146 @@
+import re
+import logging
+import threading
+import unicodedata
+import pokeapi_client
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a Pokémon name to the PokeAPI naming scheme.
+
+    "Mr. Mime" and "mr mime" become "mr-mime", "Farfetch'd" becomes "farfetchd"
+    and "Nidoran♀" becomes "nidoran-f".
+    """
+    name = str(name).strip().lower()
+    name = name.replace('♀', '-f').replace('♂', '-m')
+    # Drop accents ("flabébé" -> "flabebe")
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    name = re.sub(r"[.'’:]", '', name)
+    name = re.sub(r'[\s_-]+', '-', name)
+    return name.strip('-')
+
+def display_name(name: str) -> str:
+    """
+    Formats a PokeAPI name for people: "mr-mime" becomes "Mr Mime" and "tapu-koko" becomes "Tapu Koko".
+    """
+    return name.replace('-', ' ').title()
+
+def id_from_url(url: str) -> int:
+    """
+    Extracts the resource ID from a PokeAPI URL (format: https://pokeapi.co/api/v2/pokemon/{id}/).
+    """
+    return int(url.rstrip('/').split('/')[-1])
+
+class PokemonIndex:
+    """
+    Name/ID lookup table built once from the PokeAPI Pokémon list.
+
+    Every Pokémon is reachable by its normalized name and by the same name with
+    hyphens removed, so "mr-mime", "Mr. Mime" and "mrmime" all resolve to 122.
+    """
+
+    def __init__(self, entries: list):
+        self.names_by_id = {}
+        self.ids_by_alias = {}
+
+        for entry in entries:
+            pokemon_id = id_from_url(entry["url"])
+            name = entry["name"]
+            self.names_by_id[pokemon_id] = name
+
+            key = normalize_name(name)
+            self.ids_by_alias.setdefault(key, pokemon_id)
+            self.ids_by_alias.setdefault(key.replace('-', ''), pokemon_id)
+
+    def __len__(self):
+        return len(self.names_by_id)
+
+    def find(self, name) -> tuple:
+        """
+        Resolves a Pokémon name (or numeric ID) to its (id, canonical name).
+
+        Returns:
+            An (id, name) tuple, or None if the Pokémon is not in the index.
+        """
+        key = normalize_name(name)
+        if key.isdigit():
+            pokemon_id = int(key)
+        else:
+            pokemon_id = self.ids_by_alias.get(key)
+            if pokemon_id is None:
+                pokemon_id = self.ids_by_alias.get(key.replace('-', ''))
+
+        if pokemon_id not in self.names_by_id:
+            return None
+        return pokemon_id, self.names_by_id[pokemon_id]
+
+    def mentions(self, text: str) -> list:
+        """
+        Finds the Pokémon named in free text, e.g. "compare mr mime and pikachu".
+        Names of up to three words are matched; bare numbers are not treated as IDs.
+
+        Returns:
+            The (id, name) tuples of the Pokémon mentioned, in order of appearance.
+        """
+        words = re.findall(r"[\w♀♂.'’-]+", str(text).lower())
+        found = []
+        position = 0
+        while position < len(words):
+            for length in (3, 2, 1):
+                phrase = ' '.join(words[position:position + length])
+                if length > len(words) - position or phrase.isdigit():
+                    continue
+                match = self.find(phrase)
+                if not match and length == 1 and phrase.endswith('s'):
+                    # Possessives typed without an apostrophe ("pikachus moves")
+                    match = self.find(phrase[:-1])
+                if match:
+                    if match not in found:
+                        found.append(match)
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+def get_index() -> PokemonIndex:
+    """
+    Returns the shared Pokémon index, building it on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                entries = pokeapi_client.get_json(pokeapi_client.POKEMON_LIST_PATH, "pokemon_list")["results"]
+                _index = PokemonIndex(entries)
+                logger.info("Built Pokémon index with %d entries", len(_index))
+    return _index
+
+def find_pokemon(name) -> tuple:
+    """
+    Resolves a Pokémon name to its (id, canonical name) using the shared index.
+
+    Returns:
+        An (id, name) tuple, or None if the Pokémon could not be found.
+    """
+    return get_index().find(name)
+
+def find_mentions(text: str) -> list:
+    """
+    Returns the (id, name) tuples of the Pokémon named in text, using the shared index.
+    """
+    return get_index().mentions(text)
+
+def reset_index():
+    """
+    Drops the shared index so it is rebuilt on next use.
+    """
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,108 @@
+"""
+Field projection for Pokémon details, so only the data the model needs ends up in its context.
+
+Measure the size reduction for some Pokémon with:
+    python pokemon_projection.py 1 25 150
+"""
+import sys
+import json
+
+# Fields returned when the caller does not ask for specific ones
+DEFAULT_FIELDS = ("id", "name", "height", "weight", "base_experience", "types", "abilities", "stats", "moves")
+
+# Maximum number of move names included in a projected payload
+DEFAULT_MAX_MOVES = 20
+
+def _names(entries, key):
+    return [entry[key]["name"] for entry in entries or [] if entry.get(key)]
+
+# Compact representation for each supported field
+_PROJECTIONS = {
+    "id": lambda data, max_moves: data.get("id"),
+    "name": lambda data, max_moves: data.get("name"),
+    "height": lambda data, max_moves: data.get("height"),
+    "weight": lambda data, max_moves: data.get("weight"),
+    "base_experience": lambda data, max_moves: data.get("base_experience"),
+    "is_default": lambda data, max_moves: data.get("is_default"),
+    "order": lambda data, max_moves: data.get("order"),
+    "species": lambda data, max_moves: (data.get("species") or {}).get("name"),
+    "types": lambda data, max_moves: _names(data.get("types"), "type"),
+    "abilities": lambda data, max_moves: [
+        {"name": entry["ability"]["name"], "is_hidden": entry.get("is_hidden", False)}
+        for entry in data.get("abilities") or []
+    ],
+    "stats": lambda data, max_moves: {
+        entry["stat"]["name"]: entry["base_stat"] for entry in data.get("stats") or []
+    },
+    "moves": lambda data, max_moves: _names(data.get("moves"), "move")[:max_moves],
+    "forms": lambda data, max_moves: [form["name"] for form in data.get("forms") or []],
+    "held_items": lambda data, max_moves: _names(data.get("held_items"), "item"),
+    "sprites": lambda data, max_moves: {"front_default": (data.get("sprites") or {}).get("front_default")},
+    "cries": lambda data, max_moves: (data.get("cries") or {}).get("latest"),
+}
+
+SUPPORTED_FIELDS = tuple(_PROJECTIONS)
+
+def parse_fields(fields) -> tuple:
+    """
+    Parses a comma-separated field list (or an iterable of names) into supported field names.
+    Returns DEFAULT_FIELDS when nothing usable was requested.
+    """
+    if not fields:
+        return DEFAULT_FIELDS
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    requested = tuple(field.strip().lower() for field in fields if field.strip().lower() in _PROJECTIONS)
+    return requested or DEFAULT_FIELDS
+
+def project_pokemon(data: dict, fields=None, max_moves: int = DEFAULT_MAX_MOVES) -> dict:
+    """
+    Projects a raw PokeAPI Pokémon record onto a compact payload.
+
+    Args:
+        data: The raw (or snapshot) PokeAPI record.
+        fields: The fields to include, as a comma-separated string or iterable. Defaults to DEFAULT_FIELDS.
+        max_moves: The maximum number of move names to include.
+
+    Returns:
+        A dict with the requested fields in compact form. When moves are truncated,
+        "moves_total" holds the full count.
+    """
+    projected = {}
+    for field in parse_fields(fields):
+        projected[field] = _PROJECTIONS[field](data, max_moves)
+
+    if "moves" in projected:
+        total_moves = len(data.get("moves") or [])
+        if total_moves > len(projected["moves"]):
+            projected["moves_total"] = total_moves
+    return projected
+
+def payload_size(data) -> int:
+    """
+    Returns the size in bytes of data serialized as JSON.
+    """
+    return len(json.dumps(data).encode('utf-8'))
+
+def measure_reduction(data: dict, fields=None, max_moves: int = DEFAULT_MAX_MOVES) -> dict:
+    """
+    Compares the serialized size of a raw record with its projection.
+    """
+    raw_bytes = payload_size(data)
+    projected_bytes = payload_size(project_pokemon(data, fields, max_moves))
+    return {
+        "raw_bytes": raw_bytes,
+        "projected_bytes": projected_bytes,
+        "reduction": 1 - projected_bytes / raw_bytes if raw_bytes else 0.0
+    }
+
+if __name__ == "__main__":
+    import pokeapi_client
+
+    ids = [int(arg) for arg in sys.argv[1:]] or [1, 4, 7, 25, 150]
+    print(f"{'id':>5} {'name':<15} {'raw bytes':>10} {'projected':>10} {'reduction':>10}")
+    for pokemon_id in ids:
+        record = pokeapi_client.get_json(f"pokemon/{pokemon_id}", "pokemon")
+        sizes = measure_reduction(record)
+        print(f"{pokemon_id:>5} {record['name']:<15} {sizes['raw_bytes']:>10} "
+              f"{sizes['projected_bytes']:>10} {sizes['reduction']:>9.1%}")
@@ -0,0 +1,363 @@
+"""
+Dependency-free tracing and metrics.
+
+Spans cover a request from the Flask handler down to agent steps, model
+calls, tool calls, PokeAPI fetches and favorites writes. The current span is
+kept in a context variable, so nested spans (and threads started with a
+copied context, like the agent's tool executor) are parented automatically.
+
+Finished spans feed the span duration histogram served at /api/metrics in
+the Prometheus text format, and, if TELEMETRY_EXPORT_PATH is set, are
+written there as OTLP/JSON lines by a background thread (one
+ExportTraceServiceRequest per line), so request threads never block on I/O.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# File that finished spans are appended to as OTLP/JSON lines; unset disables the export
+TELEMETRY_EXPORT_PATH = os.environ.get('TELEMETRY_EXPORT_PATH')
+TELEMETRY_SERVICE_NAME = os.environ.get('TELEMETRY_SERVICE_NAME', 'pokegpt-backend')
+# Spans waiting to be written; when the queue is full new spans are dropped, not waited for
+TELEMETRY_QUEUE_SIZE = int(os.environ.get('TELEMETRY_QUEUE_SIZE', '10000'))
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+class Span:
+    """
+    A timed operation. trace_id and span_id are hex strings as in OTLP/JSON;
+    times are Unix timestamps in seconds.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent: "Span" = None, attributes: dict = None, start: float = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, end: float = None, error: BaseException = None):
+        if self.end is not None:
+            return
+        self.end = end if end is not None else time.time()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _on_finish(self)
+
+def current_span() -> Span:
+    return _current_span.get()
+
+def start_span(name: str, parent: Span = None, **attributes) -> Span:
+    """
+    Starts a span without making it current; finish it with span.finish().
+    parent defaults to the current span.
+    """
+    return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+def activate(span: Span):
+    """
+    Makes span the current span. Returns a token for deactivate().
+    """
+    return _current_span.set(span)
+
+def deactivate(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Generators can be resumed in another context than the one they started in
+        _current_span.set(None)
+
+@contextmanager
+def span(name: str, parent: Span = None, **attributes):
+    """
+    Times the enclosed block as a span that is current while the block runs.
+    An exception leaving the block is recorded on the span and re-raised.
+    """
+    current = start_span(name, parent, **attributes)
+    token = activate(current)
+    error = None
+    try:
+        yield current
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        deactivate(token)
+        current.finish(error=error)
+
+def traced(name: str):
+    """
+    Decorator that runs every call of the function in a span called name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Metrics ---
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"] + [
+            f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values
+        ]
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {values[-1]}")
+        return lines
+
+_metrics = {}
+_gauges = {}  # prefix -> (help, callback returning a dict of numbers)
+_metrics_lock = threading.Lock()
+
+def counter(name: str, help: str) -> Counter:
+    """
+    Returns the counter called name, creating it on first use.
+    """
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = Counter(name, help)
+        return _metrics[name]
+
+def histogram(name: str, help: str, buckets: tuple = DURATION_BUCKETS) -> Histogram:
+    """
+    Returns the histogram called name, creating it on first use.
+    """
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = Histogram(name, help, buckets)
+        return _metrics[name]
+
+def register_gauges(prefix: str, callback, help: str = ""):
+    """
+    Exposes the numbers in the dict returned by callback() as gauges called
+    <prefix>_<key>. Used for the existing stats() counters of the caches,
+    pools and stores, which are read when /api/metrics is scraped.
+    """
+    with _metrics_lock:
+        _gauges[prefix] = (help, callback)
+
+def render_prometheus() -> str:
+    """
+    Returns every metric in the Prometheus text exposition format (0.0.4).
+    """
+    with _metrics_lock:
+        metrics = sorted(_metrics.items())
+        gauges = sorted(_gauges.items())
+    lines = []
+    for _, metric in metrics:
+        lines += metric.render()
+    for prefix, (help, callback) in gauges:
+        try:
+            values = callback()
+        except Exception as e:
+            logger.warning("Could not read gauges %s: %s", prefix, e)
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines += [f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+    return "\n".join(lines) + "\n"
+
+span_duration = histogram("pokegpt_span_duration_seconds", "Duration of traced operations by span name")
+span_errors = counter("pokegpt_span_errors_total", "Traced operations that raised, by span name")
+
+# --- Export ---
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_span(finished: Span) -> dict:
+    otlp = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(int(finished.start * 1e9)),
+        "endTimeUnixNano": str(int(finished.end * 1e9)),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in finished.attributes.items()],
+        "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+    }
+    if finished.parent_id:
+        otlp["parentSpanId"] = finished.parent_id
+    return otlp
+
+class SpanExporter:
+    """
+    Appends finished spans to a file as OTLP/JSON lines from a background thread.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.exported = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch, flushed = [], None
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    flushed = item
+                    break
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            if flushed is not None:
+                flushed.set()
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Waits until the spans queued so far are written, at most timeout seconds.
+        """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _write(self, batch: list):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TELEMETRY_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "pokegpt"}, "spans": [_otlp_span(finished) for finished in batch]}],
+        }]}
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request, default=str) + "\n")
+            self.exported += len(batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            logger.warning("Could not export %d spans to %s: %s", len(batch), self.path, e)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "exported": self.exported, "dropped": self.dropped}
+
+exporter = None
+if TELEMETRY_EXPORT_PATH:
+    exporter = SpanExporter(TELEMETRY_EXPORT_PATH, max_queue=TELEMETRY_QUEUE_SIZE)
+    atexit.register(exporter.flush)
+    register_gauges("pokegpt_span_export", exporter.stats, "Spans waiting, written and dropped by the OTLP/JSON exporter")
+
+def _on_finish(finished: Span):
+    span_duration.observe(finished.end - finished.start, span=finished.name)
+    if finished.error:
+        span_errors.inc(span=finished.name)
+    if exporter is not None:
+        exporter.export(finished)
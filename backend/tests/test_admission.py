@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, QueueTimeout, SQLiteLeaseBackend
+
+def controller(path, **kwargs):
+    # One controller per simulated worker process, all sharing the lease file at path
+    kwargs.setdefault("queue_timeout", 0.3)
+    kwargs.setdefault("lease_poll_interval", 0.02)
+    return AdmissionController(leases=SQLiteLeaseBackend(str(path)), **kwargs)
+
+@pytest.fixture
+def lease_path(tmp_path):
+    return tmp_path / "leases.db"
+
+def test_chat_runs_one_query_at_a_time_across_workers(lease_path):
+    first, second = controller(lease_path), controller(lease_path)
+    slot = first.acquire("chat", "alice")
+
+    with pytest.raises(QueueTimeout):
+        second.acquire("chat", "bob")
+    assert second.stats()["running"] == 0
+    assert second.stats()["lease_waits"] == 1
+
+    slot.release()
+    second.acquire("chat", "bob").release()
+    assert first.leases.count() == 0
+
+def test_waiting_query_starts_when_the_other_worker_releases(lease_path):
+    first, second = controller(lease_path), controller(lease_path, queue_timeout=5)
+    slot = first.acquire("chat", "alice")
+    threading.Timer(0.1, slot.release).start()
+
+    started = time.monotonic()
+    second.acquire("chat", "bob").release()
+    assert 0.05 < time.monotonic() - started < 2
+
+def test_global_cap_across_workers(lease_path):
+    first, second = controller(lease_path, max_total=2), controller(lease_path, max_total=2)
+    slots = [first.acquire("chat-1", "alice"), second.acquire("chat-2", "bob")]
+
+    with pytest.raises(QueueTimeout):
+        first.acquire("chat-3", "carol")
+
+    slots.pop().release()
+    slots.append(first.acquire("chat-3", "carol"))
+    assert first.leases.count() == 2
+    for slot in slots:
+        slot.release()
+
+def test_lease_of_a_dead_worker_expires(lease_path):
+    dead = controller(lease_path, lease_ttl=0.2)
+    dead.acquire("chat", "alice")  # Never released, as if the worker died mid-run
+
+    alive = controller(lease_path, queue_timeout=5)
+    started = time.monotonic()
+    alive.acquire("chat", "bob").release()
+    assert 0.1 < time.monotonic() - started < 2
+
+def test_running_query_renews_its_lease(lease_path):
+    running = controller(lease_path, lease_ttl=0.3)
+    other = controller(lease_path)
+    slot = running.acquire("chat", "alice")
+
+    def events():
+        for index in range(12):
+            time.sleep(0.05)
+            yield index
+
+    started = time.monotonic()
+    for index in slot.hold(events()):
+        if index == 9:
+            # Past the ttl, but the events renewed the lease
+            assert time.monotonic() - started > 0.3
+            with pytest.raises(QueueTimeout):
+                other.acquire("chat", "bob", timeout=0.05)
+    # Exhausting the events released the slot and the lease
+    assert running.stats()["running"] == 0
+    other.acquire("chat", "bob").release()
+
+def test_closing_a_stream_early_releases_the_slot(lease_path):
+    admission = controller(lease_path)
+    slot = admission.acquire("chat", "alice")
+    closed = []
+
+    def events():
+        try:
+            yield "first"
+            yield "second"
+        finally:
+            closed.append(True)
+
+    held = slot.hold(events())
+    assert next(held) == "first"
+    held.close()
+
+    assert closed == [True]
+    assert admission.stats()["running"] == 0
+    assert admission.leases.count() == 0
+
+def test_closing_a_stream_that_never_started_releases_the_slot(lease_path):
+    admission = controller(lease_path)
+    held = admission.acquire("chat", "alice").hold(iter(()))
+    held.close()
+
+    assert admission.stats()["running"] == 0
+    assert admission.leases.count() == 0
+
+def test_failing_stream_releases_the_slot(lease_path):
+    admission = controller(lease_path)
+
+    def events():
+        yield "first"
+        raise RuntimeError("model call failed")
+
+    held = admission.acquire("chat", "alice").hold(events())
+    next(held)
+    with pytest.raises(RuntimeError):
+        next(held)
+    assert admission.stats()["running"] == 0
+    assert admission.leases.count() == 0
+
+def test_per_user_limit_and_fair_dispatch():
+    admission = AdmissionController(max_concurrent=2, max_per_user=1, queue_timeout=5)
+    running = admission.acquire("chat-1", "alice")
+    granted = []
+
+    def query(chat_id, user_id):
+        with admission.acquire(chat_id, user_id):
+            granted.append(user_id)
+
+    waiting = threading.Thread(target=query, args=("chat-2", "alice"))
+    waiting.start()
+    time.sleep(0.05)
+    # alice is at her limit, so her second query waits while bob's runs
+    query("chat-3", "bob")
+    assert granted == ["bob"]
+    assert admission.stats()["waiting"] == 1
+
+    running.release()
+    waiting.join(2)
+    assert granted == ["bob", "alice"]
@@ -0,0 +1,57 @@
+from usage import SQLiteUsageBackend, UsageTracker
+
+class FlakyBackend(SQLiteUsageBackend):
+    """Fails the first `failures` flushes, like a locked or unavailable database."""
+
+    def __init__(self, path, failures: int):
+        super().__init__(path)
+        self.failures = failures
+
+    def add(self, by_chat, by_user):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database is locked")
+        super().add(by_chat, by_user)
+
+def tracker(backend):
+    # No background flushes: the tests flush explicitly
+    return UsageTracker(backend, prices={"model": (1.0, 2.0)}, flush_interval=0)
+
+def test_failed_flush_keeps_totals_for_the_next_one(tmp_path):
+    backend = FlakyBackend(str(tmp_path / "usage.db"), failures=1)
+    usage = tracker(backend)
+    usage.record("chat", "alice", "model", 100, 10)
+
+    usage.flush()
+    assert usage.stats()["flush_errors"] == 1
+    assert backend.chat("chat") is None
+    # Still counted while waiting for the next flush
+    assert usage.chat_usage("chat")["total_tokens"] == 110
+
+    usage.record("chat", "alice", "model", 50, 5)
+    usage.flush()
+    assert usage.stats()["flushes"] == 1
+    assert usage.stats()["pending_chats"] == 0
+    assert backend.chat("chat")[:3] == (150, 15, 2)
+    assert usage.chat_usage("chat")["total_tokens"] == 165
+    assert usage.user_usage("alice")["total_tokens"] == 165
+
+def test_flushes_from_several_workers_add_up(tmp_path):
+    path = str(tmp_path / "usage.db")
+    first, second = tracker(SQLiteUsageBackend(path)), tracker(SQLiteUsageBackend(path))
+    first.record("chat", "alice", "model", 100, 10)
+    second.record("chat", "alice", "model", 200, 20)
+    first.flush()
+    second.flush()
+
+    totals = first.chat_usage("chat")
+    assert (totals["input_tokens"], totals["output_tokens"], totals["model_calls"]) == (300, 30, 2)
+    assert totals["cost_usd"] == round((300 * 1.0 + 30 * 2.0) / 1_000_000, 6)
+
+def test_budget_modes(tmp_path):
+    usage = UsageTracker(SQLiteUsageBackend(str(tmp_path / "usage.db")), chat_budget=1000, flush_interval=0)
+    assert usage.budget("chat", "alice")["mode"] == "full"
+    usage.record("chat", "alice", "model", 800, 0)
+    assert usage.budget("chat", "alice")["mode"] == "economy"
+    usage.record("chat", "alice", "model", 200, 0)
+    assert usage.budget("chat", "alice") == {"mode": "blocked", "limit": "chat", "remaining_tokens": 0}
@@ -0,0 +1,122 @@
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+# Characters of each output kept inline with the tool call
+PREVIEW_CHARS = 300
+
+class ToolResultStore:
+    """
+    Content-addressed store for tool outputs.
+
+    Outputs are stored once per distinct content, keyed by their SHA-256, and
+    compressed with zlib. Chat sessions keep only the hash, the size and a
+    short preview; the full output is fetched on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.puts = 0
+        self.new_results = 0
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tool_results (
+                    hash TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, output: str) -> str:
+        """
+        Stores an output if it is not stored yet.
+
+        Returns:
+            The SHA-256 hex digest that identifies the output.
+        """
+        data = output.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        with self._connect() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO tool_results (hash, body, size, last_used) VALUES (?, ?, ?, ?)",
+                (digest, zlib.compress(data), len(output), time.time())
+            ).rowcount
+            if not inserted:
+                conn.execute("UPDATE tool_results SET last_used = ? WHERE hash = ?", (time.time(), digest))
+        with self._lock:
+            self.puts += 1
+            self.new_results += inserted
+        return digest
+
+    def get(self, digest: str) -> str:
+        """
+        Returns the output stored under digest, or None if there is none.
+        Reading an output counts as using it (see delete_older_than).
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT body FROM tool_results WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tool_results SET last_used = ? WHERE hash = ?", (time.time(), digest))
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def touch(self, digests):
+        """
+        Marks stored outputs as used now, e.g. when a chat references them again.
+        """
+        digests = list(digests)
+        if not digests:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("UPDATE tool_results SET last_used = ? WHERE hash = ?", [(now, digest) for digest in digests])
+
+    def reference(self, tool_name: str, parameters, output) -> dict:
+        """
+        Stores output and returns the tool call record kept in the chat session:
+        {"tool_name", "parameters", "output_hash", "output_size", "output_preview", "output_truncated"}.
+        """
+        output = str(output)
+        return {
+            "tool_name": tool_name,
+            "parameters": parameters,
+            "output_hash": self.put(output),
+            "output_size": len(output),
+            "output_preview": output[:PREVIEW_CHARS],
+            "output_truncated": len(output) > PREVIEW_CHARS
+        }
+
+    def delete_older_than(self, cutoff: float) -> int:
+        """
+        Deletes outputs not stored, referenced again or read since cutoff.
+        """
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM tool_results WHERE last_used < ?", (cutoff,)).rowcount
+
+    def stats(self) -> dict:
+        count, raw_size, stored_size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM tool_results"
+        ).fetchone()
+        with self._lock:
+            return {
+                "results": count,
+                "raw_chars": raw_size,
+                "stored_bytes": stored_size,
+                "puts": self.puts,
+                "deduplicated": self.puts - self.new_results,
+            }
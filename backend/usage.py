@@ -0,0 +1,278 @@
+import time
+import atexit
+import logging
+import sqlite3
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Budget modes, from least to most restricted
+FULL = "full"
+ECONOMY = "economy"
+BLOCKED = "blocked"
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+def _empty() -> dict:
+    return {"input_tokens": 0, "output_tokens": 0, "model_calls": 0, "cost_usd": 0.0}
+
+def _add(totals: dict, row):
+    totals["input_tokens"] += row[0]
+    totals["output_tokens"] += row[1]
+    totals["model_calls"] += row[2]
+    totals["cost_usd"] += row[3]
+
+def _finish(totals: dict) -> dict:
+    totals["total_tokens"] = totals["input_tokens"] + totals["output_tokens"]
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    return totals
+
+class SQLiteUsageBackend:
+    """
+    Stores token totals per chat and per user and UTC day. Flushes add to the
+    stored totals, so several worker processes can share the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_by_chat (
+                    chat_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    input_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    model_calls INTEGER NOT NULL,
+                    cost_usd REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_by_user (
+                    user_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    input_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    model_calls INTEGER NOT NULL,
+                    cost_usd REAL NOT NULL,
+                    PRIMARY KEY (user_id, day)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, by_chat: dict, by_user: dict):
+        """
+        Adds {chat_id: (user_id, totals)} and {(user_id, day): totals} to the stored totals in one transaction.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("""
+                INSERT INTO usage_by_chat (chat_id, user_id, input_tokens, output_tokens, model_calls, cost_usd, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    input_tokens = input_tokens + excluded.input_tokens,
+                    output_tokens = output_tokens + excluded.output_tokens,
+                    model_calls = model_calls + excluded.model_calls,
+                    cost_usd = cost_usd + excluded.cost_usd,
+                    updated_at = excluded.updated_at
+            """, [(chat_id, user_id, t["input_tokens"], t["output_tokens"], t["model_calls"], t["cost_usd"], now)
+                  for chat_id, (user_id, t) in by_chat.items()])
+            conn.executemany("""
+                INSERT INTO usage_by_user (user_id, day, input_tokens, output_tokens, model_calls, cost_usd)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    input_tokens = input_tokens + excluded.input_tokens,
+                    output_tokens = output_tokens + excluded.output_tokens,
+                    model_calls = model_calls + excluded.model_calls,
+                    cost_usd = cost_usd + excluded.cost_usd
+            """, [(user_id, day, t["input_tokens"], t["output_tokens"], t["model_calls"], t["cost_usd"])
+                  for (user_id, day), t in by_user.items()])
+
+    def chat(self, chat_id: str):
+        return self._connect().execute(
+            "SELECT input_tokens, output_tokens, model_calls, cost_usd FROM usage_by_chat WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+
+    def user_days(self, user_id: str, since: str) -> list:
+        """
+        Returns (day, input_tokens, output_tokens, model_calls, cost_usd) rows from day since on.
+        """
+        return self._connect().execute(
+            "SELECT day, input_tokens, output_tokens, model_calls, cost_usd FROM usage_by_user "
+            "WHERE user_id = ? AND day >= ? ORDER BY day", (user_id, since)
+        ).fetchall()
+
+    def delete_older_than(self, cutoff: float) -> int:
+        day = datetime.datetime.fromtimestamp(cutoff, datetime.timezone.utc).strftime("%Y-%m-%d")
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM usage_by_chat WHERE updated_at < ?", (cutoff,)).rowcount
+            return deleted + conn.execute("DELETE FROM usage_by_user WHERE day < ?", (day,)).rowcount
+
+class UsageTracker:
+    """
+    Token and cost accounting per chat and per user, with budgets.
+
+    record() only adds to in-memory totals; a background thread adds them to
+    the backend every flush_interval seconds (and at exit), so accounting
+    costs the agent loop nothing but a dict update. Reads combine the stored
+    totals with the ones not flushed yet. Totals recorded by other worker
+    processes show up once they have flushed.
+
+    Budgets are in tokens (input plus output): chat_budget for the lifetime
+    of a chat and user_daily_budget per user and UTC day, 0 meaning no limit.
+    Past soft_limit of a budget, queries run in economy mode; once a budget
+    is used up, they are blocked.
+
+    prices maps model IDs to (input, output) USD per million tokens; models
+    without a price cost 0.
+    """
+
+    def __init__(self, backend: SQLiteUsageBackend, prices: dict = None, chat_budget: int = 0,
+                 user_daily_budget: int = 0, soft_limit: float = 0.8, flush_interval: float = 10.0):
+        self.backend = backend
+        self.prices = prices or {}
+        self.chat_budget = chat_budget
+        self.user_daily_budget = user_daily_budget
+        self.soft_limit = soft_limit
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending_chats = {}  # chat_id -> (user_id, totals)
+        self._pending_users = {}  # (user_id, day) -> totals
+        self.flushes = 0
+        self.flush_errors = 0
+        self._stop = threading.Event()
+        if flush_interval > 0:
+            threading.Thread(target=self._run, name="usage-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def cost(self, model_id: str, input_tokens: int, output_tokens: int) -> float:
+        input_price, output_price = self.prices.get(model_id, (0.0, 0.0))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(self, chat_id: str, user_id: str, model_id: str, input_tokens: int, output_tokens: int) -> float:
+        """
+        Adds the tokens of one model call to the chat's and the user's totals.
+
+        Returns:
+            The cost of the call in USD.
+        """
+        cost = self.cost(model_id, input_tokens, output_tokens)
+        day = _today()
+        with self._lock:
+            totals = [self._pending_chats.setdefault(chat_id, (user_id, _empty()))[1]]
+            if user_id:
+                totals.append(self._pending_users.setdefault((user_id, day), _empty()))
+            for pending in totals:
+                _add(pending, (input_tokens, output_tokens, 1, cost))
+        return cost
+
+    def chat_usage(self, chat_id: str) -> dict:
+        """
+        Returns the totals of a chat: input, output and total tokens, model calls and cost.
+        """
+        totals = _empty()
+        row = self.backend.chat(chat_id)
+        if row is not None:
+            _add(totals, row)
+        with self._lock:
+            pending = self._pending_chats.get(chat_id)
+            if pending is not None:
+                _add(totals, tuple(pending[1].values()))
+        return _finish(totals)
+
+    def user_usage(self, user_id: str, days: int = 1) -> dict:
+        """
+        Returns a user's totals over the last days UTC days (today included), and per day.
+        """
+        since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        by_day = {}
+        for day, *row in self.backend.user_days(user_id, since):
+            _add(by_day.setdefault(day, _empty()), row)
+        with self._lock:
+            for (pending_user, day), pending in self._pending_users.items():
+                if pending_user == user_id and day >= since:
+                    _add(by_day.setdefault(day, _empty()), tuple(pending.values()))
+        totals = _empty()
+        for day_totals in by_day.values():
+            _add(totals, tuple(day_totals.values()))
+        return dict(_finish(totals), by_day=[dict(_finish(by_day[day]), day=day) for day in sorted(by_day)])
+
+    def budget(self, chat_id: str, user_id: str) -> dict:
+        """
+        Checks a chat's and its user's budgets.
+
+        Returns:
+            {"mode": FULL, ECONOMY or BLOCKED, "limit": "chat", "user" or None (the budget
+            closest to being used up), "remaining_tokens": tokens left, or None without budgets}
+        """
+        limits = []
+        if self.chat_budget:
+            limits.append(("chat", self.chat_budget, self.chat_usage(chat_id)["total_tokens"]))
+        if self.user_daily_budget and user_id:
+            limits.append(("user", self.user_daily_budget, self.user_usage(user_id)["total_tokens"]))
+        if not limits:
+            return {"mode": FULL, "limit": None, "remaining_tokens": None}
+
+        name, budget, used = max(limits, key=lambda limit: limit[2] / limit[1])
+        if used >= budget:
+            mode = BLOCKED
+        elif used >= budget * self.soft_limit:
+            mode = ECONOMY
+        else:
+            mode = FULL
+        remaining = min(budget - used for _, budget, used in limits)
+        return {"mode": mode, "limit": name, "remaining_tokens": max(remaining, 0)}
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Adds the in-memory totals to the backend. On failure they are kept for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                by_chat, self._pending_chats = self._pending_chats, {}
+                by_user, self._pending_users = self._pending_users, {}
+            if not by_chat and not by_user:
+                return
+            try:
+                self.backend.add(by_chat, by_user)
+                self.flushes += 1
+            except Exception as e:
+                self.flush_errors += 1
+                logger.warning("Could not flush usage of %d chats: %s", len(by_chat), e)
+                with self._lock:
+                    for chat_id, (user_id, totals) in by_chat.items():
+                        _add(self._pending_chats.setdefault(chat_id, (user_id, _empty()))[1], tuple(totals.values()))
+                    for key, totals in by_user.items():
+                        _add(self._pending_users.setdefault(key, _empty()), tuple(totals.values()))
+
+    def purge(self, max_age: float) -> int:
+        """
+        Deletes stored totals of chats not used for max_age seconds, and of older days.
+        """
+        return self.backend.delete_older_than(time.time() - max_age)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_chats": len(self._pending_chats),
+                "pending_users": len(self._pending_users),
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+            }
@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+import threading
+import favorites_service
+import pokeapi_client
+import pokemon_index
+
+logger = logging.getLogger(__name__)
+
+# Warm-up runs in the background when the app starts; WARMUP_ENABLED=false makes the app ready immediately
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Open a connection to the model API during warm-up
+WARMUP_MODEL_CONNECTION = os.environ.get('WARMUP_MODEL_CONNECTION', 'true').lower() in ('1', 'true', 'yes')
+
+# Number of Pokémon whose details are prefetched after warm-up (0 disables prefetching).
+# The most favorited Pokémon come first, then the lowest Pokédex numbers.
+WARMUP_PREFETCH_TOP_N = int(os.environ.get('WARMUP_PREFETCH_TOP_N', '50'))
+
+# Details are fetched in batches so the prefetch never floods PokeAPI
+PREFETCH_BATCH_SIZE = 10
+
+_lock = threading.Lock()
+_status = {
+    "ready": not WARMUP_ENABLED,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+    "prefetch": {"requested": 0, "fetched": 0, "failed": 0, "done": not WARMUP_ENABLED},
+}
+
+def status() -> dict:
+    """
+    Returns a copy of the warm-up progress: whether the instance is ready,
+    the outcome and duration of every step and the prefetch counters.
+    """
+    with _lock:
+        return {
+            **_status,
+            "steps": {name: dict(step) for name, step in _status["steps"].items()},
+            "prefetch": dict(_status["prefetch"]),
+        }
+
+def is_ready() -> bool:
+    return _status["ready"]
+
+def _step(name: str, function):
+    started = time.perf_counter()
+    try:
+        function()
+        result = {"ok": True}
+    except Exception as e:
+        logger.warning("Warm-up step %s failed: %s", name, e)
+        result = {"ok": False, "error": str(e)}
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    with _lock:
+        _status["steps"][name] = result
+
+def _open_model_connection(pokemon_agent):
+    client = getattr(pokemon_agent.model, "client", None)
+    if client is not None:
+        client.models.list()
+
+def _build_agent(pokemon_agent):
+    # The first agent built pays for tool schema generation; keep it in the pool
+    pokemon_agent.agents.release(pokemon_agent.agents.acquire())
+
+def prefetch_ids(top_n: int) -> list:
+    """
+    Returns the Pokémon IDs to prefetch: the most favorited ones, topped up with the lowest Pokédex numbers.
+    """
+    ids = favorites_service.storage.most_favorited(top_n)
+    for pokemon_id in range(1, top_n + 1):
+        if len(ids) >= top_n:
+            break
+        if pokemon_id not in ids:
+            ids.append(pokemon_id)
+    return ids
+
+def _prefetch(top_n: int):
+    ids = prefetch_ids(top_n)
+    with _lock:
+        _status["prefetch"]["requested"] = len(ids)
+    for start in range(0, len(ids), PREFETCH_BATCH_SIZE):
+        batch = ids[start:start + PREFETCH_BATCH_SIZE]
+        results = pokeapi_client.get_many([(f"pokemon/{pokemon_id}", "pokemon") for pokemon_id in batch])
+        failed = sum(isinstance(result, Exception) for result in results)
+        with _lock:
+            _status["prefetch"]["fetched"] += len(batch) - failed
+            _status["prefetch"]["failed"] += failed
+
+def run(pokemon_agent, prefetch_top_n: int = WARMUP_PREFETCH_TOP_N):
+    """
+    Warms the instance up, then marks it ready and prefetches popular Pokémon.
+
+    Steps that fail are reported in status() but don't keep the instance from
+    becoming ready: the same work is retried lazily on the first request.
+    """
+    with _lock:
+        _status["started_at"] = time.time()
+    logger.info("Warm-up started")
+
+    # The list requests also open the pooled PokeAPI connections (or the snapshot)
+    _step("pokemon_list", lambda: pokeapi_client.get_json(pokeapi_client.POKEMON_LIST_PATH, "pokemon_list"))
+    _step("ability_list", lambda: pokeapi_client.get_json(pokeapi_client.ABILITY_LIST_PATH, "ability_list"))
+    _step("pokemon_index", pokemon_index.get_index)
+    _step("agent", lambda: _build_agent(pokemon_agent))
+    if WARMUP_MODEL_CONNECTION:
+        _step("model_connection", lambda: _open_model_connection(pokemon_agent))
+
+    with _lock:
+        _status["ready"] = True
+        _status["finished_at"] = time.time()
+    logger.info("Warm-up finished after %.2fs", _status['finished_at'] - _status['started_at'])
+
+    if prefetch_top_n > 0:
+        _step("prefetch", lambda: _prefetch(prefetch_top_n))
+    with _lock:
+        _status["prefetch"]["done"] = True
+
+def start(pokemon_agent):
+    """
+    Runs the warm-up in a background thread, unless WARMUP_ENABLED is off.
+    """
+    if not WARMUP_ENABLED:
+        return None
+    thread = threading.Thread(target=run, args=(pokemon_agent,), name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -11,7 +11,7 @@ function App() {
   const [error, setError] = useState(null)
   const [retryCount, setRetryCount] = useState(0)
   const [activeTab, setActiveTab] = useState('chat') // 'chat' or 'favorites'
-  const [favoritesKey, setFavoritesKey] = useState(0) // Used to force refresh FavoritesTab
+  const [favoritesVersion, setFavoritesVersion] = useState(null) // Changes whenever the favorites change
   const [favoritesCount, setFavoritesCount] = useState(0) // Store favorites count
   const [userId, setUserId] = useState(null) // Store user ID
 
@@ -30,22 +30,27 @@ function App() {
     }
   }, []);
 
-  // Function to refresh the favorites tab and count
+  // Function to refresh the favorites count; unchanged favorites cost a 304 response
   const refreshFavorites = useCallback(() => {
-    setFavoritesKey(prevKey => prevKey + 1);
     fetchFavoritesCount();
   }, [fetchFavoritesCount]);
 
   // Fetch favorites count on initial load
   useEffect(() => {
     fetchFavoritesCount();
-
-    // Set up interval to refresh count every 30 seconds
-    const intervalId = setInterval(fetchFavoritesCount, 30000);
-
-    return () => clearInterval(intervalId);
   }, [fetchFavoritesCount]);
 
+  // Follow changes to the favorites through the server's change feed instead of polling.
+  // The user cookie is set when the first chat is created, so subscribe once there is one.
+  const hasChat = Boolean(chatId)
+  useEffect(() => {
+    if (!hasChat) return;
+    return api.subscribeFavorites(({ version, favorites_count }) => {
+      setFavoritesCount(favorites_count);
+      setFavoritesVersion(version);
+    });
+  }, [hasChat]);
+
   // Check for chat ID in URL or create a new chat session when the app loads
   useEffect(() => {
     const params = new URLSearchParams(window.location.search)
@@ -110,11 +115,8 @@ function App() {
   }
 
   const handleTabChange = (tab) => {
+    // The favorites tab loads its data when it opens
     setActiveTab(tab)
-    // Refresh favorites when switching to the favorites tab
-    if (tab === 'favorites') {
-      refreshFavorites()
-    }
   }
 
   return (
@@ -145,7 +147,7 @@ function App() {
             chatId && <ChatInterface chatId={chatId} refreshFavorites={refreshFavorites} userId={userId} />
           )
         ) : (
-          <FavoritesTab key={favoritesKey} />
+          <FavoritesTab version={favoritesVersion} />
         )}
       </main>
     </div>
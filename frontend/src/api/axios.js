@@ -53,6 +53,66 @@ const sendMessage = (query, chatId) => {
     return axiosInstance.post('/query', payload);
 };
 
+// Function to send a message and receive the agent's progress as Server-Sent Events.
+// onEvent is called with (eventName, data) for every event; resolves when the stream ends.
+const streamMessage = async (query, chatId, onEvent) => {
+    const response = await fetch(`${API_URL}/query/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        credentials: 'include',
+        body: JSON.stringify({ query, chat_id: chatId }),
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error(`Streaming request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, separatorIndex);
+            buffer = buffer.slice(separatorIndex + 2);
+
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            }
+            if (data) {
+                onEvent(eventName, JSON.parse(data));
+            }
+        }
+    }
+};
+
+// Function to get a page of the tool calls of a chat (outputs are referenced by hash)
+const getToolCalls = async (chatId, offset = 0, limit = 50) => {
+    const response = await axiosInstance.get(`/chats/${chatId}/tool_calls`, { params: { offset, limit } });
+    return response;
+};
+
+// Function to get the full output of a tool call
+const getToolResult = async (chatId, outputHash) => {
+    const response = await axiosInstance.get(`/chats/${chatId}/tool_results/${outputHash}`);
+    return response;
+};
+
 // Function to get chat history
 const getChatHistory = async (chatId) => {
     const response = await axiosInstance.get(`/chat_history/${chatId}`);
@@ -70,6 +130,37 @@ const getFavorites = async () => {
     return response;
 };
 
+// Milliseconds before reconnecting a favorites stream the browser gave up on
+const FAVORITES_RECONNECT_DELAY = 30000;
+
+// Function to subscribe to changes of the user's favorites (Server-Sent Events).
+// onChange is called with {version, favorites_count} when the stream opens and after every change.
+// The browser reconnects by itself when a stream ends, but gives up when the server answers
+// with an error (e.g. 503 when too many feeds are open), so reconnect after a delay then.
+// Call the returned function to stop.
+const subscribeFavorites = (onChange) => {
+    let source = null;
+    let timer = null;
+    let stopped = false;
+
+    const connect = () => {
+        source = new EventSource(`${API_URL}/favorites/events`, { withCredentials: true });
+        source.addEventListener('favorites', (event) => onChange(JSON.parse(event.data)));
+        source.onerror = () => {
+            if (!stopped && source.readyState === EventSource.CLOSED) {
+                timer = setTimeout(connect, FAVORITES_RECONNECT_DELAY);
+            }
+        };
+    };
+    connect();
+
+    return () => {
+        stopped = true;
+        clearTimeout(timer);
+        source.close();
+    };
+};
+
 // Function to remove a pokemon from favorites
 const removeFavorite = async (pokemonId) => {
     const response = await axiosInstance.post('/remove_favorite', { pokemon_id: pokemonId }, { withCredentials: true });
@@ -88,6 +179,18 @@ const removeFavoriteByName = async (pokemonName) => {
     return response;
 };
 
+// Function to add many pokemon (names and/or IDs) to favorites in one request
+const addFavoritesBulk = async (pokemon) => {
+    const response = await axiosInstance.post('/favorites/bulk_add', { pokemon }, { withCredentials: true });
+    return response;
+};
+
+// Function to remove many pokemon (names and/or IDs) from favorites in one request
+const removeFavoritesBulk = async (pokemon) => {
+    const response = await axiosInstance.post('/favorites/bulk_remove', { pokemon }, { withCredentials: true });
+    return response;
+};
+
 // Function to get favorites for a specific user
 const getUserFavorites = async (userId) => {
     const response = await axiosInstance.get(`/user_favorites/${userId}`, { withCredentials: true });
@@ -96,12 +199,18 @@ const getUserFavorites = async (userId) => {
 
 const api = {
     sendMessage,
+    streamMessage,
     getChatHistory,
+    getToolCalls,
+    getToolResult,
     createChat,
     getFavorites,
+    subscribeFavorites,
     removeFavorite,
     addToFavorites,
     removeFavoriteByName,
+    addFavoritesBulk,
+    removeFavoritesBulk,
     getUserFavorites,
 };
 
@@ -107,17 +107,27 @@ function ChatInterface({ chatId, refreshFavorites, userId }) {
         setIsLoading(true);
         setInputMessage('');
 
-        try {
-            // Use the new api.sendMessage function
-            const response = await api.sendMessage(userInput, chatId);
-
-            // The response from the API now includes 'response' and 'tool_calls'
-            const assistantMessage = {
-                role: 'assistant',
-                content: response.data.response, // The text response
-                tool_calls: response.data.tool_calls || [] // The tool calls
-            };
+        // Show the assistant message right away and fill it in as events arrive
+        let assistantMessage = { role: 'assistant', content: '', tool_calls: [] };
+        const updateAssistantMessage = (changes) => {
+            assistantMessage = { ...assistantMessage, ...changes };
             setMessages([...newMessages, assistantMessage]);
+        };
+
+        try {
+            await api.streamMessage(userInput, chatId, (eventName, data) => {
+                if (eventName === 'partial_answer') {
+                    updateAssistantMessage({ content: assistantMessage.content + data.text });
+                } else if (eventName === 'tool_call_finished') {
+                    updateAssistantMessage({ tool_calls: [...assistantMessage.tool_calls, data] });
+                } else if (eventName === 'final_answer') {
+                    // The final answer replaces any partial text
+                    updateAssistantMessage({
+                        content: data.response,
+                        tool_calls: data.tool_calls || []
+                    });
+                }
+            });
 
             // Check if this message is about favorites and refresh if needed
             if (checkForFavoriteAction(assistantMessage.content)) {
@@ -146,6 +156,7 @@ function ChatInterface({ chatId, refreshFavorites, userId }) {
                 messages={messages}
                 isLoading={isLoading}
                 onExampleClick={handleExampleClick}
+                chatId={chatId}
             />
             <div ref={messagesEndRef} />
 
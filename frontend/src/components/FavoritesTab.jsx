@@ -2,21 +2,20 @@ import React, { useState, useEffect } from 'react';
 import api from '../api/axios';
 import './FavoritesTab.css';
 
-function FavoritesTab() {
+function FavoritesTab({ version }) {
     const [favorites, setFavorites] = useState([]);
     const [favoritesCount, setFavoritesCount] = useState(0);
     const [userId, setUserId] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
 
-    // Fetch favorites when component mounts
+    // Fetch favorites when the component mounts and whenever the change feed reports a new version
     useEffect(() => {
         fetchFavorites();
-    }, []);
+    }, [version]);
 
-    // Fetch favorites from API
+    // Fetch favorites from API; only the first load shows the loading state
     const fetchFavorites = async () => {
-        setLoading(true);
         setError(null);
 
         try {
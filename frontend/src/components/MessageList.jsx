@@ -4,7 +4,7 @@ import remarkGfm from 'remark-gfm';
 import './MessageList.css';
 import ToolCall from './ToolCall';
 
-function MessageList({ messages, isLoading, onExampleClick }) {
+function MessageList({ messages, isLoading, onExampleClick, chatId }) {
     // Example questions
     const examples = [
         "What are the abilities of Pikachu?",
@@ -61,7 +61,7 @@ function MessageList({ messages, isLoading, onExampleClick }) {
                         {message.role === 'assistant' && message.tool_calls && message.tool_calls.length > 0 && (
                             <div className="tool-calls-container">
                                 {message.tool_calls.map((toolCall, i) => (
-                                    <ToolCall key={i} toolCall={toolCall} />
+                                    <ToolCall key={i} toolCall={toolCall} chatId={chatId} />
                                 ))}
                             </div>
                         )}
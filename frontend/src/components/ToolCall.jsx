@@ -1,11 +1,31 @@
-import React from 'react';
+import React, { useState } from 'react';
+import api from '../api/axios';
 import './ToolCall.css';
 
-const ToolCall = ({ toolCall }) => {
+const ToolCall = ({ toolCall, chatId }) => {
+    const [fullOutput, setFullOutput] = useState(null);
+    const [loadingOutput, setLoadingOutput] = useState(false);
+
     if (!toolCall) {
         return null;
     }
 
+    // Only a preview of the output is sent with the tool call; the rest is fetched on demand
+    const showFullOutput = async () => {
+        setLoadingOutput(true);
+        try {
+            const response = await api.getToolResult(chatId, toolCall.output_hash);
+            setFullOutput(response.data.output);
+        } catch (error) {
+            console.error("Failed to load tool output:", error);
+        } finally {
+            setLoadingOutput(false);
+        }
+    };
+
+    const output = fullOutput ?? toolCall.output ?? toolCall.output_preview;
+    const canExpand = fullOutput === null && toolCall.output_truncated && chatId;
+
     return (
         <div className="tool-call-card">
             <div className="tool-call-header">
@@ -15,10 +35,15 @@ const ToolCall = ({ toolCall }) => {
                 <p><strong>Parameters:</strong></p>
                 <pre>{JSON.stringify(toolCall.parameters, null, 2)}</pre>
                 <p><strong>Output:</strong></p>
-                <pre>{toolCall.output}</pre>
+                <pre>{output}{canExpand ? '…' : ''}</pre>
+                {canExpand && (
+                    <button className="tool-call-expand" onClick={showFullOutput} disabled={loadingOutput}>
+                        {loadingOutput ? 'Loading…' : `Show full output (${toolCall.output_size} characters)`}
+                    </button>
+                )}
             </div>
         </div>
     );
 };
 
-export default ToolCall; 
\ No newline at end of file
+export default ToolCall;